@@ -1,10 +1,19 @@
 # main.py
 from datetime import timedelta,datetime
+import hashlib
+import os
 import re
-import ollama
-from places import get_top_5_attractions
-from weather import get_weather
-from coordinates import get_coordinates
+import llm
+from cache import MISSING, TTLCache
+from city_names import format_city_name
+from metrics import register_cache
+from intent import (
+    INTENT_FAST_PATH, INTENT_FAST_PATH_MIN_CONFIDENCE, PLACES_WORDS, WEATHER_WORDS,
+    cached_intent, fast_parse, intent_signature, learn_city, record_parse, remember_intent,
+)
+from prompts import PROMPT_STYLE, build_reply_messages, estimate_tokens, record_prompt, system_prompts
+from resilience import CircuitOpen
+from weather import seconds_until_model_update
 
 def weekday_to_date(day_name: str):
     days = {
@@ -32,18 +41,13 @@ import json
 
   # <-- change to any model you have in `ollama list`
 
+# final replies, keyed on the exact data given to build_llm_response
+REPLY_CACHE_ENABLED = os.getenv("REPLY_CACHE_ENABLED", "1") != "0"
+_reply_cache = TTLCache(maxsize=int(os.getenv("REPLY_CACHE_SIZE", 5000)))
+register_cache("reply", _reply_cache)
 
-def parse_input(user_input: str, last_city: str | None = None):
-    """
-    Use the LLM to understand:
-    - which city the user is talking about
-    - whether they want weather info
-    - whether they want places to visit
-
-    Returns: (city, want_weather, want_places)
-    """
 
-    system_prompt = """
+PARSE_SYSTEM_PROMPT = """
 You are an AI assistant that extracts structured information from user messages
 about travel and weather.
 
@@ -66,35 +70,100 @@ Rules:
 - If the user only says something like "I'm going there", assume they want places (trip planning) by default.
 """
 
+
+def parse_input(user_input: str, last_city: str | None = None):
+    """
+    Use the LLM to understand:
+    - which city the user is talking about
+    - whether they want weather info
+    - whether they want places to visit
+
+    Repeated messages come from the intent memo and simple ones from the
+    rule-based fast path (intent.py), both without calling the LLM.
+
+    Returns: (city, want_weather, want_places)
+    """
+    parsed = cached_intent(user_input, last_city) or _fast_parse(user_input, last_city)
+    if parsed is None:
+        try:
+            content = llm.chat(MODEL_NAME, _parse_messages(user_input, last_city), name="parse_input")
+        except CircuitOpen:
+            # Ollama is down: go with the fast path's best guess (not remembered)
+            return fast_parse(user_input, last_city)[:3]
+        parsed = _parse_content(content, user_input, last_city)
+        if parsed is None:
+            # a one-off bad LLM answer: guess from keywords, but don't remember the guess
+            return _fallback_parse(user_input, last_city)
+
+    remember_intent(user_input, last_city, parsed)
+    return parsed
+
+
+async def parse_input_async(user_input: str, last_city: str | None = None):
+    """Async version of parse_input."""
+    parsed = cached_intent(user_input, last_city) or _fast_parse(user_input, last_city)
+    if parsed is None:
+        try:
+            content = await llm.achat(MODEL_NAME, _parse_messages(user_input, last_city), name="parse_input")
+        except CircuitOpen:
+            return fast_parse(user_input, last_city)[:3]
+        parsed = _parse_content(content, user_input, last_city)
+        if parsed is None:
+            # a one-off bad LLM answer: guess from keywords, but don't remember the guess
+            return _fallback_parse(user_input, last_city)
+
+    remember_intent(user_input, last_city, parsed)
+    return parsed
+
+
+def _fast_parse(user_input: str, last_city: str | None):
+    """(city, want_weather, want_places) from the fast path, or None to ask the LLM."""
+    if INTENT_FAST_PATH:
+        city, want_weather, want_places, confidence = fast_parse(user_input, last_city)
+        if confidence >= INTENT_FAST_PATH_MIN_CONFIDENCE:
+            record_parse(fast_path=True)
+            return city, want_weather, want_places
+
+    record_parse(fast_path=False)
+    return None
+
+
+def _parse_messages(user_input: str, last_city: str | None):
     # Build user prompt including previous city context
     user_prompt = {
         "user_input": user_input,
         "previous_city": last_city,
     }
 
-    response = ollama.chat(
-        model=MODEL_NAME,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": json.dumps(user_prompt)},
-        ],
-    )
+    return [
+        {"role": "system", "content": PARSE_SYSTEM_PROMPT},
+        {"role": "user", "content": json.dumps(user_prompt)},
+    ]
 
-    content = response["message"]["content"]
 
-    # Try to parse JSON; if something goes wrong, fall back to simple defaults
+def _parse_content(content: str, user_input: str, last_city: str | None):
+    """(city, want_weather, want_places) from the LLM's JSON, or None if it returned something weird."""
     try:
         data = json.loads(content)
         city = data.get("city")
         want_weather = bool(data.get("want_weather", False))
         want_places = bool(data.get("want_places", False))
     except Exception:
-        # Fallback heuristics if LLM returned something weird
-        city = last_city
-        text = user_input.lower()
-        want_weather = any(w in text for w in ["weather", "temperature", "climate", "hot", "cold"])
-        want_places = any(w in text for w in ["visit", "places", "tourist", "spots", "trip"])
+        return None
+
+    # let the fast path recognise this city next time
+    if isinstance(city, str):
+        learn_city(city, user_input)
+
+    return city, want_weather, want_places
 
+
+def _fallback_parse(user_input: str, last_city: str | None):
+    """Simple defaults when the LLM's answer could not be parsed."""
+    city = last_city
+    text = user_input.lower()
+    want_weather = any(w in text for w in WEATHER_WORDS)
+    want_places = any(w in text for w in PLACES_WORDS)
     return city, want_weather, want_places
 
 
@@ -105,17 +174,123 @@ def build_llm_response(
     want_places: bool,
     weather_text: str | None,
     places: list[str] | None,
+    weather_facts: dict | None = None,
 ):
     """
     Ask Ollama to generate the final response in natural language,
     following the style of your examples and using the real data.
+
+    weather_facts (weather.weather_facts of the same forecast) lets the
+    compact prompt send the weather as structured data.
     """
+    key = _reply_key(user_input, city, want_weather, want_places, weather_text, places)
+    reply = _cached_reply(key)
+    if reply is None:
+        messages = _response_messages(user_input, city, want_weather, want_places, weather_text, places, weather_facts)
+        reply = llm.chat(MODEL_NAME, messages, name="build_llm_response")
+        _store_reply(key, reply)
+    return reply
 
-    places_bullets = ""
-    if places:
-        places_bullets = "\n".join(f"- {p}" for p in places)
 
-    prompt = f"""
+async def build_llm_response_async(
+    user_input: str,
+    city: str,
+    want_weather: bool,
+    want_places: bool,
+    weather_text: str | None,
+    places: list[str] | None,
+    weather_facts: dict | None = None,
+):
+    """Async version of build_llm_response."""
+    key = _reply_key(user_input, city, want_weather, want_places, weather_text, places)
+    reply = _cached_reply(key)
+    if reply is None:
+        messages = _response_messages(user_input, city, want_weather, want_places, weather_text, places, weather_facts)
+        reply = await llm.achat(MODEL_NAME, messages, name="build_llm_response")
+        _store_reply(key, reply)
+    return reply
+
+
+def build_llm_response_stream(
+    user_input: str,
+    city: str,
+    want_weather: bool,
+    want_places: bool,
+    weather_text: str | None,
+    places: list[str] | None,
+    weather_facts: dict | None = None,
+):
+    """Same as build_llm_response, but yields the answer piece by piece as Ollama generates it."""
+    key = _reply_key(user_input, city, want_weather, want_places, weather_text, places)
+    reply = _cached_reply(key)
+    if reply is not None:
+        yield reply
+        return
+
+    messages = _response_messages(user_input, city, want_weather, want_places, weather_text, places, weather_facts)
+    pieces = []
+    for piece in llm.chat_stream(MODEL_NAME, messages, name="build_llm_response"):
+        pieces.append(piece)
+        yield piece
+    _store_reply(key, "".join(pieces))
+
+
+async def build_llm_response_stream_async(
+    user_input: str,
+    city: str,
+    want_weather: bool,
+    want_places: bool,
+    weather_text: str | None,
+    places: list[str] | None,
+    weather_facts: dict | None = None,
+):
+    """Async version of build_llm_response_stream."""
+    key = _reply_key(user_input, city, want_weather, want_places, weather_text, places)
+    reply = _cached_reply(key)
+    if reply is not None:
+        yield reply
+        return
+
+    messages = _response_messages(user_input, city, want_weather, want_places, weather_text, places, weather_facts)
+    pieces = []
+    async for piece in llm.achat_stream(MODEL_NAME, messages, name="build_llm_response"):
+        pieces.append(piece)
+        yield piece
+    _store_reply(key, "".join(pieces))
+
+
+def _reply_key(user_input, city, want_weather, want_places, weather_text, places):
+    """
+    Hash of everything that shapes a reply: the data plus the message's intent
+    signature. None (not cached) when places were asked for but the search
+    came back empty, so an upstream failure isn't replayed after it recovers.
+    """
+    if want_places and not places:
+        return None
+    data = [format_city_name(city), want_weather, want_places, weather_text, places, intent_signature(user_input)]
+    return hashlib.sha256(json.dumps(data).encode()).hexdigest()
+
+
+def _cached_reply(key):
+    if not REPLY_CACHE_ENABLED or key is None:
+        return None
+    reply = _reply_cache.get(key)
+    return None if reply is MISSING else reply
+
+
+def _store_reply(key, reply):
+    # expire together with the forecast the reply was built from
+    if REPLY_CACHE_ENABLED and key is not None and reply:
+        _reply_cache.set(key, reply, ttl=seconds_until_model_update())
+
+
+def reply_cache_stats() -> dict:
+    return {"enabled": REPLY_CACHE_ENABLED, **_reply_cache.stats()}
+
+
+# Static part of the build_llm_response prompt. It always comes first (as the
+# system message) so Ollama can reuse its evaluated prefix between requests.
+RESPONSE_SYSTEM_PROMPT = """
 You are a travel assistant. Based on the user input and the data provided, 
 generate a friendly answer in the same style as these examples.
 
@@ -144,23 +319,8 @@ In Bangalore it’s currently 24°C with a chance of 35% to rain. And these are
 - Bannerghatta National Park
 - Jawaharlal Nehru Planetarium
 
-
-Now use the REAL data below. Do NOT change any numbers or place names.
-
-User input: {user_input}
-
-City: {city}
-
-User wants weather: {want_weather}
-User wants places: {want_places}
-
-Weather info (already fetched from API, use this text and do not change its numbers):
-{weather_text if weather_text else "NO_WEATHER_DATA"}
-
-Places (already fetched, use exactly these names as bullets if needed):
-{places_bullets if places_bullets else "NO_PLACES_DATA"}
-
 Rules:
+- Use the REAL data from the user message. Do NOT change any numbers or place names.
 - Do NOT add notes, explanations, or commentary.
 - Do NOT mention missing data like "no places available".
 - Do NOT justify why something is not shown.
@@ -178,17 +338,58 @@ Rules:
 - Keep the style similar to the examples: short, friendly, clear.
 """
 
-    response = ollama.chat(
-        model=MODEL_NAME,
-        messages=[
-            {"role": "user", "content": prompt}
-        ],
-    )
 
-    return response["message"]["content"]
+def _response_messages(user_input, city, want_weather, want_places, weather_text, places, weather_facts=None):
+    """Chat messages for build_llm_response in the PROMPT_STYLE ("compact" or "full")."""
+    if PROMPT_STYLE == "compact":
+        messages, _ = build_reply_messages(
+            user_input, city, want_weather, want_places, weather_text, places, weather_facts,
+        )
+        return messages
+
+    messages = _full_response_messages(user_input, city, want_weather, want_places, weather_text, places)
+    record_prompt("full", sum(estimate_tokens(m["content"]) for m in messages))
+    return messages
+
+
+def _full_response_messages(user_input, city, want_weather, want_places, weather_text, places):
+    places_bullets = ""
+    if places:
+        places_bullets = "\n".join(f"- {p}" for p in places)
+
+    data = f"""
+User input: {user_input}
+
+City: {city}
+
+User wants weather: {want_weather}
+User wants places: {want_places}
+
+Weather info (already fetched from API, use this text and do not change its numbers):
+{weather_text if weather_text else "NO_WEATHER_DATA"}
+
+Places (already fetched, use exactly these names as bullets if needed):
+{places_bullets if places_bullets else "NO_PLACES_DATA"}
+"""
+
+    return [
+        {"role": "system", "content": RESPONSE_SYSTEM_PROMPT},
+        {"role": "user", "content": data},
+    ]
+
+
+def warm_up_llm():
+    """Preload MODEL_NAME and the static prompt prefixes (call at server start)."""
+    response_prompts = system_prompts() if PROMPT_STYLE == "compact" else [RESPONSE_SYSTEM_PROMPT]
+    llm.warm_up(MODEL_NAME, prefixes=[
+        [{"role": "system", "content": PARSE_SYSTEM_PROMPT}],
+        *([{"role": "system", "content": prompt}] for prompt in response_prompts),
+    ])
 
 
 def chat_loop():
+    from pipeline import run_chat_data, stream_reply  # pipeline imports this module
+
     print("Welcome to your Travel Assistant! (type 'exit' to quit)")
     last_city = None
 
@@ -201,13 +402,14 @@ def chat_loop():
             print("Assistant: Bye! Have a great trip 😄")
             break
 
-        # Parse this turn
-        city, want_weather, want_places = parse_input(user_input)
-
-        # If no city mentioned this time, fall back to last city (context)
-        if city is None and last_city is not None:
-            city = last_city
+        # Parse and fetch this turn's data (see pipeline.py)
+        try:
+            ctx = run_chat_data(user_input, last_city)
+        except Exception as e:
+            print(f"Assistant: Oops, there was an error talking to the LLM: {e}")
+            continue
 
+        city = ctx["intent"]["city"]
         if city is None:
             print("Assistant: I couldn't detect any city. Please mention a city name like 'Bangalore'.")
             continue
@@ -215,61 +417,19 @@ def chat_loop():
         # Remember last city for follow-up questions
         last_city = city
 
-        weather_text = None
-        places = None
-
-        # If user explicitly asked for weather, or neither intent is clear (then give both)
-        if want_weather or (not want_weather and not want_places):
-            coords = get_coordinates(city)
-            if coords is None:
-                print(f"Assistant: I couldn't find coordinates for {city}.")
-                continue
-            lat, lon = coords
-            text = user_input.lower()
-
-            mode = None
-
-            # detect "tomorrow"
-            if "tomorrow" in text:
-                mode = "tomorrow"
-
-            # detect "next 7" / "next seven" / "next week"
-            elif "next 7" in text or "next seven" in text or "next week" in text:
-                mode = "next7"
-            else:
-                for day in ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]:
-                    if day in text:
-                        mode = weekday_to_date(day)
-                        break
+        weather_text = ctx.get("weather")
+        if weather_text and ctx["intent"]["mode"] != 'next7':
+            print(weather_text)
 
-            # detect explicit date in format YYYY-MM-DD
-
-            # Now call your upgraded weather function
-            weather_text = get_weather(lat, lon, mode)
-            if mode!='next7':
-                print(weather_text)
-
-
-        # If user explicitly asked for places, or no clear intent (then give both)
-
-        if want_places or (not want_weather and not want_places):
-            places = get_top_5_attractions(city, SERPAPI_KEY)
-
-        # Generate final answer from Ollama
+        # Print the answer as it is generated
+        print("Assistant: ", end="", flush=True)
         try:
-            final_answer = build_llm_response(
-                user_input=user_input,
-                city=city,
-                want_weather=want_weather,
-                want_places=want_places,
-                weather_text=weather_text,
-                places=places,
-            )
+            for piece in stream_reply(ctx):
+                print(piece, end="", flush=True)
         except Exception as e:
-            print(f"Assistant: Oops, there was an error talking to the LLM: {e}")
+            print(f"\nAssistant: Oops, there was an error talking to the LLM: {e}")
             continue
-
-        print(f"Assistant: {final_answer}")
+        print()
 
 
 if __name__ == "__main__":
@@ -1,16 +1,11 @@
 # app_logic.py
-from app import parse_input
+from pipeline import run_chat
+
+
 def run_travel_assistant(user_input: str) -> str:
     """
-    This should contain your existing logic:
-    - parse_input / LLM / weather / places etc.
-    - and finally return ONE text answer (no prints).
+    Run one turn of the travel assistant and return ONE text answer (no prints).
+    parse_input / weather / places / build_llm_response all run in pipeline.py.
     """
-    city, want_weather, want_places = parse_input(user_input, last_city=None)
-    # You’ll adapt this based on your current code:
-    # - get city
-    # - call get_coordinates, get_weather, get_top_5_attractions
-    # - call build_llm_response(...)
-    # and finally:
-    final_answer ="weather"  # string
-    return final_answer
+    ctx = run_chat(user_input, last_city=None)
+    return ctx["reply"]
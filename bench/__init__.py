@@ -0,0 +1 @@
+# bench: offline load testing for the TravelAI servers (see bench/run.py)
@@ -0,0 +1,160 @@
+# bench/loadgen.py
+"""
+Load generator for /chat (server.py) and /api/weather, /api/places (index.py).
+
+Keeps `--concurrency` requests in flight per endpoint for `--duration`
+seconds and reports throughput and p50/p95/p99 latency per endpoint.
+Results are saved as JSON so a run can be compared with a baseline:
+
+  python -m bench.loadgen --chat-url http://127.0.0.1:8000 --api-url http://127.0.0.1:8001 \\
+      --concurrency 50 --duration 30 --save bench/results/after.json \\
+      --baseline bench/results/before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+import httpx
+
+CITIES = ["Bangalore", "Goa", "Mumbai", "Paris", "Jaipur", "Tokyo", "London", "Delhi", "Pune", "Dubai"]
+CHAT_MESSAGES = [
+    "{city} weather",
+    "what is the temperature in {city} tomorrow?",
+    "places to visit in {city}",
+    "I'm going to go to {city}, let's plan my trip",
+    "weather and places to visit in {city} next week",
+]
+ENDPOINTS = ("chat", "weather", "places")
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+def make_request(endpoint, args):
+    city = random.choice(args.cities)
+    if endpoint == "chat":
+        message = random.choice(CHAT_MESSAGES).format(city=city)
+        return "POST", f"{args.chat_url}/chat", {"json": {"message": message, "reply_mode": args.reply_mode}}
+    return "GET", f"{args.api_url}/api/{endpoint}", {"params": {"city": city}}
+
+
+async def run_endpoint(client, endpoint, args):
+    latencies, errors = [], 0
+    deadline = time.monotonic() + args.duration
+
+    async def worker():
+        nonlocal errors
+        while time.monotonic() < deadline:
+            method, url, kwargs = make_request(endpoint, args)
+            started = time.monotonic()
+            try:
+                response = await client.request(method, url, **kwargs)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append(time.monotonic() - started)
+            else:
+                errors += 1
+
+    started = time.monotonic()
+    await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+    return summarize(latencies, errors, time.monotonic() - started)
+
+
+async def run(args):
+    limits = httpx.Limits(max_connections=args.concurrency * len(args.endpoints))
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        results = await asyncio.gather(*[run_endpoint(client, e, args) for e in args.endpoints])
+    return dict(zip(args.endpoints, results))
+
+
+def compare(results, baseline):
+    """Print the change of each metric against a baseline run."""
+    print("\nvs baseline:")
+    for endpoint, metrics in results.items():
+        base = baseline.get("results", {}).get(endpoint)
+        if not base:
+            continue
+        parts = []
+        for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+            before, after = base[key], metrics[key]
+            change = (after - before) / before * 100 if before else 0.0
+            parts.append(f"{key} {before} -> {after} ({change:+.0f}%)")
+        print(f"  {endpoint}: " + ", ".join(parts))
+
+
+def print_results(results):
+    print(f"{'endpoint':10} {'requests':>8} {'errors':>6} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for endpoint, m in results.items():
+        print(f"{endpoint:10} {m['requests']:>8} {m['errors']:>6} {m['throughput_rps']:>8} "
+              f"{m['p50_ms']:>8} {m['p95_ms']:>8} {m['p99_ms']:>8}")
+
+
+def add_arguments(parser):
+    parser.add_argument("--chat-url", default="http://127.0.0.1:8000", help="base URL of server.py")
+    parser.add_argument("--api-url", default="http://127.0.0.1:8001", help="base URL of index.py")
+    parser.add_argument("--endpoints", default="chat,weather,places", help="comma list of chat,weather,places")
+    parser.add_argument("--concurrency", type=int, default=20, help="in-flight requests per endpoint")
+    parser.add_argument("--duration", type=float, default=20, help="seconds")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--cities", default=",".join(CITIES))
+    parser.add_argument("--reply-mode", default=None, choices=[None, "llm", "template"])
+    parser.add_argument("--save", help="write results JSON here")
+    parser.add_argument("--baseline", help="compare with a saved results JSON")
+
+
+def run_and_report(args):
+    args.endpoints = [e for e in args.endpoints.split(",") if e]
+    args.cities = args.cities.split(",")
+    for endpoint in args.endpoints:
+        if endpoint not in ENDPOINTS:
+            raise SystemExit(f"Unknown endpoint {endpoint!r}, use {ENDPOINTS}")
+
+    results = asyncio.run(run(args))
+    print_results(results)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+    if args.save:
+        os.makedirs(os.path.dirname(args.save) or ".", exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump({
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "config": {"concurrency": args.concurrency, "duration": args.duration, "endpoints": args.endpoints},
+                "results": results,
+            }, f, indent=2)
+        print(f"\nsaved to {args.save}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the TravelAI endpoints")
+    add_arguments(parser)
+    run_and_report(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
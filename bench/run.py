@@ -0,0 +1,87 @@
+# bench/run.py
+"""
+One-command offline benchmark.
+
+Starts the upstream stubs, then server.py (uvicorn) and index.py pointed at
+them with a fresh cache directory, runs the load generator and stops
+everything:
+
+  python -m bench.run --concurrency 50 --duration 30 --save bench/results/run.json
+
+Stub latencies/error rates use the same syntax as bench.stubs.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from bench import loadgen
+from bench.stubs import parse_per_service, start_stubs, stub_env
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def wait_until_up(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise SystemExit(f"{url} did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the offline TravelAI benchmark")
+    loadgen.add_arguments(parser)
+    parser.add_argument("--latency", help="stub latency in ms, e.g. serpapi=1200,ollama=800")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--error-rate", help="stub error rate, e.g. serpapi=0.05")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for server.py")
+    parser.add_argument("--index-workers", type=int, default=64, help="concurrent requests handled by index.py")
+    parser.add_argument("--real-rate-limits", action="store_true",
+                        help="keep the Nominatim/SerpAPI rate limits (off by default against stubs)")
+    args = parser.parse_args()
+
+    servers = start_stubs(parse_per_service(args.latency, {}), args.jitter, parse_per_service(args.error_rate, {}))
+    env = {
+        **os.environ,
+        **stub_env(servers),
+        "TRAVELAI_CACHE_DIR": tempfile.mkdtemp(prefix="travelai-bench-"),
+        "SERPAPI_KEY": os.getenv("SERPAPI_KEY", "bench"),
+    }
+    if not args.real_rate_limits:
+        env.update({"NOMINATIM_RATE": "100000", "NOMINATIM_BURST": "100000",
+                    "SERPAPI_RATE": "100000", "SERPAPI_BURST": "100000"})
+
+    chat_port = int(args.chat_url.rsplit(":", 1)[1])
+    api_port = int(args.api_url.rsplit(":", 1)[1])
+    processes = [
+        subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "server:app", "--port", str(chat_port),
+             "--workers", str(args.workers), "--log-level", "warning"],
+            cwd=ROOT, env=env,
+        ),
+        subprocess.Popen(
+            [sys.executable, "index.py", "--host", "127.0.0.1", "--port", str(api_port),
+             "--workers", str(args.index_workers)],
+            cwd=ROOT, env={**env, "INDEX_ACCESS_LOG": "0"}, stdout=subprocess.DEVNULL,
+        ),
+    ]
+    try:
+        wait_until_up(args.chat_url + "/stats")
+        wait_until_up(args.api_url + "/")
+        loadgen.run_and_report(args)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+# bench/stubs.py
+"""
+Local stand-ins for every upstream API, for offline benchmarks.
+
+Starts one HTTP server per API, each with its own latency, jitter and error
+rate:
+
+  nominatim   GET  /search              -> [{"lat", "lon"}]
+  open_meteo  GET  /v1/forecast         -> current weather + 7 daily values
+  serpapi     GET  /search.json         -> {"local_results": [{"title"}...]}
+  ollama      POST /api/chat, /api/generate (streaming and non-streaming)
+
+Usage:
+  python -m bench.stubs --latency nominatim=300,serpapi=1200 --error-rate serpapi=0.05
+
+and point the app at them with the environment variables it prints
+(NOMINATIM_URL, OPEN_METEO_URL, SERPAPI_URL, OLLAMA_HOST).
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+SERVICES = ("nominatim", "open_meteo", "serpapi", "ollama")
+
+# typical latencies (ms) of the real services
+DEFAULT_LATENCY = {"nominatim": 250, "open_meteo": 120, "serpapi": 1500, "ollama": 1200}
+
+
+class StubConfig:
+    def __init__(self, latency_ms: float, jitter: float = 0.2, error_rate: float = 0.0):
+        self.latency_ms = latency_ms
+        self.jitter = jitter          # +/- fraction of the latency
+        self.error_rate = error_rate  # fraction of requests answered with 503
+
+    def delay(self):
+        spread = self.latency_ms * self.jitter
+        time.sleep(max(0.0, self.latency_ms + random.uniform(-spread, spread)) / 1000)
+
+    def fails(self) -> bool:
+        return random.random() < self.error_rate
+
+
+def _seed(text: str) -> int:
+    return int(hashlib.md5(text.lower().encode()).hexdigest()[:8], 16)
+
+
+# ---------- RESPONSES ----------
+
+def nominatim_response(qs):
+    q = qs.get("q", [""])[0]
+    if not q.strip():
+        return []
+    seed = _seed(q)
+    return [{"lat": f"{(seed % 12000) / 100 - 60:.4f}", "lon": f"{(seed // 12000 % 36000) / 100 - 180:.4f}"}]
+
+
+def _one_forecast(lat: float, lon: float):
+    rnd = random.Random(_seed(f"{lat:.1f},{lon:.1f}"))
+    days = [(date.today() + timedelta(days=i)).isoformat() for i in range(7)]
+    tmax = [round(rnd.uniform(18, 36), 1) for _ in days]
+    return {
+        "latitude": lat,
+        "longitude": lon,
+        "utc_offset_seconds": 0,
+        "current_weather": {"temperature": round(tmax[0] - 3, 1), "windspeed": round(rnd.uniform(2, 25), 1)},
+        "daily": {
+            "time": days,
+            "temperature_2m_max": tmax,
+            "temperature_2m_min": [round(t - rnd.uniform(5, 12), 1) for t in tmax],
+            "precipitation_probability_mean": [rnd.randint(0, 100) for _ in days],
+        },
+    }
+
+
+def open_meteo_response(qs):
+    lats = [float(x) for x in qs.get("latitude", ["0"])[0].split(",")]
+    lons = [float(x) for x in qs.get("longitude", ["0"])[0].split(",")]
+    forecasts = [_one_forecast(lat, lon) for lat, lon in zip(lats, lons)]
+    # like Open-Meteo: a list for several locations, an object for one
+    return forecasts if len(forecasts) > 1 else forecasts[0]
+
+
+def serpapi_response(qs):
+    q = qs.get("q", [""])[0]
+    start = int(qs.get("start", ["0"])[0])
+    city = q.split(" in ", 1)[-1]
+    count = 20 if start < 100 else 0
+    return {"local_results": [{"title": f"{city} Spot {start + i + 1}"} for i in range(count)]}
+
+
+def ollama_chat_content(body) -> str:
+    messages = body.get("messages", [])
+    last = messages[-1]["content"] if messages else ""
+    if messages and "extracts structured information" in messages[0].get("content", ""):
+        try:
+            user_input = json.loads(last).get("user_input", "")
+        except ValueError:
+            user_input = last
+        words = [w.strip(".,?!") for w in user_input.split() if w[:1].isupper()]
+        return json.dumps({"city": words[-1] if words else None, "want_weather": True, "want_places": True})
+    return "In the city it's currently 24°C with a chance of 35% to rain. And these are the places you can go:\n- A\n- B"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    service = None
+    config = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, data, content_type="application/json"):
+        body = data if isinstance(data, bytes) else json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _fail(self):
+        self._send(503, {"error": "stub failure"})
+
+    def do_GET(self):
+        self.config.delay()
+        if self.config.fails():
+            return self._fail()
+        parsed = urlparse(self.path)
+        qs = parse_qs(parsed.query)
+        if self.service == "nominatim":
+            return self._send(200, nominatim_response(qs))
+        if self.service == "open_meteo":
+            return self._send(200, open_meteo_response(qs))
+        if self.service == "serpapi":
+            return self._send(200, serpapi_response(qs))
+        self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if self.service != "ollama":
+            return self._send(404, {"error": "not found"})
+        if self.config.fails():
+            self.config.delay()
+            return self._fail()
+
+        # about 4 characters per token, so prompt size changes show up in the stats
+        prompt_chars = sum(len(m.get("content", "")) for m in body.get("messages", [])) or len(body.get("prompt", ""))
+        done = {
+            "model": body.get("model", "stub"), "created_at": "2026-01-01T00:00:00Z", "done": True,
+            "total_duration": int(self.config.latency_ms * 1e6), "load_duration": 0,
+            "prompt_eval_count": prompt_chars // 4 + 1, "prompt_eval_duration": int(self.config.latency_ms * 0.4e6),
+            "eval_count": 40, "eval_duration": int(self.config.latency_ms * 0.6e6),
+        }
+        if self.path.startswith("/api/generate"):
+            return self._send(200, {**done, "response": ""})
+
+        content = ollama_chat_content(body)
+        if not body.get("stream", True):
+            self.config.delay()
+            return self._send(200, {**done, "message": {"role": "assistant", "content": content}})
+
+        # streaming: newline-delimited JSON, spread over the latency
+        pieces = content.split(" ")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, piece in enumerate(pieces):
+            time.sleep(self.config.latency_ms / 1000 / len(pieces))
+            text = piece + (" " if i < len(pieces) - 1 else "")
+            self._chunk({"model": done["model"], "created_at": done["created_at"], "done": False,
+                         "message": {"role": "assistant", "content": text}})
+        self._chunk({**done, "message": {"role": "assistant", "content": ""}})
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _chunk(self, data):
+        line = json.dumps(data).encode() + b"\n"
+        self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+        self.wfile.flush()
+
+
+def start_stub(service: str, config: StubConfig, host="127.0.0.1", port=0) -> ThreadingHTTPServer:
+    """Start one stub server in a background thread; returns the server."""
+    handler = type(f"{service}Handler", (StubHandler,), {"service": service, "config": config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def stub_env(servers: dict) -> dict:
+    """Environment variables pointing the app at running stubs."""
+    base = {name: f"http://{s.server_address[0]}:{s.server_address[1]}" for name, s in servers.items()}
+    return {
+        "NOMINATIM_URL": base["nominatim"] + "/search",
+        "OPEN_METEO_URL": base["open_meteo"] + "/v1/forecast",
+        "SERPAPI_URL": base["serpapi"] + "/search.json",
+        "OLLAMA_HOST": base["ollama"],
+    }
+
+
+def parse_per_service(text: str | None, default: dict) -> dict:
+    """"serpapi=1200,ollama=800" -> {service: float}, on top of `default`."""
+    values = dict(default)
+    for item in (text or "").split(","):
+        if item.strip():
+            name, value = item.split("=")
+            if name.strip() not in SERVICES:
+                raise ValueError(f"Unknown service {name!r}, use one of {SERVICES}")
+            values[name.strip()] = float(value)
+    return values
+
+
+def start_stubs(latency=None, jitter=0.2, error_rate=None, host="127.0.0.1", base_port=0):
+    """Start all four stubs. latency/error_rate: per-service dicts."""
+    latency = {**DEFAULT_LATENCY, **(latency or {})}
+    error_rate = error_rate or {}
+    return {
+        name: start_stub(
+            name,
+            StubConfig(latency[name], jitter, error_rate.get(name, 0.0)),
+            host,
+            base_port + i if base_port else 0,
+        )
+        for i, name in enumerate(SERVICES)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run local stubs of Nominatim, Open-Meteo, SerpAPI and Ollama")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--base-port", type=int, default=9100, help="ports base..base+3")
+    parser.add_argument("--latency", help="per-service latency in ms, e.g. serpapi=1200,ollama=800")
+    parser.add_argument("--jitter", type=float, default=0.2, help="+/- fraction of the latency")
+    parser.add_argument("--error-rate", help="per-service error rate, e.g. serpapi=0.05")
+    args = parser.parse_args()
+
+    servers = start_stubs(
+        parse_per_service(args.latency, {}),
+        args.jitter,
+        parse_per_service(args.error_rate, {}),
+        args.host,
+        args.base_port,
+    )
+    for key, value in stub_env(servers).items():
+        print(f"export {key}={value}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
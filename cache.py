@@ -0,0 +1,146 @@
+# cache.py
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_DIR = os.getenv(
+    "TRAVELAI_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"),
+)
+
+# returned by get() when a key is not cached (None is a valid cached value)
+MISSING = object()
+
+
+def cache_path(filename: str) -> str:
+    """Return the path of a cache file inside CACHE_DIR."""
+    return os.path.join(CACHE_DIR, filename)
+
+
+class SQLiteCache:
+    """
+    Key/value cache stored in a SQLite file.
+
+    Values are stored as JSON together with an expiry timestamp. The file
+    uses WAL mode, so several worker processes can read and write the same
+    cache at once. Any SQLite error is treated as a cache miss so a broken
+    cache file never breaks a lookup.
+    """
+
+    def __init__(self, path: str, table: str = "cache"):
+        self.path = path
+        self.table = table
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+
+    def _conn(self):
+        # one connection per thread and per process (workers may fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key: str, default=MISSING, stale: bool = False):
+        """Cached value for `key`; stale=True also returns an expired one that is still stored."""
+        try:
+            row = self._conn().execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error:
+            self.misses += 1
+            return default
+
+        if row is None or (row[1] < time.time() and not stale):
+            self.misses += 1
+            return default
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value, ttl: float):
+        try:
+            self._conn().execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + ttl),
+            )
+        except sqlite3.Error:
+            pass
+
+    def delete(self, key: str):
+        try:
+            self._conn().execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+        except sqlite3.Error:
+            pass
+
+    def purge_expired(self):
+        """Remove expired rows (optional housekeeping)."""
+        try:
+            self._conn().execute(f"DELETE FROM {self.table} WHERE expires_at < ?", (time.time(),))
+        except sqlite3.Error:
+            pass
+
+
+class TTLCache:
+    """
+    In-memory LRU cache with optional per-entry expiry.
+
+    Thread-safe. When full, the least recently used entry is evicted.
+    Keeps hit/miss counters for reporting.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # key -> (expires_at or None, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=MISSING):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > time.time()):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl: float | None = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,12 @@
+# city_names.py
+
+
+def format_city_name(city: str) -> str:
+    """
+    Converts user input city into properly capitalized form.
+    Examples:
+    bangalore -> Bangalore
+    new delhi -> New Delhi
+    LOS ANGELES -> Los Angeles
+    """
+    return " ".join(word.capitalize() for word in city.strip().split())
@@ -1,22 +1,160 @@
+import logging
+import os
+
+import httpx
 import requests
 
-def get_coordinates(place_name):
-    url = "https://nominatim.openstreetmap.org/search"
-    params = {
+from cache import MISSING, SQLiteCache, cache_path
+from city_names import format_city_name
+from gazetteer import is_city_name, lookup_coordinates
+from http_clients import async_client, http_session
+from metrics import register_cache
+from ratelimit import RateLimited, nominatim_limiter
+from refresh import record_city
+from resilience import CircuitOpen, guarded_call, guarded_call_async
+from singleflight import SingleFlight
+
+log = logging.getLogger(__name__)
+
+# found cities rarely move; "not found" is kept short in case of a typo fix upstream
+GEOCODE_TTL = float(os.getenv("GEOCODE_TTL", 30 * 24 * 3600))
+GEOCODE_NEGATIVE_TTL = float(os.getenv("GEOCODE_NEGATIVE_TTL", 3600))
+
+NOMINATIM_URL = os.getenv("NOMINATIM_URL", "https://nominatim.openstreetmap.org/search")
+# longest a single Nominatim request may take (less when the request deadline is closer)
+NOMINATIM_TIMEOUT = float(os.getenv("NOMINATIM_TIMEOUT", 10))
+NOMINATIM_HEADERS = {
+    "User-Agent": "YourAppName/1.0 (sandipsubudhi123@gmail.com)"  # REQUIRED
+}
+
+_geocode_flight = SingleFlight("geocode")
+
+_geocode_cache = SQLiteCache(
+    os.getenv("GEOCODE_CACHE_PATH", cache_path("geocode.sqlite")),
+    table="geocode",
+)
+register_cache("geocode", _geocode_cache)
+
+
+def get_coordinates(place_name, record=True):
+    """
+    Return (lat, lon) for a place name, or None if it cannot be found.
+
+    Big cities with no namesake of similar size are answered from the
+    offline gazetteer (see Gazetteer.lookup). Other names go to
+    Nominatim; its results (including "not found") are cached on disk, keyed
+    on the normalized city name, so repeat lookups skip it. While Nominatim
+    is failing or its breaker is open, an expired cache entry or the
+    gazetteer's best guess is used instead (see _fallback_coordinates).
+    record=False keeps the lookup out of the hot-city counts (warm-up).
+    """
+    key = format_city_name(place_name)
+    if record:
+        record_city(key)
+
+    coords = cached_coordinates(place_name)
+    if coords is not MISSING:
+        return coords
+
+    try:
+        coords = _geocode_flight.do(key, fetch_coordinates, place_name)
+    except (CircuitOpen, RateLimited, requests.RequestException) as e:
+        return _fallback_coordinates(key, place_name, e)
+    _store_coordinates(key, coords)
+    return coords
+
+
+async def get_coordinates_async(place_name, record=True):
+    """Async version of get_coordinates (same cache)."""
+    key = format_city_name(place_name)
+    if record:
+        record_city(key)
+
+    coords = cached_coordinates(place_name)
+    if coords is not MISSING:
+        return coords
+
+    try:
+        coords = await _geocode_flight.do_async(key, fetch_coordinates_async, place_name)
+    except (CircuitOpen, RateLimited, httpx.HTTPError) as e:
+        return _fallback_coordinates(key, place_name, e)
+    _store_coordinates(key, coords)
+    return coords
+
+
+def cached_coordinates(place_name):
+    """
+    get_coordinates without Nominatim: (lat, lon) or None (known not found)
+    from the gazetteer or the geocode cache, MISSING if only Nominatim can tell.
+    """
+    coords = lookup_coordinates(place_name)
+    if coords is not None:
+        return coords
+    cached = _geocode_cache.get(format_city_name(place_name))
+    if cached is not MISSING:
+        return tuple(cached) if cached else None
+    return MISSING
+
+
+def _fallback_coordinates(key, place_name, error):
+    """
+    Coordinates when Nominatim could not be asked: the expired cache entry
+    if there is one, else the gazetteer's most populous city of that name,
+    else None (reported as not found). Nothing is cached.
+    """
+    log.warning("geocoding %r failed (%s), using a fallback", key, error)
+    cached = _geocode_cache.get(key, stale=True)
+    if cached is not MISSING and cached:
+        return tuple(cached)
+    return lookup_coordinates(place_name, strict=False)
+
+
+def known_place(place_name) -> bool:
+    """True if the gazetteer or the geocode cache knows `place_name` (no upstream call)."""
+    if is_city_name(place_name):
+        return True
+    cached = _geocode_cache.get(format_city_name(place_name))
+    return cached is not MISSING and bool(cached)
+
+
+def _store_coordinates(key, coords):
+    _geocode_cache.set(key, coords, GEOCODE_TTL if coords else GEOCODE_NEGATIVE_TTL)
+
+
+def _geocode_params(place_name):
+    return {
         "q": place_name,
         "format": "json",
         "limit": 1
     }
-    headers = {
-        "User-Agent": "YourAppName/1.0 (sandipsubudhi123@gmail.com)"  # REQUIRED
-    }
 
-    response = requests.get(url, params=params, headers=headers)
-    response.raise_for_status()   # raises error if request failed
 
-    data = response.json()
+def _parse_geocode(data):
     if not data:
         return None
 
     return float(data[0]['lat']), float(data[0]['lon'])
 
+
+def fetch_coordinates(place_name):
+    """Look up a place on Nominatim (no cache, waits for the rate limit)."""
+    def attempt(timeout):
+        response = http_session().get(
+            NOMINATIM_URL, params=_geocode_params(place_name), headers=NOMINATIM_HEADERS, timeout=timeout
+        )
+        response.raise_for_status()   # raises error if request failed
+        return _parse_geocode(response.json())
+
+    return guarded_call("nominatim", attempt, NOMINATIM_TIMEOUT, nominatim_limiter)
+
+
+async def fetch_coordinates_async(place_name):
+    """Async version of fetch_coordinates."""
+    async def attempt(timeout):
+        response = await async_client(NOMINATIM_URL).get(
+            NOMINATIM_URL, params=_geocode_params(place_name), headers=NOMINATIM_HEADERS, timeout=timeout
+        )
+        response.raise_for_status()
+        return _parse_geocode(response.json())
+
+    return await guarded_call_async("nominatim", attempt, NOMINATIM_TIMEOUT, nominatim_limiter)
@@ -0,0 +1,182 @@
+# forecast_store.py
+"""
+Columnar store of the daily forecasts in the forecast cache.
+
+Every cached Open-Meteo payload is copied into NumPy arrays: one row per
+grid cell, one column per day (as an offset from `base`), one matrix per
+metric (max, min, rain chance). Questions like "which of these cities is
+warmest and driest on Saturday" are then a column slice, a mask and an
+argsort instead of a loop over payload dicts and `dates.index`.
+"""
+import os
+import threading
+import time
+
+import numpy as np
+
+# days kept per row; Open-Meteo sends 7, the rest is room for the window to move
+STORE_DAYS = 16
+STORE_ROWS = int(os.getenv("FORECAST_CACHE_SIZE", 4096))
+
+METRICS = {
+    "max": "temperature_2m_max",
+    "min": "temperature_2m_min",
+    "rain": "precipitation_probability_mean",
+}
+RANKINGS = ("best", "warmest", "coolest", "driest")
+FILTERS = ("min_temp", "max_temp", "max_rain")
+
+
+def check_rank_args(by="best", limit=10, **filters):
+    """Raise ValueError for arguments ForecastStore.rank would reject (so callers can check before fetching)."""
+    if by not in RANKINGS:
+        raise ValueError(f"unknown ranking {by!r}, use one of {', '.join(RANKINGS)}")
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+    unknown = sorted(set(filters) - set(FILTERS))
+    if unknown:
+        raise ValueError(f"unknown filter {unknown[0]!r}, use {', '.join(FILTERS)}")
+
+
+class ForecastStore:
+    """Daily forecasts of up to `rows` grid cells as (rows, days) float arrays."""
+
+    def __init__(self, rows: int = STORE_ROWS, days: int = STORE_DAYS):
+        self.days = days
+        self.base = None  # numpy.datetime64 day of column 0
+        self.columns = {name: np.full((rows, days), np.nan) for name in METRICS}
+        self.updated = np.zeros(rows)  # time.time() of each row's last update, 0 = free
+        self.cells = [None] * rows
+        self.names = [None] * rows
+        self.row_of = {}  # cell -> row
+        self._lock = threading.Lock()
+
+    def update(self, cell, data):
+        """Copy the daily arrays of an Open-Meteo payload into the row for `cell`."""
+        daily = (data or {}).get("daily") or {}
+        dates = np.array(daily.get("time", []), dtype="datetime64[D]")
+        values = {name: np.array(daily.get(key, []), dtype=float) for name, key in METRICS.items()}
+        if not len(dates) or any(len(v) != len(dates) for v in values.values()):
+            return
+
+        with self._lock:
+            self._move_window(dates.min())
+            offsets = (dates - self.base).astype(int)
+            keep = (offsets >= 0) & (offsets < self.days)
+
+            row = self._row(cell)
+            for name, column in self.columns.items():
+                column[row] = np.nan
+                column[row, offsets[keep]] = values[name][keep]
+            self.updated[row] = time.time()
+
+    def name(self, cell, city):
+        """Label the row of `cell` with a city name (used in rankings)."""
+        with self._lock:
+            row = self.row_of.get(cell)
+            if row is not None:
+                self.names[row] = city
+
+    def rank(self, date, cells=None, by="best", limit=10, min_temp=None, max_temp=None, max_rain=None):
+        """
+        Rank cells by their forecast for `date` (YYYY-MM-DD).
+
+        by: "warmest" (highest max), "coolest" (lowest max), "driest" (lowest
+        rain chance, then warmest) or "best" (warm and dry: max temperature
+        and rain chance as z-scores over the candidates).
+        cells: only rank these grid cells (default: every cell in the store).
+        min_temp / max_temp bound the max temperature, max_rain the rain chance.
+
+        Returns a list of {"cell", "city", "date", "max", "min", "rain"}.
+        """
+        check_rank_args(by, limit)
+
+        with self._lock:
+            if self.base is None:
+                return []
+            offset = int((np.datetime64(date, "D") - self.base).astype(int))
+            if not 0 <= offset < self.days:
+                return []
+
+            if cells is None:
+                rows = np.flatnonzero(self.updated > 0)
+            else:
+                rows = np.array([self.row_of[c] for c in dict.fromkeys(cells) if c in self.row_of], dtype=int)
+            tmax = self.columns["max"][rows, offset]
+            tmin = self.columns["min"][rows, offset]
+            rain = self.columns["rain"][rows, offset]
+            labels = [(self.cells[r], self.names[r]) for r in rows]
+
+        mask = ~(np.isnan(tmax) | np.isnan(rain))
+        if min_temp is not None:
+            mask &= tmax >= min_temp
+        if max_temp is not None:
+            mask &= tmax <= max_temp
+        if max_rain is not None:
+            mask &= rain <= max_rain
+        idx = np.flatnonzero(mask)
+        if not len(idx):
+            return []
+
+        if by == "warmest":
+            order = np.argsort(-tmax[idx], kind="stable")
+        elif by == "coolest":
+            order = np.argsort(tmax[idx], kind="stable")
+        elif by == "driest":
+            order = np.lexsort((-tmax[idx], rain[idx]))
+        else:
+            order = np.argsort(-(_zscore(tmax[idx]) - _zscore(rain[idx])), kind="stable")
+
+        results = []
+        for i in idx[order][:limit]:
+            cell, city = labels[i]
+            results.append({
+                "cell": cell,
+                "city": city,
+                "date": str(date),
+                "max": float(tmax[i]),
+                "min": None if np.isnan(tmin[i]) else float(tmin[i]),
+                "rain": float(rain[i]),
+            })
+        return results
+
+    def __len__(self):
+        return len(self.row_of)
+
+    def _row(self, cell):
+        row = self.row_of.get(cell)
+        if row is None:
+            # free row, else the one updated longest ago
+            row = int(np.argmin(self.updated))
+            if self.cells[row] is not None:
+                del self.row_of[self.cells[row]]
+            self.cells[row], self.names[row] = cell, None
+            self.row_of[cell] = row
+        return row
+
+    def _move_window(self, first_day):
+        """Move the date window forward when a payload starts on a later day."""
+        # one day of slack: "today" differs by a day between time zones
+        base = first_day - np.timedelta64(1, "D")
+        if self.base is None:
+            self.base = base
+            return
+        shift = int((base - self.base).astype(int))
+        if shift <= 0:
+            return
+        # older days drop off the left edge
+        for column in self.columns.values():
+            if shift >= self.days:
+                column[:] = np.nan
+            else:
+                column[:, :-shift] = column[:, shift:]
+                column[:, -shift:] = np.nan
+        self.base = base
+
+
+def _zscore(values):
+    std = values.std()
+    return (values - values.mean()) / std if std > 0 else np.zeros_like(values)
+
+
+store = ForecastStore()
@@ -0,0 +1,285 @@
+# gazetteer.py
+"""
+Offline city gazetteer: prefix search and geocoding without Nominatim.
+
+The source is a GeoNames-style dump (tab-separated, GeoNames column layout,
+optionally gzipped). The bundled data/cities15000.txt.gz holds every city
+with at least 15000 people, with a few Latin-script alternate names each
+(so "Bangalore" finds Bengaluru). Data: GeoNames (geonames.org), CC BY 4.0.
+
+On first use the dump is compiled into a few .npy arrays under CACHE_DIR
+(one sorted array of normalized names plus per-city columns). Later loads,
+in any process, memory-map them, so startup is instant and the OS shares
+the pages between workers. A prefix query is two binary searches over the
+sorted names and a partial sort of the matches.
+"""
+import gzip
+import hashlib
+import logging
+import os
+import re
+import shutil
+import threading
+import unicodedata
+
+import numpy as np
+
+from cache import cache_path
+
+log = logging.getLogger(__name__)
+
+GAZETTEER_ENABLED = os.getenv("GAZETTEER_ENABLED", "1") != "0"
+GAZETTEER_PATH = os.getenv(
+    "GAZETTEER_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "cities15000.txt.gz")
+)
+
+# lookup() only answers for a city this big that dwarfs its namesakes
+GAZETTEER_MIN_POPULATION = int(os.getenv("GAZETTEER_MIN_POPULATION", 100000))
+GAZETTEER_DOMINANCE = float(os.getenv("GAZETTEER_DOMINANCE", 20))
+
+# Popular destinations (intent.KNOWN_CITIES) that lookup() won't answer on
+# its own: a namesake is too big (Hyderabad, Pakistan), the place is small
+# or a region (Leh, Goa), the dump only has a namesake (the Chennai suburb
+# "Manali") or another spelling (Puducherry). Normalized name -> (lat, lon).
+PINNED_COORDINATES = {
+    "goa": (15.49093, 73.82785),  # Panaji
+    "hyderabad": (17.38405, 78.45636),
+    "kochi": (9.93988, 76.26022),
+    "leh": (34.16504, 77.58402),
+    "manali": (32.2396, 77.18871),
+    "new delhi": (28.62137, 77.21479),
+    "pondicherry": (11.94159, 79.80831),
+    "rishikesh": (30.10778, 78.29254),
+    "udaipur": (24.58584, 73.71346),
+    "visakhapatnam": (17.68009, 83.2016),
+    "athens": (37.98376, 23.72784),
+    "barcelona": (41.38879, 2.15899),
+    "colombo": (6.93548, 79.84868),
+    "dublin": (53.33306, -6.24889),
+    "hong kong": (22.27832, 114.17469),
+    "san francisco": (37.77493, -122.41942),
+}
+
+# normalized names are stored in fixed-width byte columns
+KEY_BYTES = 32
+NAME_BYTES = 48
+
+# GeoNames columns used here
+_NAME, _ASCII_NAME, _ALTERNATE_NAMES, _LAT, _LON, _COUNTRY, _POPULATION = 1, 2, 3, 4, 5, 8, 14
+
+_ARRAYS = ("keys", "rows", "primary", "names", "country", "lat", "lon", "population")
+
+_gazetteer = None
+_lock = threading.Lock()
+
+
+def normalize_name(text: str) -> str:
+    """"São Paulo " -> "sao paulo": accents dropped, lower case, punctuation as spaces."""
+    text = "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+    return re.sub(r"[^a-z0-9]+", " ", text.lower()).strip()
+
+
+class Gazetteer:
+    """Read-only city index loaded from a directory written by build_index()."""
+
+    def __init__(self, directory: str):
+        for name in _ARRAYS:
+            setattr(self, name, np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r"))
+
+    def __len__(self):
+        return len(self.names)
+
+    def search(self, prefix: str, limit: int = 10):
+        """
+        Cities with a name (or alternate name) starting with `prefix`.
+        Matches on the main name come first, exact matches before prefix
+        matches, then by population. Returns a list of {"name", "country", "lat", "lon", "population"}.
+        """
+        key = normalize_name(prefix).encode()[:KEY_BYTES]
+        if not key or limit <= 0:
+            return []
+
+        lo = np.searchsorted(self.keys, key, side="left")
+        hi = np.searchsorted(self.keys, key + b"\xff", side="right")  # keys are ASCII
+        if lo == hi:
+            return []
+
+        rows = np.asarray(self.rows[lo:hi])
+        score = self._score(lo, hi, rows, key)
+
+        # a short prefix can match thousands of names: only sort the best few,
+        # taking more while duplicates (one city, several names) leave too few
+        k = limit * 4
+        while True:
+            best = np.argpartition(-score, k)[:k] if k < len(rows) else np.arange(len(rows))
+            ordered = rows[best[np.argsort(-score[best], kind="stable")]]
+            _, first = np.unique(ordered, return_index=True)
+            if len(first) >= limit or k >= len(rows):
+                break
+            k *= 4
+        return [self._city(row) for row in ordered[np.sort(first)][:limit]]
+
+    def lookup(self, name: str, strict: bool = True):
+        """
+        (lat, lon) of the city called `name`, or None unless the name clearly
+        means one city: the best match (main names first, then the most
+        populous) must have GAZETTEER_MIN_POPULATION people and
+        GAZETTEER_DOMINANCE times as many as any other city with that name.
+        Small namesakes of famous places ("Goa" in the Philippines, the
+        Chennai suburb "Manali") are left to Nominatim.
+        strict=False skips both checks and returns the best match, a guess
+        for when Nominatim can't be asked.
+        """
+        key = normalize_name(name).encode()
+        if not key or len(key) >= KEY_BYTES:  # truncated keys are not exact
+            return None
+
+        lo = np.searchsorted(self.keys, key, side="left")
+        hi = np.searchsorted(self.keys, key, side="right")
+        if lo == hi:
+            return None
+
+        rows = np.asarray(self.rows[lo:hi])
+        row = rows[np.argmax(self._score(lo, hi, rows, key))]
+        population = int(self.population[row])
+        others = self.population[rows[rows != row]]
+        if strict and population < GAZETTEER_MIN_POPULATION:
+            return None
+        if strict and len(others) and population < GAZETTEER_DOMINANCE * int(others.max()):
+            return None
+        return round(float(self.lat[row]), 5), round(float(self.lon[row]), 5)
+
+    def contains(self, name: str) -> bool:
+        """True if some city is called `name` (main or alternate name)."""
+        key = normalize_name(name).encode()
+        if not key or len(key) >= KEY_BYTES:
+            return False
+        lo = np.searchsorted(self.keys, key, side="left")
+        return lo < len(self.keys) and self.keys[lo] == key
+
+    def _score(self, lo, hi, rows, key):
+        """Ranking of the names in keys[lo:hi]: main name, then exact match, then population."""
+        score = self.population[rows].astype(np.int64)
+        score += np.asarray(self.primary[lo:hi]).astype(np.int64) << 41
+        score += (np.asarray(self.keys[lo:hi]) == key).astype(np.int64) << 40
+        return score
+
+    def _city(self, row):
+        return {
+            "name": self.names[row].decode("utf-8", "ignore"),
+            "country": self.country[row].decode(),
+            "lat": round(float(self.lat[row]), 5),
+            "lon": round(float(self.lon[row]), 5),
+            "population": int(self.population[row]),
+        }
+
+
+def read_dump(path: str):
+    """
+    Yield (name, main keys, alternate keys, country, lat, lon, population) for
+    each city in a GeoNames dump. Keys are normalized names.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) <= _POPULATION:
+                continue
+            main = {normalize_name(cols[_NAME]), normalize_name(cols[_ASCII_NAME])} - {""}
+            alternate = {normalize_name(n) for n in cols[_ALTERNATE_NAMES].split(",")} - main - {""}
+            yield (
+                cols[_NAME],
+                main,
+                alternate,
+                cols[_COUNTRY],
+                float(cols[_LAT]),
+                float(cols[_LON]),
+                int(cols[_POPULATION] or 0),
+            )
+
+
+def build_index(source: str, directory: str):
+    """Compile a GeoNames dump into the arrays Gazetteer memory-maps."""
+    names, country, lat, lon, population = [], [], [], [], []
+    keys, rows, primary = [], [], []
+    for row, (name, main, alternate, cc, la, lo, pop) in enumerate(read_dump(source)):
+        names.append(name.encode()[:NAME_BYTES])
+        country.append(cc.encode())
+        lat.append(la)
+        lon.append(lo)
+        population.append(pop)
+        for key in [*main, *alternate]:
+            keys.append(key.encode()[:KEY_BYTES])
+            rows.append(row)
+            primary.append(key in main)
+
+    order = np.argsort(np.array(keys, dtype=f"S{KEY_BYTES}"), kind="stable")
+    arrays = {
+        "keys": np.array(keys, dtype=f"S{KEY_BYTES}")[order],
+        "rows": np.array(rows, dtype=np.uint32)[order],
+        "primary": np.array(primary, dtype=np.uint8)[order],
+        "names": np.array(names, dtype=f"S{NAME_BYTES}"),
+        "country": np.array(country, dtype="S2"),
+        "lat": np.array(lat, dtype=np.float32),
+        "lon": np.array(lon, dtype=np.float32),
+        "population": np.array(population, dtype=np.uint32),
+    }
+
+    # write next to the target and rename, so other processes never see half an index
+    tmp = f"{directory}.tmp{os.getpid()}"
+    os.makedirs(tmp, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp, f"{name}.npy"), array)
+    try:
+        os.rename(tmp, directory)
+    except OSError:  # another process built it first
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _index_dir(source: str) -> str:
+    stat = os.stat(source)
+    digest = hashlib.sha1(f"{os.path.abspath(source)}|{stat.st_size}|{stat.st_mtime}".encode()).hexdigest()
+    return cache_path(f"gazetteer-{digest[:12]}")
+
+
+def get_gazetteer():
+    """The process-wide Gazetteer (built on first use), or None if disabled or unavailable."""
+    global _gazetteer
+    if _gazetteer is not None or not GAZETTEER_ENABLED:
+        return _gazetteer
+
+    with _lock:
+        if _gazetteer is None:
+            try:
+                directory = _index_dir(GAZETTEER_PATH)
+                if not os.path.isdir(directory):
+                    build_index(GAZETTEER_PATH, directory)
+                _gazetteer = Gazetteer(directory)
+            except Exception as e:
+                log.warning("gazetteer unavailable (%s): %s", GAZETTEER_PATH, e)
+                _gazetteer = False  # don't retry on every lookup
+    return _gazetteer or None
+
+
+def search_cities(prefix: str, limit: int = 10):
+    """Typeahead matches for `prefix` (see Gazetteer.search); [] without a gazetteer."""
+    gazetteer = get_gazetteer()
+    return gazetteer.search(prefix, limit) if gazetteer else []
+
+
+def is_city_name(name: str) -> bool:
+    """True if the gazetteer has a city called `name`; False without a gazetteer."""
+    gazetteer = get_gazetteer()
+    return bool(gazetteer and gazetteer.contains(name))
+
+
+def lookup_coordinates(name: str, strict: bool = True):
+    """
+    (lat, lon) from PINNED_COORDINATES or the gazetteer, or None (not found,
+    ambiguous or no gazetteer); see Gazetteer.lookup.
+    """
+    pinned = PINNED_COORDINATES.get(normalize_name(name))
+    if pinned is not None:
+        return pinned
+    gazetteer = get_gazetteer()
+    return gazetteer.lookup(name, strict) if gazetteer else None
@@ -0,0 +1,60 @@
+# http_clients.py
+"""
+Shared, keep-alive HTTP clients for the upstream APIs.
+
+Sync code uses one requests.Session (connection pool per host); async code
+uses one httpx.AsyncClient per host. Both are created lazily and reused for
+every request, so calls skip the TCP + TLS handshake after the first one.
+"""
+import os
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+# maximum open connections to a single upstream host
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", 20))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 10))
+
+_session = None
+_async_clients = {}  # host -> httpx.AsyncClient
+
+
+def http_session() -> requests.Session:
+    """The process-wide requests.Session."""
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=16,  # number of hosts kept
+            pool_maxsize=HTTP_MAX_CONNECTIONS_PER_HOST,
+            pool_block=True,
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _session = session
+    return _session
+
+
+def async_client(url: str) -> httpx.AsyncClient:
+    """The shared httpx.AsyncClient for the host of `url`."""
+    host = urlsplit(url).netloc
+    client = _async_clients.get(host)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS_PER_HOST,
+                max_keepalive_connections=HTTP_MAX_CONNECTIONS_PER_HOST,
+            ),
+        )
+        _async_clients[host] = client
+    return client
+
+
+async def aclose_clients():
+    """Close the async clients (call on server shutdown)."""
+    for client in list(_async_clients.values()):
+        await client.aclose()
+    _async_clients.clear()
@@ -1,37 +1,309 @@
-from coordinates import get_coordinates
-from weather import get_weather
-from places import get_top_50_attractions
-from http.server import BaseHTTPRequestHandler
+from metrics import (
+    CONTENT_TYPE, REQUEST_SECONDS, REQUESTS, render_metrics, server_timing_header, start_request_timings,
+)
+from main import weekday_to_date
+from pipeline import rank_cities, run_places, run_weather, run_weather_many, warm_city, warm_places
+from places import decode_cursor, encode_cursor, get_places_page
+from refresh import start_refresher
+from resilience import CircuitOpen, DeadlineExceeded, start_deadline
+from datetime import datetime, timedelta
+from gazetteer import get_gazetteer, search_cities
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from urllib.parse import urlparse, parse_qs
+import argparse
+import gzip
+import hashlib
 import json
+import logging
+import mimetypes
 import os
+import signal
+import threading
+import time
+
+log = logging.getLogger(__name__)
 
 SERPAPI_KEY = os.getenv("SERPAPI_KEY", "")
 
+# index.html and other browser assets are served from here
+STATIC_DIR = os.getenv("STATIC_DIR", os.path.dirname(os.path.abspath(__file__)))
+STATIC_EXTENSIONS = {".html", ".css", ".js", ".png", ".jpg", ".jpeg", ".svg", ".ico", ".webp", ".woff2"}
+# responses smaller than this are not worth compressing
+GZIP_MIN_SIZE = 512
+# most cities accepted by one /api/weather?cities= request
+MAX_WEATHER_CITIES = int(os.getenv("MAX_WEATHER_CITIES", 20))
+# most matches returned by one /api/cities request
+MAX_CITY_MATCHES = 50
+# most cities accepted by one /api/weather/rank request
+MAX_RANK_CITIES = int(os.getenv("MAX_RANK_CITIES", 50))
+# seconds an idle keep-alive connection may hold a worker
+KEEP_ALIVE_TIMEOUT = float(os.getenv("KEEP_ALIVE_TIMEOUT", 15))
+
+_static_cache = {}  # path -> (mtime, body, etag)
+
+
 class handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive (every response sets Content-Length)
+    timeout = KEEP_ALIVE_TIMEOUT
+
     def do_GET(self):
+        # the wait for a request slot counts towards the request's time
+        self.started = time.perf_counter()
+        self.responded = False
+        with self.server.slots:
+            self.timings = start_request_timings()
+            # every upstream call of this request shares one deadline
+            start_deadline()
+            try:
+                self.route()
+            except CircuitOpen as e:
+                self.respond({"error": str(e)}, status=503, headers={"Retry-After": str(e.retry_after)})
+            except DeadlineExceeded as e:
+                self.respond({"error": str(e)}, status=504)
+            except Exception:
+                log.exception("%s %s failed", self.command, urlparse(self.path).path)
+                if self.responded:
+                    # failed while writing the response: the connection can't be reused
+                    self.close_connection = True
+                else:
+                    self.respond({"error": "Internal server error"}, status=500)
+
+    # same headers as GET, respond_raw leaves out the body
+    do_HEAD = do_GET
+
+    def route(self):
         parsed = urlparse(self.path)
         qs = parse_qs(parsed.query)
         city = qs.get("city", [""])[0]
 
-        if parsed.path.startswith("/api/weather"):
-            coords = get_coordinates(city)
-            if not coords:
+        if parsed.path.startswith("/api/cities"):
+            # typeahead: ?prefix=ban&limit=10, answered from the offline gazetteer
+            try:
+                limit = min(max(int(qs.get("limit", ["10"])[0]), 1), MAX_CITY_MATCHES)
+            except ValueError:
+                self.respond({"error": "limit must be a number"}, status=400)
+                return
+            prefix = qs.get("prefix", [""])[0]
+            self.respond({"prefix": prefix, "cities": search_cities(prefix, limit)})
+
+        elif parsed.path.startswith("/api/weather/rank"):
+            # ?cities=a,b,c&date=saturday&by=best&max_rain=30 (no cities: every cached forecast)
+            cities = None
+            if "cities" in qs:
+                cities = [c.strip() for c in ",".join(qs["cities"]).split(",") if c.strip()]
+                cities = list(dict.fromkeys(cities))[:MAX_RANK_CITIES]
+            try:
+                date = parse_date(qs.get("date", ["tomorrow"])[0])
+                filters = {
+                    name: float(qs[name][0])
+                    for name in ("min_temp", "max_temp", "max_rain") if name in qs
+                }
+                ranking, not_found, errors = rank_cities(
+                    cities, date, qs.get("by", ["best"])[0], int(qs.get("limit", ["10"])[0]), **filters
+                )
+            except ValueError as e:
+                self.respond({"error": str(e)}, status=400)
+                return
+            self.respond({"date": date, "ranking": ranking, "not_found": not_found, "errors": errors})
+
+        elif parsed.path.startswith("/api/weather") and "cities" in qs:
+            # ?cities=Paris,Rome,... -> one forecast request for all of them
+            cities = [c.strip() for c in ",".join(qs["cities"]).split(",") if c.strip()]
+            cities = list(dict.fromkeys(cities))[:MAX_WEATHER_CITIES]
+            results = []
+            for item in run_weather_many(cities):
+                if item["error"]:
+                    results.append({"city": item["city"], "error": item["error"]})
+                elif item["coords"] is None:
+                    results.append({"city": item["city"], "error": "City not found"})
+                else:
+                    results.append({"city": item["city"], "weather": item["weather"]})
+            self.respond({"results": results})
+
+        elif parsed.path.startswith("/api/weather"):
+            ctx = run_weather(city)
+            if not ctx["coords"]:
                 self.respond({"error": "City not found"})
                 return
-            lat, lon = coords
-            data = get_weather(lat, lon, None)
-            self.respond({"city": city, "weather": data})
+            self.respond({"city": city, "weather": ctx["weather"]})
+
+        elif parsed.path.startswith("/api/places") and {"offset", "limit", "cursor"} & qs.keys():
+            # paged: ?offset=&limit= or ?cursor= (from next_cursor)
+            tag = qs.get("tag", [""])[0] or None
+            try:
+                if "cursor" in qs:
+                    offset = decode_cursor(qs["cursor"][0])
+                else:
+                    offset = int(qs.get("offset", ["0"])[0])
+                limit = int(qs.get("limit", ["5"])[0])
+            except ValueError as e:
+                self.respond({"error": str(e)}, status=400)
+                return
+            page = get_places_page(city, SERPAPI_KEY, tag, offset, limit)
+            next_offset = page["next_offset"]
+            self.respond({
+                "city": city,
+                "places": page["places"],
+                "offset": page["offset"],
+                "limit": page["limit"],
+                "next_offset": next_offset,
+                "next_cursor": encode_cursor(next_offset) if next_offset is not None else None,
+            })
 
         elif parsed.path.startswith("/api/places"):
-            places = get_top_50_attractions(city, SERPAPI_KEY)
+            tag = qs.get("tag", [""])[0] or None
+            places = run_places(city, SERPAPI_KEY, tag)["places"]
             self.respond({"city": city, "places": places})
 
-        else:
+        elif parsed.path.startswith("/metrics"):
+            self.respond_raw(render_metrics().encode(), CONTENT_TYPE, "/metrics")
+
+        elif not self.serve_static(parsed.path):
             self.respond({"status": "TravelAI running"})
 
-    def respond(self, data):
-        self.send_response(200)
-        self.send_header("Content-type", "application/json")
+    def respond(self, data, status=200, headers=None):
+        endpoint = urlparse(self.path).path.rstrip("/") or "/"
+        if endpoint not in ("/api/weather", "/api/weather/rank", "/api/places", "/api/cities"):
+            endpoint = "other"
+        self.respond_raw(json.dumps(data).encode(), "application/json", endpoint, status=status, headers=headers)
+
+    def respond_raw(self, body, content_type, endpoint, status=200, headers=None):
+        total = time.perf_counter() - self.started
+        REQUEST_SECONDS.observe(endpoint, total)
+        REQUESTS.inc(endpoint, str(status))
+
+        # gzip text responses when the client accepts it
+        compress = (
+            len(body) >= GZIP_MIN_SIZE
+            and not content_type.startswith("image/")
+            and "gzip" in self.headers.get("Accept-Encoding", "")
+        )
+        if compress:
+            body = gzip.compress(body, compresslevel=5)
+
+        self.responded = True
+        self.send_response(status)
+        self.send_header("Content-type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Server-Timing", server_timing_header(self.timings, total))
+        if compress:
+            self.send_header("Content-Encoding", "gzip")
+            self.send_header("Vary", "Accept-Encoding")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
         self.end_headers()
-        self.wfile.write(json.dumps(data).encode())
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def serve_static(self, url_path):
+        """Serve a file from STATIC_DIR ("/" -> index.html). Returns False if there is none."""
+        name = url_path.lstrip("/") or "index.html"
+        path = os.path.realpath(os.path.join(STATIC_DIR, name))
+        if (
+            not path.startswith(os.path.realpath(STATIC_DIR) + os.sep)
+            or os.path.splitext(path)[1].lower() not in STATIC_EXTENSIONS
+            or not os.path.isfile(path)
+        ):
+            return False
+
+        body, etag = load_static(path)
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        headers = {
+            "ETag": etag,
+            # html must be revalidated so new deploys show up; assets can be cached
+            "Cache-Control": "no-cache" if path.endswith(".html") else "public, max-age=3600",
+        }
+
+        if self.headers.get("If-None-Match") == etag:
+            self.respond_raw(b"", content_type, "static", status=304, headers=headers)
+        else:
+            self.respond_raw(body, content_type, "static", headers=headers)
+        return True
+
+    def log_message(self, format, *args):
+        if os.getenv("INDEX_ACCESS_LOG", "1") != "0":
+            super().log_message(format, *args)
+
+
+def parse_date(text):
+    """YYYY-MM-DD, "today", "tomorrow" or a weekday name -> YYYY-MM-DD."""
+    text = text.strip().lower()
+    if text in ("today", "tomorrow"):
+        return (datetime.now() + timedelta(days=text == "tomorrow")).strftime("%Y-%m-%d")
+    try:
+        return weekday_to_date(text)
+    except ValueError:
+        pass
+    try:
+        return datetime.strptime(text, "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        raise ValueError(f"invalid date: {text!r}") from None
+
+
+def load_static(path):
+    """(body, etag) of a static file, cached in memory until the file changes."""
+    mtime = os.path.getmtime(path)
+    cached = _static_cache.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, "rb") as f:
+            body = f.read()
+        cached = (mtime, body, '"' + hashlib.md5(body).hexdigest() + '"')
+        _static_cache[path] = cached
+    return cached[1], cached[2]
+
+
+class BoundedHTTPServer(ThreadingHTTPServer):
+    """
+    ThreadingHTTPServer that handles at most `workers` requests at once.
+
+    Every connection gets its own thread, so idle keep-alive connections only
+    hold a sleeping thread, not one of the `workers` request slots.
+    """
+
+    def __init__(self, address, handler_class, workers=16):
+        super().__init__(address, handler_class)
+        self.workers = workers
+        self.slots = threading.BoundedSemaphore(workers)
+
+    def server_close(self):
+        super().server_close()
+        # let in-flight requests finish; idle keep-alive connections are just dropped
+        for _ in range(self.workers):
+            self.slots.acquire()
+
+
+def _warm_places(city, tag):
+    if SERPAPI_KEY:
+        warm_places(city, tag, SERPAPI_KEY)
+
+
+def serve(host="0.0.0.0", port=8001, workers=16):
+    """Run the API + static server until SIGINT/SIGTERM, then shut down gracefully."""
+    server = BoundedHTTPServer((host, port), handler, workers)
+    # build or map the city index now rather than on the first request
+    get_gazetteer()
+    # warm WARM_CITIES and keep the hottest cities cached
+    stop_refresher = start_refresher(warm_city, _warm_places)
+
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever to return, so call it from another thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    print(f"TravelAI serving on http://{host}:{port}, up to {workers} requests at once")
+    try:
+        server.serve_forever()
+    finally:
+        stop_refresher.set()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="TravelAI weather/places API and static site")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 8001)))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("INDEX_WORKERS", 16)))
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers)
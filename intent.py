@@ -0,0 +1,245 @@
+# intent.py
+"""
+Rule-based first pass for parse_input.
+
+Most messages look like "bangalore weather tomorrow" or "places to visit in
+goa": a keyword match plus a small city gazetteer gets city, want_weather
+and want_places right without asking the LLM. fast_parse() returns those
+fields with a confidence score; parse_input() only calls the LLM when the
+confidence is below INTENT_FAST_PATH_MIN_CONFIDENCE.
+
+Parsed intents are also memoized per normalized message + previous city for
+INTENT_CACHE_TTL seconds, so repeated questions skip both the rules and the
+LLM. Only fast-path and well-formed LLM parses are memoized.
+"""
+import os
+import re
+import threading
+
+from cache import MISSING, TTLCache
+from city_names import format_city_name
+from coordinates import known_place
+from metrics import register_cache
+
+INTENT_CACHE_ENABLED = os.getenv("INTENT_CACHE_ENABLED", "1") != "0"
+INTENT_CACHE_SIZE = int(os.getenv("INTENT_CACHE_SIZE", 10000))
+# memoized intents are re-parsed after this long (seconds), so a wrong one doesn't stick
+INTENT_CACHE_TTL = float(os.getenv("INTENT_CACHE_TTL", 6 * 3600))
+
+INTENT_FAST_PATH = os.getenv("INTENT_FAST_PATH", "1") != "0"
+INTENT_FAST_PATH_MIN_CONFIDENCE = float(os.getenv("INTENT_FAST_PATH_MIN_CONFIDENCE", 0.75))
+# most city names learned from LLM parses (on top of KNOWN_CITIES)
+INTENT_LEARNED_CITIES_MAX = int(os.getenv("INTENT_LEARNED_CITIES_MAX", 2000))
+
+WEATHER_WORDS = ["weather", "temperature", "climate", "hot", "cold"]
+PLACES_WORDS = ["visit", "places", "tourist", "spots", "trip"]
+
+# extra words only used by the fast path (matched as whole words)
+_WEATHER_EXTRA = {"forecast", "rain", "raining", "rainy", "sunny", "humid", "humidity", "degrees", "umbrella", "wind"}
+_PLACES_EXTRA = {"attractions", "attraction", "sightseeing", "see", "explore", "plan", "itinerary", "landmarks", "sights"}
+
+# popular destinations; multi-word names are matched before single words
+KNOWN_CITIES = [
+    "Agra", "Ahmedabad", "Amritsar", "Bangalore", "Bengaluru", "Bhopal", "Bhubaneswar",
+    "Chandigarh", "Chennai", "Coimbatore", "Cuttack", "Darjeeling", "Dehradun", "Delhi",
+    "Goa", "Gurgaon", "Guwahati", "Hyderabad", "Indore", "Jaipur", "Jodhpur", "Kochi",
+    "Kolkata", "Leh", "Lucknow", "Madurai", "Manali", "Mangalore", "Mumbai", "Mysore",
+    "Nagpur", "New Delhi", "Noida", "Ooty", "Patna", "Pondicherry", "Pune", "Puri",
+    "Rishikesh", "Shimla", "Srinagar", "Surat", "Udaipur", "Varanasi", "Visakhapatnam",
+    "Amsterdam", "Athens", "Bangkok", "Barcelona", "Beijing", "Berlin", "Cairo", "Colombo",
+    "Dubai", "Dublin", "Hong Kong", "Istanbul", "Kathmandu", "Kuala Lumpur", "Lisbon",
+    "London", "Los Angeles", "Madrid", "Melbourne", "Moscow", "New York", "Paris", "Prague",
+    "Rome", "San Francisco", "Seoul", "Singapore", "Sydney", "Tokyo", "Toronto", "Vienna",
+]
+
+# words that can follow "in"/"to"/... without being a city name
+_NOT_CITY = {
+    "a", "an", "the", "there", "here", "it", "that", "this", "go", "be", "see", "visit", "do",
+    "know", "plan", "travel", "today", "tomorrow", "next", "this", "week", "weekend", "my",
+    "me", "some", "any", "monday", "tuesday", "wednesday", "thursday", "friday", "saturday",
+    "sunday", "morning", "evening", "night", "city", "town", "places", "place",
+}
+# everyday words the LLM sometimes returns as a "city"; never learned as one
+_COMMON_WORDS = _NOT_CITY | {
+    "hello", "hi", "hey", "thanks", "thank", "you", "friend", "please", "yes", "no", "ok", "okay",
+    "what", "where", "when", "how", "why", "who", "which", "is", "are", "was", "will", "can",
+    "i", "we", "they", "he", "she", "us", "them", "our", "your", "and", "or", "but", "with",
+    "of", "in", "on", "at", "to", "for", "from", "by", "about", "up", "down", "out", "over",
+    "good", "great", "nice", "best", "new", "old", "big", "small", "home", "now", "later",
+    "day", "days", "month", "year", "trip", "holiday", "vacation", "beach", "hills", "food",
+    "null", "none", "unknown", "n/a",
+}
+# up to three words after a preposition, e.g. "in new york city"
+_CITY_CANDIDATE = re.compile(r"\b(?:in|to|at|for|visiting|about)\s+(?=([a-z][a-z'-]*(?:\s+[a-z][a-z'-]*){0,2}))")
+# dates only make sense for weather
+_WHEN_WORDS = {"tomorrow", "today", "tonight", "weekend", "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"}
+
+_known = {city.lower(): city for city in KNOWN_CITIES}
+_longest_name = max(len(name.split()) for name in _known)
+_learned = 0
+
+_lock = threading.Lock()
+_stats = {"fast_path": 0, "llm": 0}
+
+_intent_cache = TTLCache(maxsize=INTENT_CACHE_SIZE, ttl=INTENT_CACHE_TTL)
+register_cache("intent", _intent_cache)
+
+
+def _words(text: str) -> list[str]:
+    return re.findall(r"[a-z0-9'-]+", text.lower())
+
+
+def find_cities(text: str) -> list[str]:
+    """Known city names mentioned in `text` (longest names win)."""
+    words = _words(text)
+    found = []
+    i = 0
+    while i < len(words):
+        for n in range(min(_longest_name, len(words) - i), 0, -1):
+            name = " ".join(words[i:i + n])
+            if name in _known:
+                if _known[name] not in found:
+                    found.append(_known[name])
+                i += n
+                break
+        else:
+            i += 1
+    return found
+
+
+def _unknown_city_candidates(text: str) -> list[str]:
+    """Words after in/to/at/... that look like a place name we don't know."""
+    unknown = []
+    for phrase in _CITY_CANDIDATE.findall(text):
+        words = phrase.split()
+        if words[0] in _NOT_CITY or words[0] in WEATHER_WORDS or words[0] in PLACES_WORDS:
+            continue
+        if any(" ".join(words[:n]) in _known for n in range(1, len(words) + 1)):
+            continue
+        unknown.append(words[0])
+    return unknown
+
+
+def learn_city(city: str, user_input: str):
+    """
+    Remember a city the LLM extracted, so the fast path knows it next time.
+
+    Only names that appear verbatim in the message, are not everyday words
+    and are known places (gazetteer or geocode cache) are learned, up to
+    INTENT_LEARNED_CITIES_MAX of them: the names are shared by every user.
+    """
+    global _learned, _longest_name
+    words = _words(city)
+    name = " ".join(words)
+    if not name or name in _known or name not in " ".join(_words(user_input)):
+        return
+    if all(w in _COMMON_WORDS or w in WEATHER_WORDS or w in PLACES_WORDS for w in words):
+        return
+    if _learned >= INTENT_LEARNED_CITIES_MAX or not known_place(city):
+        return
+
+    with _lock:
+        if name not in _known and _learned < INTENT_LEARNED_CITIES_MAX:
+            _known[name] = city
+            _learned += 1
+            _longest_name = max(_longest_name, len(words))
+
+
+def fast_parse(user_input: str, last_city: str | None = None):
+    """
+    Deterministic intent parse.
+
+    Returns: (city, want_weather, want_places, confidence) with confidence
+    in [0, 1]. Low confidence means the message should go to the LLM.
+    """
+    text = user_input.lower()
+    words = set(_words(text))
+
+    # ---------- CITY ----------
+    cities = find_cities(text)
+    unknown = _unknown_city_candidates(text)
+
+    if len(cities) == 1 and not unknown:
+        city, city_confidence = cities[0], 1.0
+    elif len(cities) > 1:
+        city, city_confidence = cities[0], 0.4   # which one? let the LLM decide
+    elif unknown:
+        city, city_confidence = last_city, 0.2   # probably a city we don't know
+    elif last_city is not None:
+        city, city_confidence = last_city, 0.8   # follow-up about the same city
+    else:
+        city, city_confidence = None, 0.5
+
+    # ---------- INTENT ----------
+    want_weather = bool(words & (set(WEATHER_WORDS) | _WEATHER_EXTRA))
+    want_places = bool(words & (set(PLACES_WORDS) | _PLACES_EXTRA)) or "things to do" in text
+
+    if want_weather or want_places:
+        intent_confidence = 1.0
+    elif "going" in words or "go" in words:
+        # "I'm going there" -> trip planning
+        want_places, intent_confidence = True, 0.8
+    elif words & _WHEN_WORDS:
+        # "what about tomorrow?" -> weather for that day
+        want_weather, intent_confidence = True, 0.8
+    else:
+        intent_confidence = 0.4
+
+    return city, want_weather, want_places, min(city_confidence, intent_confidence)
+
+
+def intent_signature(user_input: str) -> str:
+    """
+    The parts of a message that can change how a reply is phrased: the
+    topic and time words it uses, e.g. "goa weather tomorrow?" ->
+    "tomorrow,weather". Messages with the same signature get the same reply
+    for the same data.
+    """
+    words = set(_words(user_input))
+    topic = set(WEATHER_WORDS) | _WEATHER_EXTRA | set(PLACES_WORDS) | _PLACES_EXTRA | _WHEN_WORDS
+    signature = words & (topic | {"going", "go"})
+    if "things to do" in user_input.lower():
+        signature.add("things to do")
+    return ",".join(sorted(signature))
+
+
+# ---------- MEMO ----------
+
+def normalize_utterance(text: str) -> str:
+    """Case, punctuation and whitespace insensitive form: "Weather in Goa?" -> "weather in goa"."""
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+
+def _memo_key(user_input: str, last_city: str | None):
+    return normalize_utterance(user_input), format_city_name(last_city) if last_city else None
+
+
+def cached_intent(user_input: str, last_city: str | None):
+    """A memoized (city, want_weather, want_places) for this message, or None."""
+    if not INTENT_CACHE_ENABLED:
+        return None
+    parsed = _intent_cache.get(_memo_key(user_input, last_city))
+    return None if parsed is MISSING else parsed
+
+
+def remember_intent(user_input: str, last_city: str | None, parsed):
+    """Memoize a fast-path or well-formed LLM parse (never a fallback guess)."""
+    if INTENT_CACHE_ENABLED:
+        _intent_cache.set(_memo_key(user_input, last_city), parsed)
+
+
+def record_parse(fast_path: bool):
+    with _lock:
+        _stats["fast_path" if fast_path else "llm"] += 1
+
+
+def parse_stats() -> dict:
+    """How often parse_input was answered by the fast path vs the LLM, and memo hits."""
+    with _lock:
+        total = _stats["fast_path"] + _stats["llm"]
+        return {
+            **_stats,
+            "learned_cities": _learned,
+            "fast_path_ratio": round(_stats["fast_path"] / total, 3) if total else 0.0,
+            "cache": {"enabled": INTENT_CACHE_ENABLED, **_intent_cache.stats()},
+        }
@@ -0,0 +1,308 @@
+# llm.py
+"""
+Ollama client layer used by app.py for every LLM call.
+
+- warm_up() loads the model when the server starts and evaluates the static
+  prompt prefixes once, so the first real request doesn't pay for either.
+- every call passes keep_alive (OLLAMA_KEEP_ALIVE, default -1 = stay loaded)
+  so the model is not unloaded between requests.
+- prompts keep their static text (system prompt, examples, rules) first and
+  the per-request data last, so Ollama can reuse the cached prefix.
+- prompt-eval and generation timings are recorded per call name; see
+  llm_stats().
+- an admission gate lets at most LLM_MAX_CONCURRENCY calls reach Ollama at
+  once. Up to LLM_MAX_QUEUE more wait (for at most LLM_MAX_QUEUE_WAIT
+  seconds); anything beyond that fails fast with LLMOverloaded, which the
+  server turns into a 503 with Retry-After. The wait is also cut short by
+  the request's deadline (resilience.remaining()).
+- calls go through the "ollama" circuit breaker, so while Ollama is down
+  they fail at once with CircuitOpen; one call may take at most
+  OLLAMA_TIMEOUT seconds.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+import ollama
+
+from metrics import record_prompt_tokens
+from resilience import guarded, remaining
+
+logger = logging.getLogger(__name__)
+
+
+def _keep_alive(value: str):
+    try:
+        return float(value)
+    except ValueError:
+        return value  # duration string like "30m"
+
+
+OLLAMA_KEEP_ALIVE = _keep_alive(os.getenv("OLLAMA_KEEP_ALIVE", "-1"))
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 2))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", 16))
+LLM_MAX_QUEUE_WAIT = float(os.getenv("LLM_MAX_QUEUE_WAIT", 10))
+# seconds without a response from Ollama before a call fails
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", 120))
+
+
+class LLMOverloaded(Exception):
+    """Raised when the LLM queue is full or the wait for a slot timed out."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    def __init__(self, loop=None):
+        self.granted = False
+        self.event = threading.Event() if loop is None else None
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+
+    def wake(self):
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class AdmissionGate:
+    """
+    Concurrency limiter with a bounded FIFO wait queue.
+
+    Works for threads (slot()) and coroutines (aslot()) at the same time.
+    A released slot is handed directly to the oldest waiter.
+    """
+
+    def __init__(self, capacity: int, max_queue: int, max_wait: float):
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiters = deque()
+        self._admitted = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._hold_avg = 5.0  # moving average of seconds a slot is held
+
+    def retry_after(self) -> int:
+        """Rough seconds until a new request could get a slot."""
+        rounds = (len(self._waiters) + 1) / max(self.capacity, 1)
+        return max(1, round(rounds * self._hold_avg))
+
+    def _max_wait(self) -> float:
+        """Queue wait allowed for this caller: max_wait, or less when its request deadline is closer."""
+        left = remaining()
+        return self.max_wait if left is None else max(0.0, min(self.max_wait, left))
+
+    def _enter(self, loop=None):
+        """Take a free slot (returns None) or join the queue (returns a waiter)."""
+        with self._lock:
+            if self._active < self.capacity and not self._waiters:
+                self._active += 1
+                self._admitted += 1
+                return None
+            if len(self._waiters) >= self.max_queue:
+                self._rejected += 1
+                raise LLMOverloaded("LLM queue is full", self.retry_after())
+            waiter = _Waiter(loop)
+            self._waiters.append(waiter)
+            return waiter
+
+    def _after_wait(self, waiter, started):
+        waited = time.monotonic() - started
+        with self._lock:
+            if not waiter.granted:
+                self._waiters.remove(waiter)
+                self._timed_out += 1
+                raise LLMOverloaded("Timed out waiting for the LLM", self.retry_after())
+            self._admitted += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+
+    def _release(self, held: float):
+        with self._lock:
+            self._hold_avg = 0.9 * self._hold_avg + 0.1 * held
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.granted = True  # the slot passes straight to the waiter
+                waiter.wake()
+            else:
+                self._active -= 1
+
+    @contextmanager
+    def slot(self):
+        """Hold one LLM slot for the duration of the block (threads)."""
+        waiter = self._enter()
+        if waiter is not None:
+            started = time.monotonic()
+            waiter.event.wait(self._max_wait())
+            self._after_wait(waiter, started)
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(time.monotonic() - started)
+
+    @asynccontextmanager
+    async def aslot(self):
+        """Hold one LLM slot for the duration of the block (coroutines)."""
+        waiter = self._enter(asyncio.get_running_loop())
+        if waiter is not None:
+            started = time.monotonic()
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self._max_wait())
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                # client went away: give up the place (or the slot) and stop
+                with self._lock:
+                    granted = waiter.granted
+                    if not granted:
+                        self._waiters.remove(waiter)
+                if granted:
+                    self._release(0.0)
+                raise
+            self._after_wait(waiter, started)
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(time.monotonic() - started)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "capacity": self.capacity,
+                "active": self._active,
+                "queue_depth": len(self._waiters),
+                "max_queue": self.max_queue,
+                "admitted": self._admitted,
+                "rejected": self._rejected,
+                "timed_out": self._timed_out,
+                "avg_queue_wait_ms": round(self._wait_total / self._admitted * 1000, 1) if self._admitted else 0.0,
+                "max_queue_wait_ms": round(self._wait_max * 1000, 1),
+            }
+
+
+gate = AdmissionGate(LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE, LLM_MAX_QUEUE_WAIT)
+
+_client = ollama.Client(timeout=OLLAMA_TIMEOUT)
+_async_client = None
+
+_lock = threading.Lock()
+_stats = {}  # call name -> totals
+
+
+def _ollama_async():
+    """Shared ollama.AsyncClient (one connection pool for all requests)."""
+    global _async_client
+    if _async_client is None:
+        _async_client = ollama.AsyncClient(timeout=OLLAMA_TIMEOUT)
+    return _async_client
+
+
+def record_timings(name: str, response):
+    """Add the timing counters of a (final) Ollama response to the stats."""
+    fields = ("total_duration", "load_duration", "prompt_eval_count",
+              "prompt_eval_duration", "eval_count", "eval_duration")
+    with _lock:
+        totals = _stats.setdefault(name, dict.fromkeys(("calls",) + fields, 0))
+        totals["calls"] += 1
+        for field in fields:
+            totals[field] += response.get(field) or 0
+    if response.get("prompt_eval_count") is not None:
+        record_prompt_tokens(name, response["prompt_eval_count"])
+
+
+def llm_stats() -> dict:
+    """Per call name: call count, average prompt/generation timings (ms) and token counts."""
+    report = {}
+    with _lock:
+        for name, t in _stats.items():
+            calls = t["calls"] or 1
+            report[name] = {
+                "calls": t["calls"],
+                "avg_total_ms": round(t["total_duration"] / calls / 1e6, 1),
+                "avg_load_ms": round(t["load_duration"] / calls / 1e6, 1),
+                "avg_prompt_tokens": round(t["prompt_eval_count"] / calls, 1),
+                "avg_prompt_eval_ms": round(t["prompt_eval_duration"] / calls / 1e6, 1),
+                "avg_eval_tokens": round(t["eval_count"] / calls, 1),
+                "avg_eval_ms": round(t["eval_duration"] / calls / 1e6, 1),
+            }
+    return report
+
+
+def warm_up(model: str, prefixes=()):
+    """
+    Load `model` into memory and pin it with keep_alive, then evaluate each
+    static prompt prefix (a list of messages) once so it is in Ollama's cache.
+    Errors are logged, not raised: the server still starts without Ollama.
+    """
+    try:
+        _client.generate(model=model, prompt="", keep_alive=OLLAMA_KEEP_ALIVE)
+        for messages in prefixes:
+            response = _client.chat(
+                model=model,
+                messages=messages,
+                options={"num_predict": 1},
+                keep_alive=OLLAMA_KEEP_ALIVE,
+            )
+            record_timings("warm_up", response)
+    except Exception as e:
+        logger.warning("Ollama warm-up failed for %s: %s", model, e)
+
+
+def chat(model: str, messages, name: str = "chat") -> str:
+    """Run a chat completion and return the reply text."""
+    with gate.slot(), guarded("ollama"):
+        response = _client.chat(model=model, messages=messages, keep_alive=OLLAMA_KEEP_ALIVE)
+    record_timings(name, response)
+    return response["message"]["content"]
+
+
+async def achat(model: str, messages, name: str = "chat") -> str:
+    """Async version of chat."""
+    async with gate.aslot():
+        with guarded("ollama"):
+            response = await _ollama_async().chat(model=model, messages=messages, keep_alive=OLLAMA_KEEP_ALIVE)
+    record_timings(name, response)
+    return response["message"]["content"]
+
+
+def chat_stream(model: str, messages, name: str = "chat"):
+    """Yield the reply text piece by piece as it is generated."""
+    with gate.slot(), guarded("ollama"):
+        for chunk in _client.chat(model=model, messages=messages, stream=True, keep_alive=OLLAMA_KEEP_ALIVE):
+            if chunk["message"]["content"]:
+                yield chunk["message"]["content"]
+            if chunk.get("done"):
+                record_timings(name, chunk)
+
+
+async def achat_stream(model: str, messages, name: str = "chat"):
+    """Async version of chat_stream."""
+    async with gate.aslot():
+        with guarded("ollama"):
+            stream = await _ollama_async().chat(model=model, messages=messages, stream=True, keep_alive=OLLAMA_KEEP_ALIVE)
+            async for chunk in stream:
+                if chunk["message"]["content"]:
+                    yield chunk["message"]["content"]
+                if chunk.get("done"):
+                    record_timings(name, chunk)
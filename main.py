@@ -1,23 +1,13 @@
 # main.py
 from datetime import timedelta, datetime
-from places import get_top_50_attractions  # <-- or get_top_5_attractions if you kept that name
+from places import get_places_page
 from weather import get_weather
 from coordinates import get_coordinates
+from city_names import format_city_name
 
 SERPAPI_KEY = "764f6562ac7a13291ac92c6a7759fe148a5063770000a6e20e36a6c4edee6368"
 
 
-def format_city_name(city: str) -> str:
-    """
-    Converts user input city into properly capitalized form.
-    Examples:
-    bangalore -> Bangalore
-    new delhi -> New Delhi
-    LOS ANGELES -> Los Angeles
-    """
-    return " ".join(word.capitalize() for word in city.strip().split())
-
-
 def weekday_to_date(day_name: str) -> str:
     """Return the next date (YYYY-MM-DD) for the given weekday name."""
     days = {
@@ -86,9 +76,10 @@ def chat_loop():
     print("Welcome to your Travel TravelAI! (type 'exit' to quit)")
     last_city = None
 
-    # cache for current city's places + index of how many shown
-    city_places: list[str] | None = None
-    city_places_index: int = 0
+    # tag of the current city's places + offset of the next page (None = no more)
+    # pages come from the shared places cache, so "More places" is a cache read
+    city_places_tag: str | None = None
+    city_places_index: int | None = None
 
     while True:
         # Ensure we have a city selected
@@ -101,9 +92,8 @@ def chat_loop():
                 print("TravelAI:\n Please enter a city name.")
                 continue
             last_city = format_city_name(user_input)
-            # reset places cache when choosing a new city
-            city_places = None
-            city_places_index = 0
+            # reset places paging when choosing a new city
+            city_places_index = None
 
         city = last_city
 
@@ -116,10 +106,10 @@ def chat_loop():
         print("  5. Exit")
 
         # ✅ Extra option only if we have more places left to show
-        if city_places is not None and city_places_index < len(city_places):
+        if city_places_index is not None:
             print("  6. More places to visit")
 
-        choice = input("Choose 1/2/3/4/5" + ("/6" if city_places is not None and city_places_index < len(city_places) else "") + ": ").strip()
+        choice = input("Choose 1/2/3/4/5" + ("/6" if city_places_index is not None else "") + ": ").strip()
 
         if choice == "5":
             print("TravelAI: Bye! Have a great trip 😄")
@@ -130,18 +120,17 @@ def chat_loop():
             new_city = input("\nTravelAI:\n Enter new city name (or press Enter to cancel): ").strip()
             if new_city:
                 last_city = format_city_name(new_city)
-                city_places = None
-                city_places_index = 0
+                city_places_index = None
             # If empty, keep same city and loop again
             continue
 
-        # ✅ "More places" option – just show next 5 from cache
-        if choice == "6" and city_places is not None and city_places_index < len(city_places):
-            batch = city_places[city_places_index:city_places_index + 5]
+        # ✅ "More places" option – next 5 from the places cache
+        if choice == "6" and city_places_index is not None:
+            page = get_places_page(city, SERPAPI_KEY, city_places_tag, city_places_index, 5)
             print(f"\nTravelAI: More places in {city}:")
-            for p in batch:
+            for p in page["places"]:
                 print(f"- {p}")
-            city_places_index += 5
+            city_places_index = page["next_offset"]
             continue  # go back to menu
 
         want_weather = False
@@ -179,22 +168,18 @@ def chat_loop():
             # ask tag each time we freshly ask for places
             tag = ask_places_tag()
 
-            # fetch up to 50 places once for this request
-            raw_places = get_top_50_attractions(city, SERPAPI_KEY, tag or "tourist attractions") or []
-
-            # store in cache and reset index
-            city_places = raw_places
-            city_places_index = 0
+            # first page; the whole result set is cached for "More places"
+            city_places_tag = tag or "tourist attractions"
+            page = get_places_page(city, SERPAPI_KEY, city_places_tag, 0, 5)
+            city_places_index = page["next_offset"]
 
-            if not city_places:
+            if not page["places"]:
                 print(f"\nTravelAI: I couldn't find places to visit in {city}.")
             else:
                 # show first 5 now
-                batch = city_places[0:5]
                 print(f"\nTravelAI: Here are some places in {city}:")
-                for p in batch:
+                for p in page["places"]:
                     print(f"- {p}")
-                city_places_index = 5
                 # from now on, option 6 will appear in menu for "More places"
 
 
@@ -0,0 +1,173 @@
+# metrics.py
+"""
+Request metrics in Prometheus text format, plus Server-Timing headers.
+
+- stage latencies (pipeline stages), upstream call latencies and errors,
+  and HTTP request latencies are histograms / counters kept in-process;
+- cache hit ratios are read from the registered caches at scrape time;
+- each request collects its own stage timings (start_request_timings /
+  record_timing) and LLM prompt sizes (record_prompt_tokens), which the
+  servers send back as a Server-Timing header.
+
+render_metrics() returns the text for a /metrics endpoint.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+TOKEN_BUCKETS = (32, 64, 128, 256, 384, 512, 768, 1024, 2048, 4096)
+
+_lock = threading.Lock()
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, label: str, buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = buckets
+        self._series = {}  # label value -> [bucket counts..., sum, count]
+
+    def observe(self, label_value: str, value: float):
+        with _lock:
+            series = self._series.setdefault(label_value, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            for value, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f'{self.name}_bucket{{{self.label}="{value}",le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{self.label}="{value}",le="+Inf"}} {series[-1]}')
+                lines.append(f'{self.name}_sum{{{self.label}="{value}"}} {series[-2]:.6f}')
+                lines.append(f'{self.name}_count{{{self.label}="{value}"}} {series[-1]}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}  # tuple of label values -> count
+
+    def inc(self, *label_values):
+        with _lock:
+            self._values[label_values] = self._values.get(label_values, 0) + 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with _lock:
+            for values, count in sorted(self._values.items()):
+                labels = ",".join(f'{k}="{v}"' for k, v in zip(self.labels, values))
+                lines.append(f"{self.name}{{{labels}}} {count}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("travelai_stage_seconds", "Pipeline stage latency.", "stage")
+UPSTREAM_SECONDS = Histogram("travelai_upstream_seconds", "Upstream API call latency.", "upstream")
+REQUEST_SECONDS = Histogram("travelai_request_seconds", "HTTP request latency.", "endpoint")
+PROMPT_TOKENS = Histogram(
+    "travelai_prompt_tokens", "LLM prompt tokens evaluated by Ollama.", "call", buckets=TOKEN_BUCKETS,
+)
+UPSTREAM_ERRORS = Counter("travelai_upstream_errors_total", "Failed upstream API calls.", ("upstream",))
+REQUESTS = Counter("travelai_requests_total", "HTTP requests.", ("endpoint", "status"))
+UPSTREAM_HEDGES = Counter("travelai_upstream_hedges_total", "Hedged (second) upstream requests sent.", ("upstream",))
+BREAKER_REJECTIONS = Counter(
+    "travelai_breaker_rejections_total", "Upstream calls refused by an open circuit breaker.", ("upstream",),
+)
+
+_caches = {}  # name -> object with .hits and .misses
+
+
+def register_cache(name: str, cache):
+    """Report hits/misses/hit ratio of `cache` (anything with .hits and .misses)."""
+    _caches[name] = cache
+
+
+# ---------- PER-REQUEST TIMINGS ----------
+
+def start_request_timings() -> dict:
+    """Start collecting stage timings for the current request; returns the dict."""
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def record_timing(name: str, seconds: float):
+    """Record a stage duration in the histogram and in the current request's timings."""
+    STAGE_SECONDS.observe(name, seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+def record_prompt_tokens(call: str, tokens: int):
+    """Record an LLM call's prompt size in the histogram and in the current request's timings."""
+    PROMPT_TOKENS.observe(call, tokens)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[f"{call}_tokens"] = timings.get(f"{call}_tokens", 0) + int(tokens)
+
+
+def server_timing_header(timings: dict, total: float | None = None) -> str:
+    """
+    {"intent": 0.012} -> 'intent;dur=12.0' (milliseconds).
+    Integer entries (token counts) are sent as a description: 'x_tokens;desc="312"'.
+    """
+    parts = [
+        f'{name};desc="{value}"' if isinstance(value, int) else f"{name};dur={value * 1000:.1f}"
+        for name, value in timings.items()
+    ]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+@contextmanager
+def upstream_call(upstream: str):
+    """Time an upstream API call and count it as an error if it raises."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        UPSTREAM_ERRORS.inc(upstream)
+        raise
+    finally:
+        UPSTREAM_SECONDS.observe(upstream, time.perf_counter() - started)
+
+
+# ---------- EXPORT ----------
+
+def render_metrics() -> str:
+    lines = []
+    for metric in (
+        REQUESTS, REQUEST_SECONDS, STAGE_SECONDS, UPSTREAM_SECONDS, UPSTREAM_ERRORS, UPSTREAM_HEDGES,
+        BREAKER_REJECTIONS, PROMPT_TOKENS,
+    ):
+        lines.extend(metric.render())
+
+    lines.append("# HELP travelai_cache_hits_total Cache hits.")
+    lines.append("# TYPE travelai_cache_hits_total counter")
+    lines.extend(f'travelai_cache_hits_total{{cache="{n}"}} {c.hits}' for n, c in sorted(_caches.items()))
+    lines.append("# HELP travelai_cache_misses_total Cache misses.")
+    lines.append("# TYPE travelai_cache_misses_total counter")
+    lines.extend(f'travelai_cache_misses_total{{cache="{n}"}} {c.misses}' for n, c in sorted(_caches.items()))
+    lines.append("# HELP travelai_cache_hit_ratio Cache hit ratio since start.")
+    lines.append("# TYPE travelai_cache_hit_ratio gauge")
+    for name, cache in sorted(_caches.items()):
+        total = cache.hits + cache.misses
+        lines.append(f'travelai_cache_hit_ratio{{cache="{name}"}} {cache.hits / total if total else 0:.4f}')
+
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
@@ -0,0 +1,598 @@
+# pipeline.py
+"""
+Request pipeline shared by every entry point (server.py, app.py, index.py).
+
+Each step (intent parsing, geocoding, forecast, places search, final reply)
+is a Stage that names the stages it depends on. run_stages() starts every
+stage as soon as its dependencies are done, so independent chains like
+geocode -> forecast and the places search run at the same time and a
+request takes as long as its longest chain instead of the sum of all calls.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from app import (
+    SERPAPI_KEY, build_llm_response, build_llm_response_async, build_llm_response_stream,
+    build_llm_response_stream_async, parse_input, parse_input_async,
+)
+from cache import MISSING
+from coordinates import cached_coordinates, get_coordinates, get_coordinates_async
+from main import weekday_to_date
+from metrics import record_timing
+from places import get_top_50_attractions, get_top_50_attractions_async
+from replies import REPLY_MODE, render_reply
+from resilience import CircuitOpen
+from sessions import session_inputs, update_session
+from forecast_store import check_rank_args, store as forecast_store
+from weather import (
+    format_weather, get_forecast, get_forecast_async, get_forecasts, get_weather_many, grid_cell, weather_facts,
+)
+
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", 32))
+# most cities of one multi-city request that may need Nominatim (1 request/s);
+# the others are reported as errors rather than pushing the request past its deadline
+MAX_GEOCODE_LOOKUPS = int(os.getenv("MAX_GEOCODE_LOOKUPS", 10))
+
+_executor = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix="pipeline")
+
+log = logging.getLogger(__name__)
+
+
+class Stage:
+    """
+    One step of the pipeline: func(ctx) -> result, run after `deps`.
+    `afunc` is an optional coroutine version used by run_stages_async.
+    """
+
+    def __init__(self, name, func, deps=(), afunc=None):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.afunc = afunc
+
+
+def _submit(fn, *args):
+    """_executor.submit that carries the caller's context (request deadline and timings)."""
+    return _executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+def _timed(func, ctx):
+    started = time.perf_counter()
+    return func(ctx), time.perf_counter() - started
+
+
+async def _atimed(afunc, ctx):
+    started = time.perf_counter()
+    return await afunc(ctx), time.perf_counter() - started
+
+
+def _needed_stages(by_name, ctx, targets):
+    """Names of the stages needed for `targets` that are not in ctx yet."""
+    needed = set()
+    todo = list(targets or by_name)
+    while todo:
+        name = todo.pop()
+        if name in needed or name in ctx:
+            continue
+        needed.add(name)
+        todo.extend(by_name[name].deps)
+    return needed
+
+
+def run_stages(stages, inputs=None, targets=None):
+    """
+    Run a graph of stages and return the context dict.
+
+    - inputs: initial context values; a stage whose name is already in the
+      context is treated as done and is not run again.
+    - targets: names of the stages wanted; only they and their dependencies
+      run. Defaults to every stage.
+
+    Each stage's result is stored in the context under its name and its
+    duration is recorded (metrics.record_timing). The first exception raised
+    by a stage is re-raised here.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    ctx = dict(inputs or {})
+
+    needed = _needed_stages(by_name, ctx, targets)
+
+    running = {}  # future -> stage name
+    while needed or running:
+        ready = [name for name in needed if all(dep in ctx for dep in by_name[name].deps)]
+        for name in ready:
+            needed.discard(name)
+            running[_submit(_timed, by_name[name].func, dict(ctx))] = name
+
+        if not running:
+            raise RuntimeError(f"Unresolvable pipeline stages: {sorted(needed)}")
+
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            name = running.pop(future)
+            try:
+                ctx[name], seconds = future.result()
+                record_timing(name, seconds)
+            except Exception:
+                for other in running:
+                    other.cancel()
+                raise
+
+    return ctx
+
+
+async def run_stages_async(stages, inputs=None, targets=None):
+    """
+    Async version of run_stages for the event loop.
+
+    Stages with an `afunc` are awaited directly; plain stages run on the
+    pipeline thread pool.
+    """
+    loop = asyncio.get_running_loop()
+    by_name = {stage.name: stage for stage in stages}
+    ctx = dict(inputs or {})
+    needed = _needed_stages(by_name, ctx, targets)
+
+    running = {}  # task -> stage name
+    try:
+        while needed or running:
+            ready = [name for name in needed if all(dep in ctx for dep in by_name[name].deps)]
+            for name in ready:
+                needed.discard(name)
+                stage = by_name[name]
+                if stage.afunc is not None:
+                    task = asyncio.ensure_future(_atimed(stage.afunc, dict(ctx)))
+                else:
+                    task = loop.run_in_executor(
+                        _executor, contextvars.copy_context().run, _timed, stage.func, dict(ctx)
+                    )
+                running[task] = name
+
+            if not running:
+                raise RuntimeError(f"Unresolvable pipeline stages: {sorted(needed)}")
+
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name = running.pop(task)
+                ctx[name], seconds = task.result()
+                record_timing(name, seconds)
+    finally:
+        for task in running:
+            task.cancel()
+
+    return ctx
+
+
+# ---------- CHAT STAGES ----------
+
+def detect_weather_mode(text: str):
+    """Weather mode for get_weather from the wording of a message."""
+    text = text.lower()
+
+    if "tomorrow" in text:
+        return "tomorrow"
+    if "next 7" in text or "next seven" in text or "next week" in text:
+        return "next7"
+    for day in ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]:
+        if day in text:
+            return weekday_to_date(day)
+    return None
+
+
+def _intent(user_input, last_city, parsed):
+    city, want_weather, want_places = parsed
+
+    # If no city now, reuse previous city
+    if city is None and last_city is not None:
+        city = last_city
+
+    # no clear intent -> give both
+    neither = not want_weather and not want_places
+    return {
+        "city": city,
+        "want_weather": want_weather,
+        "want_places": want_places,
+        "fetch_weather": city is not None and (want_weather or neither),
+        "fetch_places": city is not None and (want_places or neither),
+        "mode": detect_weather_mode(user_input),
+    }
+
+
+def intent_stage(ctx):
+    parsed = parse_input(ctx["user_input"], ctx.get("last_city"))
+    return _intent(ctx["user_input"], ctx.get("last_city"), parsed)
+
+
+async def intent_stage_async(ctx):
+    parsed = await parse_input_async(ctx["user_input"], ctx.get("last_city"))
+    return _intent(ctx["user_input"], ctx.get("last_city"), parsed)
+
+
+def coords_stage(ctx):
+    intent = ctx["intent"]
+    if not intent["fetch_weather"]:
+        return None
+    return get_coordinates(intent["city"])
+
+
+async def coords_stage_async(ctx):
+    intent = ctx["intent"]
+    if not intent["fetch_weather"]:
+        return None
+    return await get_coordinates_async(intent["city"])
+
+
+def forecast_stage(ctx):
+    coords = ctx["coords"]
+    if coords is None:
+        return None
+    try:
+        data = get_forecast(*coords)
+    except Exception as e:
+        return {"error": f"Weather service error: {e}"}
+    _name_cell(ctx["intent"]["city"], coords)
+    return {"data": data}
+
+
+async def forecast_stage_async(ctx):
+    coords = ctx["coords"]
+    if coords is None:
+        return None
+    try:
+        data = await get_forecast_async(*coords)
+    except Exception as e:
+        return {"error": f"Weather service error: {e}"}
+    _name_cell(ctx["intent"]["city"], coords)
+    return {"data": data}
+
+
+def weather_stage(ctx):
+    """Weather text for the requested mode (same text as get_weather)."""
+    forecast = ctx["forecast"]
+    if forecast is None:
+        return None
+    if "error" in forecast:
+        return forecast["error"]
+    return format_weather(forecast["data"], ctx["intent"]["mode"])
+
+
+async def weather_stage_async(ctx):
+    return weather_stage(ctx)
+
+
+def _places_args(ctx):
+    intent = ctx["intent"]
+    return (
+        intent["city"],
+        ctx.get("serpapi_key", SERPAPI_KEY),
+        intent.get("tag") or "tourist attractions",
+    )
+
+
+def places_stage(ctx):
+    if not ctx["intent"]["fetch_places"]:
+        return None
+    return get_top_50_attractions(*_places_args(ctx))
+
+
+async def places_stage_async(ctx):
+    if not ctx["intent"]["fetch_places"]:
+        return None
+    return await get_top_50_attractions_async(*_places_args(ctx))
+
+
+def _reply_without_llm(ctx):
+    """Fixed reply when there is nothing to ask the LLM about, else None."""
+    intent = ctx["intent"]
+    city = intent["city"]
+
+    if city is None:
+        return "I couldn't detect any city. Please mention a city name like 'Bangalore'."
+    if intent["fetch_weather"] and ctx["coords"] is None:
+        return f"I couldn't find coordinates for {city}."
+    return None
+
+
+def _reply_args(ctx):
+    intent = ctx["intent"]
+    places = ctx["places"]
+    offset = ctx.get("places_offset", 0)  # "more places" in a session
+    forecast = ctx.get("forecast") or {}
+    return dict(
+        user_input=ctx["user_input"],
+        city=intent["city"],
+        want_weather=intent["want_weather"],
+        want_places=intent["want_places"],
+        weather_text=ctx["weather"],
+        places=places[offset:offset + 5] if places else None,
+        weather_facts=weather_facts(forecast["data"], intent["mode"]) if "data" in forecast else None,
+    )
+
+
+def _template_reply(ctx):
+    """The reply rendered from templates (replies.py), no model call."""
+    args = _reply_args(ctx)
+
+    return render_reply(
+        user_input=args["user_input"],
+        city=args["city"],
+        want_weather=args["want_weather"],
+        want_places=args["want_places"],
+        weather=args["weather_facts"],
+        places=args["places"],
+    )
+
+
+def reply_stage(ctx):
+    reply = _reply_without_llm(ctx)
+    if reply is not None:
+        return reply
+    if (ctx.get("reply_mode") or REPLY_MODE) == "template":
+        return _template_reply(ctx)
+    try:
+        return build_llm_response(**_reply_args(ctx))
+    except CircuitOpen:
+        # Ollama is down: answer from the templates instead of failing
+        return _template_reply(ctx)
+
+
+async def reply_stage_async(ctx):
+    reply = _reply_without_llm(ctx)
+    if reply is not None:
+        return reply
+    if (ctx.get("reply_mode") or REPLY_MODE) == "template":
+        return _template_reply(ctx)
+    try:
+        return await build_llm_response_async(**_reply_args(ctx))
+    except CircuitOpen:
+        return _template_reply(ctx)
+
+
+CHAT_STAGES = [
+    Stage("intent", intent_stage, afunc=intent_stage_async),
+    Stage("coords", coords_stage, deps=["intent"], afunc=coords_stage_async),
+    Stage("forecast", forecast_stage, deps=["coords"], afunc=forecast_stage_async),
+    Stage("weather", weather_stage, deps=["forecast", "intent"], afunc=weather_stage_async),
+    Stage("places", places_stage, deps=["intent"], afunc=places_stage_async),
+    Stage("reply", reply_stage, deps=["intent", "coords", "forecast", "weather", "places"], afunc=reply_stage_async),
+]
+
+
+def run_chat(user_input: str, last_city: str | None = None, **inputs):
+    """Run a full chat turn; the answer is in ctx["reply"], the city in ctx["intent"]["city"]."""
+    return run_stages(
+        CHAT_STAGES,
+        {"user_input": user_input, "last_city": last_city, **inputs},
+        targets=["reply"],
+    )
+
+
+async def run_chat_async(user_input: str, last_city: str | None = None, **inputs):
+    """Async version of run_chat (used by the FastAPI /chat endpoint)."""
+    return await run_stages_async(
+        CHAT_STAGES,
+        {"user_input": user_input, "last_city": last_city, **inputs},
+        targets=["reply"],
+    )
+
+
+# everything a reply needs, without the reply itself (for streaming)
+DATA_STAGES = ["intent", "coords", "forecast", "weather", "places"]
+
+
+def run_chat_data(user_input: str, last_city: str | None = None, **inputs):
+    """Run a chat turn up to (not including) the reply; see stream_reply."""
+    return run_stages(
+        CHAT_STAGES,
+        {"user_input": user_input, "last_city": last_city, **inputs},
+        targets=DATA_STAGES,
+    )
+
+
+async def run_chat_data_async(user_input: str, last_city: str | None = None, **inputs):
+    """Async version of run_chat_data."""
+    return await run_stages_async(
+        CHAT_STAGES,
+        {"user_input": user_input, "last_city": last_city, **inputs},
+        targets=DATA_STAGES,
+    )
+
+
+def run_session_chat(user_input: str, session: dict, targets=("reply",), **inputs):
+    """
+    run_chat for a server-side session (sessions.py): the previous city is
+    taken from the session, and a turn about the same city reuses its
+    coordinates, forecast and places instead of fetching them again.
+    The session is updated with what this turn fetched.
+    """
+    ctx = run_stages(
+        CHAT_STAGES,
+        {"user_input": user_input, "last_city": session.get("city"), **inputs},
+        targets=["intent"],
+    )
+    ctx.update(session_inputs(session, ctx["intent"], user_input))
+    ctx = run_stages(CHAT_STAGES, ctx, targets=list(targets))
+    update_session(session, ctx)
+    return ctx
+
+
+async def run_session_chat_async(user_input: str, session: dict, targets=("reply",), **inputs):
+    """Async version of run_session_chat."""
+    ctx = await run_stages_async(
+        CHAT_STAGES,
+        {"user_input": user_input, "last_city": session.get("city"), **inputs},
+        targets=["intent"],
+    )
+    ctx.update(session_inputs(session, ctx["intent"], user_input))
+    ctx = await run_stages_async(CHAT_STAGES, ctx, targets=list(targets))
+    update_session(session, ctx)
+    return ctx
+
+
+def stream_reply(ctx):
+    """Yield the reply for a context from run_chat_data, piece by piece."""
+    reply = _reply_without_llm(ctx)
+    if reply is None and (ctx.get("reply_mode") or REPLY_MODE) == "template":
+        reply = _template_reply(ctx)
+    if reply is not None:
+        yield reply
+        return
+    try:
+        yield from build_llm_response_stream(**_reply_args(ctx))
+    except CircuitOpen:
+        # raised before the first piece, so the template reply can take its place
+        yield _template_reply(ctx)
+
+
+async def stream_reply_async(ctx):
+    """Async version of stream_reply."""
+    reply = _reply_without_llm(ctx)
+    if reply is None and (ctx.get("reply_mode") or REPLY_MODE) == "template":
+        reply = _template_reply(ctx)
+    if reply is not None:
+        yield reply
+        return
+    try:
+        async for piece in build_llm_response_stream_async(**_reply_args(ctx)):
+            yield piece
+    except CircuitOpen:
+        yield _template_reply(ctx)
+
+
+def city_intent(city, weather=False, places=False, mode=None, tag=None):
+    """A ready-made intent for callers that already know the city (no parsing)."""
+    return {
+        "city": city,
+        "want_weather": weather,
+        "want_places": places,
+        "fetch_weather": weather,
+        "fetch_places": places,
+        "mode": mode,
+        "tag": tag,
+    }
+
+
+def run_weather(city, mode=None):
+    """Geocode + forecast for a known city. Returns the context (coords, forecast, weather)."""
+    return run_stages(CHAT_STAGES, {"intent": city_intent(city, weather=True, mode=mode)}, targets=["weather"])
+
+
+def run_weather_many(cities, mode=None):
+    """
+    Weather for several known cities: geocodes them in parallel, then fetches
+    every forecast in one upstream call. Returns a list of
+    {"city", "coords", "weather", "error"} in the order of `cities`: weather
+    is None for cities that could not be geocoded, and error says why when
+    the lookup failed rather than found nothing.
+    """
+    coords, errors = _geocode_many(cities)
+    found = [c for c in coords if c is not None]
+    started = time.perf_counter()
+    texts = iter(get_weather_many(found, mode))
+    record_timing("forecast", time.perf_counter() - started)
+    for city, c in zip(cities, coords):
+        if c is not None:
+            _name_cell(city, c)
+    return [
+        {"city": city, "coords": c, "weather": next(texts) if c is not None else None, "error": errors.get(city)}
+        for city, c in zip(cities, coords)
+    ]
+
+
+def rank_cities(cities, date, by="best", limit=10, **filters):
+    """
+    Rank cities by their forecast for `date` (YYYY-MM-DD), e.g. the warmest
+    and driest next Saturday. `cities` are geocoded and their forecasts
+    fetched like run_weather_many; cities=None ranks every cached forecast.
+    See ForecastStore.rank for `by` and the filters.
+    Returns (ranking, names of cities that were not found, {city: error}
+    for cities whose lookup failed). Bad `by`, `limit` or filters raise
+    ValueError before any city is looked up.
+    """
+    check_rank_args(by, limit, **filters)
+    if cities is None:
+        ranking = forecast_store.rank(date, None, by, limit, **filters)
+        for item in ranking:
+            cell = item.pop("cell")
+            item["city"] = item["city"] or f"{cell[0]},{cell[1]}"
+        return ranking, [], {}
+
+    coords, errors = _geocode_many(cities)
+    found = {city: c for city, c in zip(cities, coords) if c is not None}
+    started = time.perf_counter()
+    get_forecasts(list(found.values()))
+    record_timing("forecast", time.perf_counter() - started)
+
+    cells = {}
+    for city, c in found.items():
+        cells.setdefault(_name_cell(city, c), city)
+
+    ranking = forecast_store.rank(date, list(cells), by, limit, **filters)
+    for item in ranking:
+        item["city"] = cells[item.pop("cell")]
+    not_found = [city for city in cities if city not in found and city not in errors]
+    return ranking, not_found, errors
+
+
+def _geocode_many(cities):
+    """
+    Geocode `cities` in parallel; the time is recorded as the "coords" stage.
+    Returns (coords, errors): coords in the order of `cities` (None if not
+    found or failed) and {city: message} for the lookups that failed.
+    Only the first MAX_GEOCODE_LOOKUPS cities that need Nominatim are looked up.
+    """
+    started = time.perf_counter()
+    futures, errors = {}, {}
+    lookups = 0
+    for city in cities:
+        if cached_coordinates(city) is MISSING:
+            lookups += 1
+            if lookups > MAX_GEOCODE_LOOKUPS:
+                errors[city] = "Too many new cities in one request, try again shortly"
+                continue
+        futures[city] = _submit(get_coordinates, city)
+
+    coords = []
+    for city in cities:
+        try:
+            coords.append(futures[city].result() if city in futures else None)
+        except Exception as e:
+            coords.append(None)
+            errors[city] = "Could not look up the city, try again later"
+            log.warning("geocoding %r failed: %s", city, e)
+    record_timing("coords", time.perf_counter() - started)
+    return coords, errors
+
+
+def _name_cell(city, coords):
+    """Label the forecast store row of a city's grid cell; returns the cell."""
+    cell = grid_cell(*coords)
+    forecast_store.name(cell, city)
+    return cell
+
+
+def warm_city(city):
+    """Fill the geocode and forecast caches for a city (used by the refresher)."""
+    # not a user request: don't count it towards the hot cities
+    coords = get_coordinates(city, record=False)
+    if coords is not None:
+        get_forecast(*coords)
+        _name_cell(city, coords)
+
+
+def warm_places(city, tag=None, api_key=SERPAPI_KEY):
+    """Fill the places cache for a (city, tag) search (used by the refresher)."""
+    get_top_50_attractions(city, api_key, tag or "tourist attractions", record=False)
+
+
+def run_places(city, api_key=SERPAPI_KEY, tag=None):
+    """Places search for a known city. Returns the context (places)."""
+    return run_stages(
+        CHAT_STAGES,
+        {"intent": city_intent(city, places=True, tag=tag), "serpapi_key": api_key},
+        targets=["places"],
+    )
@@ -1,27 +1,238 @@
-from serpapi import GoogleSearch
+import base64
+import logging
+import os
+import time
 
-def get_top_50_attractions(city, api_key, tag="tourist attractions"):
+from cache import MISSING, SQLiteCache, TTLCache
+from city_names import format_city_name
+from http_clients import async_client, http_session
+from metrics import register_cache
+from ratelimit import serpapi_limiter
+from refresh import record_places, refresh_in_background
+from resilience import CircuitOpen, NotSent, guarded_call, guarded_call_async
+from singleflight import SingleFlight
+
+log = logging.getLogger(__name__)
+
+SERPAPI_URL = os.getenv("SERPAPI_URL", "https://serpapi.com/search.json")
+# longest a single SerpAPI search may take (less when the request deadline is closer)
+SERPAPI_TIMEOUT = float(os.getenv("SERPAPI_TIMEOUT", 20))
+
+# places change rarely, so they are kept for days
+PLACES_CACHE_TTL = float(os.getenv("PLACES_CACHE_TTL_DAYS", 7)) * 24 * 3600
+# stale results are served this much longer while they refresh in the background
+PLACES_STALE_TTL = float(os.getenv("PLACES_STALE_TTL_DAYS", 1)) * 24 * 3600
+PLACES_CACHE_SIZE = int(os.getenv("PLACES_CACHE_SIZE", 512))
+# optional: set a file path to keep the places cache across restarts
+PLACES_CACHE_PATH = os.getenv("PLACES_CACHE_PATH")
+# SerpAPI's google_maps engine returns 20 results per page (`start` = offset)
+SERPAPI_PAGE_SIZE = 20
+# paging stops here even if SerpAPI has more
+PLACES_MAX_RESULTS = int(os.getenv("PLACES_MAX_RESULTS", 120))
+PLACES_MAX_LIMIT = 50
+
+_places_cache = TTLCache(maxsize=PLACES_CACHE_SIZE, ttl=PLACES_CACHE_TTL + PLACES_STALE_TTL)
+_places_disk_cache = SQLiteCache(PLACES_CACHE_PATH, table="places") if PLACES_CACHE_PATH else None
+_places_flight = SingleFlight("places")
+register_cache("places", _places_cache)
+
+
+class PlacesError(Exception):
+    """
+    A SerpAPI search failed. The message is only the status code or error
+    type: requests' and httpx's own messages include the request URL, and
+    with it the API key.
+    """
+
+
+def places_cache_key(city, tag):
+    """Cache key for a (city, tag) search, e.g. "New Delhi|museum"."""
+    return f"{format_city_name(city)}|{tag.strip().lower()}"
+
+
+def get_top_50_attractions(city, api_key, tag="tourist attractions", record=True):
+    """
+    Fetches top 50 popular attractions using SerpAPI Google Maps Engine.
+
+    Results are cached process-wide per (city, tag), and on disk too when
+    PLACES_CACHE_PATH is set, so most calls never reach SerpAPI. Stale
+    results are returned while a background refresh replaces them.
+    record=False keeps the search out of the hot-search counts (warm-up).
+    Returns [] when the search fails (nothing is cached then).
+    """
+    if not api_key:
+        raise ValueError("API key is required")
+
+    tag = tag or "tourist attractions"
+    key = places_cache_key(city, tag)
+    if record:
+        record_places(city, tag)
+
+    result = _cached_places(key, city, api_key, tag)
+    if result is MISSING:
+        try:
+            result = _places_flight.do(key, search_places_page, city, api_key, tag)
+        except Exception as e:
+            log.warning("places search %r failed: %s", key, e)
+            return []
+        _store_places(key, result)
+
+    return _fill_places(result["places"][:50], city, tag)
+
+
+async def get_top_50_attractions_async(city, api_key, tag="tourist attractions"):
+    """Async version of get_top_50_attractions (same cache)."""
+    if not api_key:
+        raise ValueError("API key is required")
+
+    tag = tag or "tourist attractions"
+    key = places_cache_key(city, tag)
+    record_places(city, tag)
+
+    result = _cached_places(key, city, api_key, tag)
+    if result is MISSING:
+        try:
+            result = await _places_flight.do_async(key, search_places_page_async, city, api_key, tag)
+        except Exception as e:
+            log.warning("places search %r failed: %s", key, e)
+            return []
+        _store_places(key, result)
+
+    return _fill_places(result["places"][:50], city, tag)
+
+
+def get_top_5_attractions(city, api_key, tag="tourist attractions"):
+    """Top 5 attractions (first page of get_top_50_attractions)."""
+    return get_top_50_attractions(city, api_key, tag)[:5]
+
+
+def get_places_page(city, api_key, tag="tourist attractions", offset=0, limit=5):
     """
-    Fetches top 5 popular attractions using SerpAPI Google Maps Engine.
+    One page of the places for (city, tag).
+
+    Pages are sliced from one cached result set per (city, tag). When a page
+    goes past the cached results, the next SerpAPI page is fetched (`start`)
+    and appended to the set, so paging only costs an API call the first time
+    someone reaches new results.
+
+    Returns {"places", "offset", "limit", "next_offset"} (next_offset is None
+    on the last page). A failed search gives an empty page, like
+    get_top_50_attractions.
     """
     if not api_key:
         raise ValueError("API key is required")
 
     tag = tag or "tourist attractions"
+    key = places_cache_key(city, tag)
+    record_places(city, tag)
+    offset = max(0, int(offset))
+    limit = min(max(1, int(limit)), PLACES_MAX_LIMIT)
+    end = min(offset + limit, PLACES_MAX_RESULTS)
+
+    result = MISSING
+    try:
+        result = _cached_places(key, city, api_key, tag)
+        if result is MISSING:
+            result = _places_flight.do(key, search_places_page, city, api_key, tag)
+            _store_places(key, result)
+
+        while len(result["places"]) < end and result["next_start"] is not None:
+            start = result["next_start"]
+            page = _places_flight.do((key, start), search_places_page, city, api_key, tag, start)
+            result = _merge_page(result, page)
+            _store_places(key, result)
+    except Exception as e:
+        log.warning("places search %r from %d failed: %s", key, offset, e)
+        if not (result is not MISSING and len(result["places"]) > offset):
+            return {"places": [], "offset": offset, "limit": limit, "next_offset": None}
+
+    places = result["places"][offset:end]
+    more = end < PLACES_MAX_RESULTS and (len(result["places"]) > end or result["next_start"] is not None)
+    return {"places": places, "offset": offset, "limit": limit, "next_offset": end if more and places else None}
+
+
+def encode_cursor(offset):
+    """Opaque page cursor for an offset."""
+    return base64.urlsafe_b64encode(f"o:{offset}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Offset from encode_cursor(); raises ValueError for a malformed cursor."""
+    try:
+        text = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        prefix, offset = text.split(":", 1)
+        if prefix != "o" or int(offset) < 0:
+            raise ValueError
+        return int(offset)
+    except Exception:
+        raise ValueError(f"invalid cursor: {cursor!r}") from None
+
 
+def _merge_page(result, page):
+    """New result set with `page` appended (titles already in the set are skipped)."""
+    seen = set(result["places"])
+    return {
+        "places": result["places"] + [p for p in page["places"] if p not in seen],
+        "next_start": page["next_start"],
+        "fresh_until": result.get("fresh_until"),
+    }
+
+
+def _cached_places(key, city, api_key, tag):
+    result = _places_cache.get(key)
+    if result is MISSING and _places_disk_cache is not None:
+        result = _places_disk_cache.get(key)
+        if result is not MISSING:
+            _places_cache.set(key, result)
+    if result is MISSING:
+        return result
+    if isinstance(result, list):
+        # entry from before paging: first page only, no way to tell if there is more
+        result = {"places": result, "next_start": None}
+    if time.time() >= (result.get("fresh_until") or float("inf")):
+        # stale: answer now, refresh for the next caller
+        refresh_in_background(("places", key), refresh_places, city, api_key, tag)
+    return result
+
+
+def _store_places(key, result):
+    if not result.get("fresh_until"):
+        result = {**result, "fresh_until": time.time() + PLACES_CACHE_TTL}
+    _places_cache.set(key, result)
+    if _places_disk_cache is not None:
+        _places_disk_cache.set(key, result, PLACES_CACHE_TTL + PLACES_STALE_TTL)
+
+
+def refresh_places(city, api_key, tag):
+    """Refetch the first results page for (city, tag) and replace the cached set."""
+    key = places_cache_key(city, tag)
+    page = _places_flight.do(key, search_places_page, city, api_key, tag)
+    _store_places(key, page)
+
+
+def _fill_places(places, city, tag):
+    places = list(places)
+
+    # Fill missing entries
+    while len(places) < 5:
+        places.append(f"More {tag} available in {city}")
+
+    return places
+
+
+def _search_params(city, api_key, tag, start=0):
     params = {
         "engine": "google_maps",
         "q": f"{tag} in {city}",
         "type": "search",
         "api_key": api_key
     }
+    if start:
+        params["start"] = start
+    return params
 
-    try:
-        search = GoogleSearch(params)
-        results = search.get_dict()
-    except Exception as e:
-        return [f"Error fetching data: {e}"]
 
+def _parse_places(results):
     places = []
 
     local_results = results.get("local_results", [])
@@ -32,8 +243,65 @@ def get_top_50_attractions(city, api_key, tag="tourist attractions"):
         if len(places) == 50:
             break
 
-    # Fill missing entries
-    while len(places) < 5:
-        places.append(f"More {tag} available in {city}")
-
     return places
+
+
+def _parse_page(results, start):
+    """{"places", "next_start"} for one SerpAPI page (next_start None on the last page)."""
+    local_results = results.get("local_results", [])
+    has_next = bool(results.get("serpapi_pagination", {}).get("next")) or len(local_results) >= SERPAPI_PAGE_SIZE
+    return {
+        "places": _parse_places(results),
+        "next_start": start + len(local_results) if has_next and local_results else None,
+    }
+
+
+def search_places(city, api_key, tag):
+    """Run the SerpAPI search and return up to 50 place titles (no cache, waits for the rate limit)."""
+    return search_places_page(city, api_key, tag)["places"]
+
+
+async def search_places_async(city, api_key, tag):
+    """Async version of search_places."""
+    return (await search_places_page_async(city, api_key, tag))["places"]
+
+
+def _search_error(e):
+    """PlacesError for a failed search, without the URL (and API key) from `e`'s message."""
+    status = getattr(getattr(e, "response", None), "status_code", None)
+    return PlacesError(f"SerpAPI returned HTTP {status}" if status else f"SerpAPI search failed: {type(e).__name__}")
+
+
+def search_places_page(city, api_key, tag, start=0):
+    """
+    One SerpAPI results page from offset `start` as {"places", "next_start"}
+    (no cache). Raises PlacesError (or CircuitOpen / NotSent) on failure.
+    """
+    def attempt(timeout):
+        response = http_session().get(SERPAPI_URL, params=_search_params(city, api_key, tag, start), timeout=timeout)
+        response.raise_for_status()
+        return _parse_page(response.json(), start)
+
+    try:
+        return guarded_call("serpapi", attempt, SERPAPI_TIMEOUT, serpapi_limiter)
+    except (CircuitOpen, NotSent):
+        raise
+    except Exception as e:
+        raise _search_error(e) from None
+
+
+async def search_places_page_async(city, api_key, tag, start=0):
+    """Async version of search_places_page."""
+    async def attempt(timeout):
+        response = await async_client(SERPAPI_URL).get(
+            SERPAPI_URL, params=_search_params(city, api_key, tag, start), timeout=timeout
+        )
+        response.raise_for_status()
+        return _parse_page(response.json(), start)
+
+    try:
+        return await guarded_call_async("serpapi", attempt, SERPAPI_TIMEOUT, serpapi_limiter)
+    except (CircuitOpen, NotSent):
+        raise
+    except Exception as e:
+        raise _search_error(e) from None
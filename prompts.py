@@ -0,0 +1,184 @@
+# prompts.py
+"""
+Compact prompts for build_llm_response.
+
+The full prompt (app.RESPONSE_SYSTEM_PROMPT) sends all three examples and
+every rule on each call, and the weather as free text. On CPU-only Ollama the
+prompt-eval time grows with the token count, so the compact prompt:
+
+- picks one reply shape from the intent (weather, places or both) and sends
+  only that shape's example and rules; there are three fixed system prompts,
+  so Ollama can still reuse each one's cached prefix;
+- sends weather and places as short structured lines instead of prose;
+- stays within PROMPT_TOKEN_BUDGET (estimated tokens) by trimming, in
+  order: the example, forecast days beyond 3, places beyond 3.
+
+PROMPT_STYLE=full switches back to the full prompt, for comparing the two.
+"""
+import os
+import threading
+
+PROMPT_STYLE = os.getenv("PROMPT_STYLE", "compact")
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", 400))
+
+# roughly 4 characters per token for English text with llama-style tokenizers
+CHARS_PER_TOKEN = 4
+
+HEADER = "You are a travel assistant. Answer the user with the data given, in the style of the example."
+
+EXAMPLES = {
+    "places": """Example:
+Input: I'm going to Bangalore, let's plan my trip.
+Output:
+In Bangalore these are the places you can go,
+- Lalbagh
+- Bangalore palace
+- Bannerghatta National Park""",
+    "weather": """Example:
+Input: I'm going to Bangalore, what is the temperature there
+Output:
+In Bangalore it's currently 24°C with a chance of 35% to rain.""",
+    "both": """Example:
+Input: I'm going to Bangalore, what is the temperature there? And what can I visit?
+Output:
+In Bangalore it's currently 24°C with a chance of 35% to rain. And these are the places you can go:
+- Lalbagh
+- Bangalore palace""",
+}
+
+COMMON_RULES = [
+    "Use only the data given. Do not change any numbers or place names.",
+    "No notes, explanations or comments about missing data.",
+    "Keep it short and friendly.",
+]
+SHAPE_RULES = {
+    "places": ["Answer only with the places, as '- ' bullets."],
+    "weather": [
+        "Answer only about the weather.",
+        "Present tense for 'now' weather; future tense ('will be', 'is expected to be') for forecasts.",
+    ],
+    "both": [
+        "One weather sentence, then the places as '- ' bullets.",
+        "Present tense for 'now' weather; future tense ('will be', 'is expected to be') for forecasts.",
+    ],
+}
+
+_lock = threading.Lock()
+_stats = {}  # style -> {"prompts", "tokens", "trimmed"}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of `text` (no tokenizer needed)."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def reply_shape(want_weather: bool, want_places: bool) -> str:
+    """"weather", "places" or "both"; a vague request counts as places."""
+    if want_weather and want_places:
+        return "both"
+    if want_weather:
+        return "weather"
+    return "places"
+
+
+def system_prompt(shape: str, example: bool = True) -> str:
+    rules = "\n".join(f"- {rule}" for rule in COMMON_RULES + SHAPE_RULES[shape])
+    parts = [HEADER, EXAMPLES[shape]] if example else [HEADER]
+    return "\n\n".join(parts + ["Rules:\n" + rules])
+
+
+def compact_weather(weather_facts, weather_text, max_days=None) -> str | None:
+    """One line per weather fact ("now: 24°C, wind 5 km/h, rain 35%")."""
+    if weather_facts is None:
+        # no structured data (e.g. an error message): the text on one line
+        return " ".join(weather_text.split()) if weather_text else None
+
+    kind = weather_facts["kind"]
+    if kind == "current":
+        line = f"now: {weather_facts['temperature']}°C, wind {weather_facts['wind']} km/h"
+        if weather_facts.get("rain") is not None:
+            line += f", rain {weather_facts['rain']}%"
+        return line
+    if kind == "day":
+        label = f" ({weather_facts['label']})" if weather_facts.get("label") else ""
+        return (
+            f"forecast {weather_facts['date']}{label}: "
+            f"{weather_facts['min']}-{weather_facts['max']}°C, rain {weather_facts['rain']}%"
+        )
+    days = weather_facts["days"][:max_days] if max_days else weather_facts["days"]
+    return "forecast:\n" + "\n".join(f"{d['date']}: {d['min']}-{d['max']}°C, rain {d['rain']}%" for d in days)
+
+
+def _data_message(user_input, city, shape, weather, places):
+    lines = [f"Input: {user_input}", f"City: {city}"]
+    if shape != "places":
+        lines.append(f"Weather: {weather or 'none'}")
+    if shape != "weather":
+        lines.append("Places:\n" + ("\n".join(f"- {p}" for p in places) if places else "none"))
+    return "\n".join(lines)
+
+
+def build_reply_messages(
+    user_input, city, want_weather, want_places, weather_text, places, weather_facts=None, budget=None,
+):
+    """
+    Compact chat messages for build_llm_response (same arguments, plus the
+    structured weather_facts when the caller has them).
+    Returns (messages, estimated prompt tokens).
+    """
+    budget = budget or PROMPT_TOKEN_BUDGET
+    shape = reply_shape(want_weather, want_places)
+    places = list(places or [])
+
+    example = True
+    max_days = None
+    trimmed = False
+    while True:
+        system = system_prompt(shape, example)
+        data = _data_message(user_input, city, shape, compact_weather(weather_facts, weather_text, max_days), places)
+        tokens = estimate_tokens(system) + estimate_tokens(data)
+        if tokens <= budget:
+            break
+        # over budget: drop the least useful part and try again
+        if example:
+            example = False
+        elif weather_facts and weather_facts["kind"] == "range" and (max_days or 99) > 3:
+            max_days = 3
+        elif len(places) > 3:
+            places = places[:3]
+        else:
+            break  # only the request itself is left
+        trimmed = True
+
+    record_prompt("compact", tokens, trimmed)
+    return [{"role": "system", "content": system}, {"role": "user", "content": data}], tokens
+
+
+def system_prompts() -> list:
+    """Every compact system prompt (for warming Ollama's prefix cache)."""
+    return [system_prompt(shape) for shape in EXAMPLES]
+
+
+def record_prompt(style: str, tokens: int, trimmed: bool = False):
+    with _lock:
+        stats = _stats.setdefault(style, {"prompts": 0, "tokens": 0, "trimmed": 0})
+        stats["prompts"] += 1
+        stats["tokens"] += tokens
+        stats["trimmed"] += trimmed
+
+
+def prompt_stats() -> dict:
+    """Per prompt style: prompts built, average estimated tokens, how many were trimmed."""
+    with _lock:
+        return {
+            "style": PROMPT_STYLE,
+            "budget": PROMPT_TOKEN_BUDGET,
+            **{
+                style: {
+                    "prompts": s["prompts"],
+                    "avg_tokens": round(s["tokens"] / s["prompts"], 1),
+                    "trimmed": s["trimmed"],
+                }
+                for style, s in _stats.items()
+            },
+        }
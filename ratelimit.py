@@ -0,0 +1,210 @@
+# ratelimit.py
+"""
+Token-bucket rate limits for upstream APIs (Nominatim, SerpAPI).
+
+Each bucket lives in a small file under CACHE_DIR and is updated under an
+exclusive file lock, so every worker process on the host shares the same
+budget. Interactive callers reserve the next free token and sleep until it
+is due, which queues them in arrival order (a call that could not start
+before the request's deadline fails right away). Background callers (cache
+refresh, warm-up) only take a token that is free right now and nobody
+interactive is waiting for, so they never delay a user request.
+
+Use `with background_priority():` around background work.
+"""
+import asyncio
+import contextvars
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+from cache import cache_path
+from resilience import DeadlineExceeded, NotSent, remaining
+
+try:
+    import fcntl
+except ImportError:  # Windows: the budget is per process only
+    fcntl = None
+
+NOMINATIM_RATE = float(os.getenv("NOMINATIM_RATE", 1))   # requests per second (usage policy)
+NOMINATIM_BURST = float(os.getenv("NOMINATIM_BURST", 1))
+SERPAPI_RATE = float(os.getenv("SERPAPI_RATE", 1))
+SERPAPI_BURST = float(os.getenv("SERPAPI_BURST", 5))
+# never queue a call for longer than this; fail instead
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", 30))
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+_priority = contextvars.ContextVar("upstream_priority", default=INTERACTIVE)
+_STATE = struct.Struct("dd")  # tokens, updated_at
+
+_limiters = {}  # name -> RateLimiter
+
+
+class RateLimited(NotSent):
+    """Raised when a call would have to wait longer than RATE_LIMIT_MAX_WAIT."""
+
+
+@contextmanager
+def background_priority():
+    """Run upstream calls in this block (and this thread/task) as background."""
+    token = _priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class RateLimiter:
+    """A token bucket shared by all processes through a lock file."""
+
+    def __init__(self, name: str, rate: float, burst: float, path: str | None = None):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.path = path or cache_path(f"ratelimit-{name}.bin")
+        self._lock = threading.Lock()
+        self._fd = None
+        self._pid = None
+        self._local_state = (burst, time.time())
+        self.calls = 0
+        self.delayed = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.interactive_waiting = 0
+        _limiters[name] = self
+
+    # ---------- shared state ----------
+
+    def _file(self):
+        if self._fd is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._pid = os.getpid()
+        return self._fd
+
+    def _update(self, change):
+        """Apply change(tokens, now) -> (tokens, result) atomically; return result."""
+        with self._lock:
+            now = time.time()
+            if fcntl is None:
+                tokens, updated = self._local_state
+            else:
+                fd = self._file()
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                if fcntl is not None:
+                    raw = os.pread(fd, _STATE.size, 0)
+                    tokens, updated = _STATE.unpack(raw) if len(raw) == _STATE.size else (self.burst, now)
+
+                tokens = min(self.burst, tokens + (now - updated) * self.rate)
+                tokens, result = change(tokens)
+
+                if fcntl is None:
+                    self._local_state = (tokens, now)
+                else:
+                    os.pwrite(fd, _STATE.pack(tokens, now), 0)
+                return result
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def _reserve(self, max_wait):
+        """Reserve the next token; return seconds to wait for it (None if over max_wait)."""
+        def change(tokens):
+            wait = max(0.0, (1 - tokens) / self.rate)
+            if wait > max_wait:
+                return tokens, None
+            return tokens - 1, wait
+        return self._update(change)
+
+    def _take_if_free(self):
+        """Take a token only if one is free now; else return seconds until one might be."""
+        def change(tokens):
+            if tokens >= 1 and not self.interactive_waiting:
+                return tokens - 1, 0.0
+            return tokens, max(1 - tokens, 0.1) / self.rate
+        return self._update(change)
+
+    # ---------- public ----------
+
+    def _interactive_wait(self) -> float:
+        left = remaining()
+        max_wait = RATE_LIMIT_MAX_WAIT if left is None else min(RATE_LIMIT_MAX_WAIT, max(left, 0.0))
+        wait = self._reserve(max_wait)
+        if wait is None:
+            self.rejected += 1
+            if max_wait < RATE_LIMIT_MAX_WAIT:
+                raise DeadlineExceeded(f"{self.name} rate limit: no slot before the request deadline")
+            raise RateLimited(f"{self.name} rate limit: queue is longer than {RATE_LIMIT_MAX_WAIT}s")
+        return wait
+
+    def _waiting(self, delta: int):
+        with self._lock:
+            self.interactive_waiting += delta
+
+    def acquire(self):
+        """Block until this caller may send one request."""
+        self.calls += 1
+        if _priority.get() == BACKGROUND:
+            waited = 0.0
+            while (wait := self._take_if_free()) > 0:
+                time.sleep(wait)
+                waited += wait
+            self._record(waited)
+            return
+
+        wait = self._interactive_wait()
+        if wait > 0:
+            self._waiting(1)
+            try:
+                time.sleep(wait)
+            finally:
+                self._waiting(-1)
+        self._record(wait)
+
+    async def acquire_async(self):
+        """Async version of acquire."""
+        self.calls += 1
+        if _priority.get() == BACKGROUND:
+            waited = 0.0
+            while (wait := self._take_if_free()) > 0:
+                await asyncio.sleep(wait)
+                waited += wait
+            self._record(waited)
+            return
+
+        wait = self._interactive_wait()
+        if wait > 0:
+            self._waiting(1)
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self._waiting(-1)
+        self._record(wait)
+
+    def _record(self, waited):
+        if waited > 0:
+            self.delayed += 1
+            self.wait_total += waited
+
+    def stats(self) -> dict:
+        return {
+            "rate_per_sec": self.rate,
+            "calls": self.calls,
+            "delayed": self.delayed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.wait_total / self.delayed * 1000, 1) if self.delayed else 0.0,
+            "interactive_waiting": self.interactive_waiting,
+        }
+
+
+def rate_limit_stats() -> dict:
+    return {name: limiter.stats() for name, limiter in _limiters.items()}
+
+
+nominatim_limiter = RateLimiter("nominatim", NOMINATIM_RATE, NOMINATIM_BURST)
+serpapi_limiter = RateLimiter("serpapi", SERPAPI_RATE, SERPAPI_BURST)
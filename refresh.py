@@ -0,0 +1,150 @@
+# refresh.py
+"""
+Background cache refresh (stale-while-revalidate) and warm-up of hot cities.
+
+Caches keep entries for a grace period after they go stale. A lookup that
+finds a stale entry returns it right away and calls refresh_in_background(),
+which refetches it on a small worker pool at background rate-limit priority,
+so the user never waits for the upstream call.
+
+Lookups also count which cities (and place searches) are requested most.
+start_refresher() warms WARM_CITIES at startup and then re-warms them and the
+hottest cities every REFRESH_INTERVAL seconds, so popular cities stay cached.
+"""
+import logging
+import os
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from city_names import format_city_name
+from ratelimit import background_priority
+
+log = logging.getLogger(__name__)
+
+# comma-separated cities to warm at startup, e.g. "Paris,London,Tokyo"
+WARM_CITIES = [c.strip() for c in os.getenv("WARM_CITIES", "").split(",") if c.strip()]
+REFRESH_ENABLED = os.getenv("REFRESH_ENABLED", "1") != "0"
+REFRESH_INTERVAL = float(os.getenv("REFRESH_INTERVAL", 600))
+# how many of the most requested cities are kept warm
+REFRESH_TOP_N = int(os.getenv("REFRESH_TOP_N", 20))
+REFRESH_WORKERS = int(os.getenv("REFRESH_WORKERS", 2))
+
+_executor = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix="refresh")
+_inflight = set()
+_lock = threading.Lock()
+_stats = {"scheduled": 0, "refreshed": 0, "failed": 0, "warm_runs": 0}
+
+
+class HotKeys:
+    """Request counts per key, bounded: old counts decay as new keys arrive."""
+
+    def __init__(self, maxsize: int = 1000):
+        self.maxsize = maxsize
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, key):
+        with self._lock:
+            self._counts[key] += 1
+            if len(self._counts) > 2 * self.maxsize:
+                # keep the top keys and halve their counts so new favourites can catch up
+                self._counts = Counter({k: c // 2 for k, c in self._counts.most_common(self.maxsize) if c > 1})
+
+    def top(self, n: int):
+        with self._lock:
+            return [key for key, _ in self._counts.most_common(n)]
+
+    def __len__(self):
+        return len(self._counts)
+
+
+hot_cities = HotKeys()
+hot_places = HotKeys()  # (city, tag)
+
+
+def record_city(city):
+    hot_cities.record(format_city_name(city))
+
+
+def record_places(city, tag):
+    hot_places.record((format_city_name(city), tag))
+
+
+def refresh_in_background(key, fn, *args):
+    """
+    Run fn(*args) on the refresh pool unless a refresh for `key` is already
+    queued or running. Errors are logged; the stale entry stays in place.
+    """
+    with _lock:
+        if key in _inflight:
+            return
+        _inflight.add(key)
+        _stats["scheduled"] += 1
+    _executor.submit(_run, key, fn, *args)
+
+
+def _run(key, fn, *args):
+    try:
+        with background_priority():
+            fn(*args)
+        _stats["refreshed"] += 1
+    except Exception as e:
+        _stats["failed"] += 1
+        log.warning("refresh of %r failed: %s", key, e)
+    finally:
+        with _lock:
+            _inflight.discard(key)
+
+
+def warm(warm_city, warm_places, cities=(), top_n=REFRESH_TOP_N):
+    """
+    Warm `cities` plus the hottest cities and place searches, at background
+    priority. warm_city(city) and warm_places(city, tag) fill the caches.
+    """
+    _stats["warm_runs"] += 1
+    cities = [format_city_name(c) for c in cities]
+    city_targets = dict.fromkeys(cities + hot_cities.top(top_n))
+    # tag None = the default search
+    places_targets = dict.fromkeys([(c, None) for c in cities] + hot_places.top(top_n))
+    with background_priority():
+        for city in city_targets:
+            try:
+                warm_city(city)
+            except Exception as e:
+                log.warning("warm-up of %s failed: %s", city, e)
+        for city, tag in places_targets:
+            try:
+                warm_places(city, tag)
+            except Exception as e:
+                log.warning("warm-up of %s places failed: %s", city, e)
+
+
+def start_refresher(warm_city, warm_places, cities=None, interval=REFRESH_INTERVAL):
+    """
+    Start a daemon thread that warms `cities` (default WARM_CITIES) and the
+    hottest cities now, then again every `interval` seconds. Returns a
+    threading.Event that stops the loop when set.
+    """
+    stop = threading.Event()
+    if not REFRESH_ENABLED:
+        return stop
+
+    cities = WARM_CITIES if cities is None else cities
+
+    def loop():
+        warm(warm_city, warm_places, cities)
+        while not stop.wait(interval):
+            warm(warm_city, warm_places, cities)
+
+    threading.Thread(target=loop, name="refresher", daemon=True).start()
+    return stop
+
+
+def refresh_stats() -> dict:
+    return {
+        **_stats,
+        "inflight": len(_inflight),
+        "hot_cities": hot_cities.top(10),
+        "tracked_cities": len(hot_cities),
+    }
@@ -0,0 +1,120 @@
+# replies.py
+"""
+Template replies for /chat.
+
+build_llm_response's answers follow a few fixed shapes (see its examples):
+a weather sentence, a bullet list of places, or both. render_reply()
+builds those shapes straight from the fetched data, so a turn can be
+answered without any model call. REPLY_MODE picks the default engine
+("llm" or "template"); callers can override it per request.
+"""
+import os
+import zlib
+from datetime import datetime
+
+REPLY_MODE = os.getenv("REPLY_MODE", "llm")
+
+CURRENT_VARIANTS = [
+    "In {city} it's currently {temperature}°C with a chance of {rain}% to rain.",
+    "Right now it's {temperature}°C in {city}, with a {rain}% chance of rain.",
+    "It's {temperature}°C in {city} at the moment and there's a {rain}% chance of rain.",
+]
+CURRENT_NO_RAIN_VARIANTS = [
+    "In {city} it's currently {temperature}°C with winds of {wind} km/h.",
+    "Right now it's {temperature}°C in {city}, with winds of {wind} km/h.",
+]
+DAY_VARIANTS = [
+    "In {city} {when} it is expected to be between {min}°C and {max}°C with a {rain}% chance of rain.",
+    "{When} in {city} you can expect {min}°C to {max}°C, with a {rain}% chance of rain.",
+    "The weather in {city} {when} will be between {min}°C and {max}°C, and there is a {rain}% chance of rain.",
+]
+RANGE_INTRO_VARIANTS = [
+    "Here's what to expect in {city} over the next 7 days:",
+    "The forecast for {city} for the next 7 days is expected to be:",
+]
+PLACES_VARIANTS = [
+    "In {city} these are the places you can go,",
+    "Here are some places you can visit in {city}:",
+    "These are the top places to visit in {city}:",
+]
+BOTH_PLACES_VARIANTS = [
+    "And these are the places you can go:",
+    "And here are some places you can visit:",
+]
+NO_WEATHER = "I couldn't fetch the weather for {city}."
+NO_PLACES = "I couldn't find places to visit in {city}."
+# entries older places lookups returned in place of results when SerpAPI failed
+ERROR_PREFIX = "Error fetching data"
+
+
+def _pick(variants, seed):
+    return variants[seed % len(variants)]
+
+
+def _day_name(date: str) -> str:
+    """2026-10-19 -> Monday, October 19"""
+    return datetime.strptime(date, "%Y-%m-%d").strftime("%A, %B %d").replace(" 0", " ")
+
+
+def _when(date: str, label: str | None) -> str:
+    return label or "on " + _day_name(date)
+
+
+def weather_sentence(city: str, facts: dict | None, seed: int = 0) -> str:
+    """One weather sentence (present tense for now, future tense otherwise)."""
+    if facts is None:
+        return NO_WEATHER.format(city=city)
+
+    if facts["kind"] == "current":
+        if facts["rain"] is None:
+            return _pick(CURRENT_NO_RAIN_VARIANTS, seed).format(city=city, **facts)
+        return _pick(CURRENT_VARIANTS, seed).format(city=city, **facts)
+
+    if facts["kind"] == "day":
+        when = _when(facts["date"], facts["label"])
+        return _pick(DAY_VARIANTS, seed).format(city=city, when=when, When=when[0].upper() + when[1:], **facts)
+
+    lines = [_pick(RANGE_INTRO_VARIANTS, seed).format(city=city)]
+    for day in facts["days"]:
+        lines.append(f"- {_day_name(day['date'])}: {day['min']}°C to {day['max']}°C, {day['rain']}% chance of rain")
+    return "\n".join(lines)
+
+
+def render_reply(
+    user_input: str,
+    city: str,
+    want_weather: bool,
+    want_places: bool,
+    weather: dict | None,
+    places: list[str] | None,
+    variant: int | None = None,
+) -> str:
+    """
+    Build the final answer without the LLM, following the same rules as
+    build_llm_response: weather only, places only, or weather + places.
+    `weather` is the dict from weather.weather_facts. The phrasing variant
+    is derived from the message unless `variant` is given.
+    """
+    seed = zlib.crc32(f"{city}|{user_input}".encode()) if variant is None else variant
+    places = [p for p in places or [] if not p.startswith(ERROR_PREFIX)]
+
+    # vague input -> assume they want places
+    if not want_weather and not want_places:
+        want_places = bool(places)
+        want_weather = not want_places
+
+    bullets = "\n".join(f"- {p}" for p in places)
+
+    if want_places and not want_weather:
+        if not bullets:
+            return NO_PLACES.format(city=city)
+        return f"{_pick(PLACES_VARIANTS, seed).format(city=city)}\n{bullets}"
+
+    sentence = weather_sentence(city, weather, seed)
+    if not want_places:
+        return sentence
+    # a range forecast ends in a list line: start the places on their own line
+    separator = "\n" if "\n" in sentence else " "
+    if not bullets:
+        return f"{sentence}{separator}{NO_PLACES.format(city=city)}"
+    return f"{sentence}{separator}{_pick(BOTH_PLACES_VARIANTS, seed)}\n{bullets}"
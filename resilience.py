@@ -0,0 +1,446 @@
+# resilience.py
+"""
+Request deadlines, circuit breakers and hedged requests for upstream calls.
+
+- Deadline: each request gets REQUEST_DEADLINE seconds (start_deadline()).
+  It is kept in a context variable, so every upstream call made for the
+  request, on any pipeline thread or task, uses the time that is left as
+  its timeout (upstream_timeout()) and a call that would start after the
+  deadline raises DeadlineExceeded instead.
+- Circuit breaker, one per upstream: after BREAKER_FAILURES failures in a
+  row the upstream is "open" and calls fail at once with CircuitOpen, so
+  callers fall back to cached data (stale forecasts and places, the
+  gazetteer) without waiting on a provider that is down. After
+  BREAKER_RESET seconds one trial call is let through; it closes the
+  breaker again if it succeeds.
+- Hedging, for the upstreams in HEDGE_UPSTREAMS: when a call runs longer
+  than the upstream's recent p95 latency, a second identical request is
+  sent. The first request runs in the caller's thread (or task), only the
+  hedge goes to the hedge pool, and at most HEDGE_BUDGET of the calls are
+  hedged, so a saturated service doesn't double its upstream traffic.
+  Only idempotent GETs are wrapped. The default is Open-Meteo only:
+  Nominatim's usage policy allows one request per second and SerpAPI
+  bills every search, so hedging them is opt-in.
+
+Use guarded_call() / guarded_call_async() around single requests and
+`with guarded(name):` around calls that cannot be repeated (LLM streams).
+"""
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from metrics import BREAKER_REJECTIONS, UPSTREAM_HEDGES, upstream_call
+
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", 30))
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", 5))
+BREAKER_RESET = float(os.getenv("BREAKER_RESET", 30))
+# comma-separated upstream names, e.g. "open_meteo,nominatim"; "" disables hedging
+HEDGE_UPSTREAMS = {u.strip() for u in os.getenv("HEDGE_UPSTREAMS", "open_meteo").split(",") if u.strip()}
+HEDGE_WORKERS = int(os.getenv("HEDGE_WORKERS", 32))
+# share of an upstream's calls that may be hedged, and how many unused hedges can be saved up
+HEDGE_BUDGET = float(os.getenv("HEDGE_BUDGET", 0.05))
+HEDGE_BUDGET_MAX = 10
+# hedge only once the p95 is based on this many calls, and never sooner than HEDGE_MIN_DELAY
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY = 0.05
+# successful call latencies kept per upstream for the p95
+LATENCY_WINDOW = 200
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+_deadline = contextvars.ContextVar("request_deadline", default=None)
+_executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="hedge")
+_upstreams = {}  # name -> Upstream
+_lock = threading.Lock()
+_stats = {"deadlines_exceeded": 0}
+_NOT_SENT = object()  # a hedge that was not needed or not in the budget
+
+
+class NotSent(Exception):
+    """
+    Base for errors raised before a request reached the upstream (our own
+    rate limit, the request deadline): they say nothing about its health.
+    """
+
+
+class DeadlineExceeded(NotSent):
+    """Raised when the request's deadline has passed before an upstream call."""
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling an upstream whose circuit breaker is open."""
+
+    def __init__(self, upstream: str, retry_after: int):
+        super().__init__(f"{upstream} is unavailable, retry in {retry_after}s")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+# ---------- DEADLINES ----------
+
+def start_deadline(seconds: float = REQUEST_DEADLINE) -> float:
+    """Give the current request `seconds` from now; returns the deadline (time.monotonic())."""
+    deadline = time.monotonic() + seconds
+    _deadline.set(deadline)
+    return deadline
+
+
+def remaining() -> float | None:
+    """Seconds left before the current request's deadline, or None without one."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def upstream_timeout(max_timeout: float) -> float:
+    """
+    Timeout for an upstream call: `max_timeout`, cut to what is left of the
+    request's deadline. Raises DeadlineExceeded if nothing is left.
+    """
+    left = remaining()
+    if left is None:
+        return max_timeout
+    if left <= 0:
+        _stats["deadlines_exceeded"] += 1
+        raise DeadlineExceeded("request deadline exceeded")
+    return min(left, max_timeout)
+
+
+def _deadline_passed() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+# ---------- CIRCUIT BREAKER ----------
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half open (one trial call) -> closed."""
+
+    def __init__(self, name: str, failures: int = BREAKER_FAILURES, reset_after: float = BREAKER_RESET):
+        self.name = name
+        self.failures = failures
+        self.reset_after = reset_after
+        self.state = CLOSED
+        self._lock = threading.Lock()
+        self._failed = 0  # in a row
+        self._opened_at = 0.0
+        self._trial = False  # a half-open trial call is running
+        self.opened = 0
+        self.rejected = 0
+
+    def retry_after(self) -> int:
+        return max(1, round(self._opened_at + self.reset_after - time.monotonic()))
+
+    def allow(self):
+        """Return if a call may go ahead, else raise CircuitOpen."""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.reset_after:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._trial:
+                self._trial = True
+                return
+            self.rejected += 1
+        BREAKER_REJECTIONS.inc(self.name)
+        raise CircuitOpen(self.name, self.retry_after())
+
+    def success(self):
+        with self._lock:
+            self.state = CLOSED
+            self._failed = 0
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self._failed += 1
+            self._trial = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self._failed >= self.failures):
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+                self.opened += 1
+
+    def release(self):
+        """End a call that says nothing about the upstream's health (e.g. the deadline ran out)."""
+        with self._lock:
+            self._trial = False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "failures_in_a_row": self._failed,
+                "opened": self.opened,
+                "rejected": self.rejected,
+            }
+
+
+def _is_upstream_failure(exc: Exception) -> bool:
+    """
+    Timeouts, connection errors and 5xx/429 count; other 4xx are the
+    caller's fault, and NotSent errors never reached the upstream.
+    """
+    if isinstance(exc, NotSent):
+        return False
+    # requests / httpx errors carry the response, ollama.ResponseError the status
+    status = getattr(getattr(exc, "response", None), "status_code", None) or getattr(exc, "status_code", None)
+    return not (status is not None and 400 <= status < 500 and status != 429)
+
+
+# ---------- UPSTREAMS ----------
+
+class Upstream:
+    """Breaker, recent latencies and hedge counts of one upstream API."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.breaker = CircuitBreaker(name)
+        self.hedge = name in HEDGE_UPSTREAMS
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.hedges_skipped = 0  # over budget
+        self._hedge_tokens = 0.0
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def observe(self, seconds: float):
+        self._latencies.append(seconds)
+
+    def p95(self) -> float | None:
+        latencies = sorted(self._latencies)
+        if len(latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return latencies[int(len(latencies) * 0.95)]
+
+    def hedge_delay(self) -> float | None:
+        """
+        Seconds after which to send a hedged request, or None to not hedge.
+        Called once per call: each call adds HEDGE_BUDGET to the hedge budget.
+        """
+        if not self.hedge:
+            return None
+        with self._lock:
+            self._hedge_tokens = min(HEDGE_BUDGET_MAX, self._hedge_tokens + HEDGE_BUDGET)
+        p95 = self.p95()
+        if p95 is None:
+            return None
+        delay = max(p95, HEDGE_MIN_DELAY)
+        left = remaining()
+        if left is not None and left <= delay:
+            return None  # a second request could not finish in time anyway
+        return delay
+
+    def take_hedge(self) -> bool:
+        """Spend one hedge from the budget; False (and no hedge) when it is used up."""
+        with self._lock:
+            if self._hedge_tokens < 1:
+                self.hedges_skipped += 1
+                return False
+            self._hedge_tokens -= 1
+            self.hedges += 1
+        UPSTREAM_HEDGES.inc(self.name)
+        return True
+
+    def stats(self) -> dict:
+        p95 = self.p95()
+        return {
+            **self.breaker.stats(),
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "hedging": self.hedge,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedges_skipped": self.hedges_skipped,
+        }
+
+
+def upstream(name: str) -> Upstream:
+    up = _upstreams.get(name)
+    if up is None:
+        with _lock:
+            up = _upstreams.setdefault(name, Upstream(name))
+    return up
+
+
+@contextmanager
+def guarded(name: str):
+    """
+    Run the block as one call to upstream `name`: fail fast while its
+    breaker is open, time it, and count its outcome in the breaker.
+    """
+    up = upstream(name)
+    up.breaker.allow()
+    started = time.perf_counter()
+    try:
+        with upstream_call(name):
+            yield
+    except Exception as e:
+        if _deadline_passed() or not _is_upstream_failure(e):
+            up.breaker.release()
+        else:
+            up.breaker.failure()
+        raise
+    except BaseException:
+        up.breaker.release()
+        raise
+    up.breaker.success()
+    up.observe(time.perf_counter() - started)
+
+
+def _attempt(up, attempt, max_timeout, limiter):
+    if limiter is not None:
+        limiter.acquire()
+    timeout = upstream_timeout(max_timeout)
+    started = time.perf_counter()
+    with upstream_call(up.name):
+        result = attempt(timeout)
+    up.observe(time.perf_counter() - started)
+    return result
+
+
+async def _attempt_async(up, attempt, max_timeout, limiter):
+    if limiter is not None:
+        await limiter.acquire_async()
+    timeout = upstream_timeout(max_timeout)
+    started = time.perf_counter()
+    with upstream_call(up.name):
+        result = await attempt(timeout)
+    up.observe(time.perf_counter() - started)
+    return result
+
+
+def _hedge(up, args, first_done, send_at):
+    """Hedge task: repeat the attempt at `send_at` unless the first one is done by then or the budget is spent."""
+    if first_done.wait(max(0.0, send_at - time.monotonic())) or not up.take_hedge():
+        return _NOT_SENT
+    return _attempt(up, *args)
+
+
+def _hedged(up, args, delay):
+    """
+    The first attempt runs in the caller's thread; the hedge waits on the
+    pool and is sent if the first attempt is still running after `delay`.
+    A thread can't give up on the request it is blocked in, so the first
+    attempt's answer is returned when it succeeds and the hedge's when it
+    fails (typically a timeout on a stuck connection).
+    """
+    first_done = threading.Event()
+    # hedge threads see the caller's deadline and rate-limit priority
+    hedge = _executor.submit(
+        contextvars.copy_context().run, _hedge, up, args, first_done, time.monotonic() + delay
+    )
+    try:
+        result = _attempt(up, *args)
+    except Exception as error:
+        first_done.set()
+        if hedge.cancel():
+            raise
+        try:
+            result = hedge.result()
+        except Exception:
+            raise error from None
+        if result is _NOT_SENT:
+            raise
+        up.hedge_wins += 1
+        return result
+    first_done.set()
+    hedge.cancel()
+    # a hedge already sent finishes in the background (bounded by its timeout)
+    return result
+
+
+async def _hedged_async(up, args, delay):
+    first = asyncio.ensure_future(_attempt_async(up, *args))
+    pending = {first}
+    try:
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if done or not up.take_hedge():
+            return await first
+
+        hedge = asyncio.ensure_future(_attempt_async(up, *args))
+        pending.add(hedge)
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    up.hedge_wins += task is hedge
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def _settle(up, error):
+    if error is None:
+        up.breaker.success()
+    elif _deadline_passed() or not _is_upstream_failure(error):
+        up.breaker.release()
+    else:
+        up.breaker.failure()
+
+
+def _raise_if_deadline(name, error):
+    """A timeout cut short by the request deadline is reported as DeadlineExceeded."""
+    if _deadline_passed() and not isinstance(error, DeadlineExceeded):
+        _stats["deadlines_exceeded"] += 1
+        raise DeadlineExceeded(f"request deadline exceeded waiting for {name}") from error
+
+
+def guarded_call(name: str, attempt, max_timeout: float, limiter=None):
+    """
+    Call upstream `name`: attempt(timeout) sends one request and returns the
+    result. The timeout is `max_timeout` cut to the request's deadline.
+    `limiter` (a RateLimiter) is acquired before every request, hedges included.
+    Raises CircuitOpen while the upstream's breaker is open.
+    """
+    up = upstream(name)
+    up.breaker.allow()
+    args = (attempt, max_timeout, limiter)
+    delay = up.hedge_delay()
+    try:
+        result = _hedged(up, args, delay) if delay is not None else _attempt(up, *args)
+    except Exception as e:
+        _settle(up, e)
+        _raise_if_deadline(name, e)
+        raise
+    except BaseException:
+        up.breaker.release()
+        raise
+    _settle(up, None)
+    return result
+
+
+async def guarded_call_async(name: str, attempt, max_timeout: float, limiter=None):
+    """Async version of guarded_call; attempt(timeout) is a coroutine function."""
+    up = upstream(name)
+    up.breaker.allow()
+    args = (attempt, max_timeout, limiter)
+    delay = up.hedge_delay()
+    try:
+        if delay is not None:
+            result = await _hedged_async(up, args, delay)
+        else:
+            result = await _attempt_async(up, *args)
+    except Exception as e:
+        _settle(up, e)
+        _raise_if_deadline(name, e)
+        raise
+    except BaseException:  # cancelled
+        up.breaker.release()
+        raise
+    _settle(up, None)
+    return result
+
+
+def resilience_stats() -> dict:
+    return {
+        "request_deadline_s": REQUEST_DEADLINE,
+        **_stats,
+        "upstreams": {name: up.stats() for name, up in sorted(_upstreams.items())},
+    }
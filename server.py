@@ -1,88 +1,186 @@
 # server.py
-from fastapi import FastAPI
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Literal, Optional
+
+from app import reply_cache_stats, warm_up_llm
+from city_names import format_city_name
+from gazetteer import get_gazetteer
+from http_clients import aclose_clients
+from intent import parse_stats
+from llm import LLMOverloaded, gate, llm_stats
+from metrics import (
+    CONTENT_TYPE, REQUEST_SECONDS, REQUESTS, render_metrics, server_timing_header, start_request_timings,
+)
+from pipeline import DATA_STAGES, run_session_chat_async, stream_reply_async, warm_city, warm_places
+from prompts import prompt_stats
+from ratelimit import rate_limit_stats
+from refresh import refresh_stats, start_refresher
+from resilience import CircuitOpen, DeadlineExceeded, resilience_stats, start_deadline
+from sessions import get_session, session_count
+from singleflight import singleflight_stats
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # load the model and its prompt prefixes, and the city index, before the first request
+    await asyncio.to_thread(warm_up_llm)
+    await asyncio.to_thread(get_gazetteer)
+    # warm WARM_CITIES and keep the hottest cities cached
+    stop_refresher = start_refresher(warm_city, warm_places)
+    yield
+    stop_refresher.set()
+    await aclose_clients()
+
+
+app = FastAPI(title="Travel Assistant API", lifespan=lifespan)
+
+
+@app.middleware("http")
+async def timing_middleware(request: Request, call_next):
+    # stage timings recorded by the pipeline during this request
+    timings = start_request_timings()
+    # every upstream call made for this request shares one deadline
+    start_deadline()
+    started = time.perf_counter()
+    response = await call_next(request)
+    total = time.perf_counter() - started
+
+    route = request.scope.get("route")
+    endpoint = route.path if route is not None else "other"
+    REQUEST_SECONDS.observe(endpoint, total)
+    REQUESTS.inc(endpoint, str(response.status_code))
+    response.headers["Server-Timing"] = server_timing_header(timings, total)
+    return response
+
+
+@app.exception_handler(LLMOverloaded)
+async def llm_overloaded_handler(request: Request, exc: LLMOverloaded):
+    # shed load quickly instead of letting requests pile up behind Ollama
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(CircuitOpen)
+async def circuit_open_handler(request: Request, exc: CircuitOpen):
+    # an upstream is down and there was no cached data to answer with
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 
-from app import parse_input, build_llm_response, MODEL_NAME, SERPAPI_KEY
-from weather import get_weather
-from coordinates import get_coordinates
-from places import get_top_5_attractions
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded_handler(request: Request, exc: DeadlineExceeded):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
 
-app = FastAPI(title="Travel Assistant API")
 
 class ChatRequest(BaseModel):
     message: str
     last_city: Optional[str] = None
+    # "llm" or "template"; None uses the REPLY_MODE setting
+    reply_mode: Optional[Literal["llm", "template"]] = None
+    # from a previous ChatResponse; the server then remembers the city and its data
+    session_id: Optional[str] = None
 
 class ChatResponse(BaseModel):
     reply: str
     city: Optional[str] = None
+    session_id: Optional[str] = None
+
+
+def _session(body: ChatRequest):
+    session_id, session = get_session(body.session_id)
+    if body.last_city and not session.get("city"):
+        # clients that still send last_city
+        session["city"] = format_city_name(body.last_city)
+    return session_id, session
 
 
 @app.post("/chat", response_model=ChatResponse)
-def chat_endpoint(body: ChatRequest):
-    user_input = body.message
-    last_city = body.last_city
-
-    # 1. Parse intent
-    city, want_weather, want_places = parse_input(user_input, last_city)
-
-    # If no city now, reuse previous city
-    if city is None and last_city is not None:
-        city = last_city
-
-    if city is None:
-        return ChatResponse(
-            reply="I couldn't detect any city. Please mention a city name like 'Bangalore'.",
-            city=None,
-        )
-
-    # remember city for next turn
-    weather_text = None
-    places: Optional[List[str]] = None
-
-    # Weather logic (same as in main.py, but without prints)
-    text = user_input.lower()
-    mode = None
-
-    if want_weather or (not want_weather and not want_places):
-        coords = get_coordinates(city)
-        if coords is None:
-            return ChatResponse(
-                reply=f"I couldn't find coordinates for {city}.",
-                city=city,
-            )
-
-        lat, lon = coords
-
-        if "tomorrow" in text:
-            mode = "tomorrow"
-        elif "next 7" in text or "next seven" in text or "next week" in text:
-            mode = "next7"
-        else:
-            from main import weekday_to_date
-            for day in ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]:
-                if day in text:
-                    mode = weekday_to_date(day)
-                    break
-
-        weather_text = get_weather(lat, lon, mode)
-
-    # Places logic
-    if want_places or (not want_weather and not want_places):
-        places = get_top_5_attractions(city, SERPAPI_KEY)
-
-    # Build final answer from LLM
-    reply = build_llm_response(
-        user_input=user_input,
-        city=city,
-        want_weather=want_weather,
-        want_places=want_places,
-        weather_text=weather_text,
-        places=places,
-    )
+async def chat_endpoint(body: ChatRequest):
+    # parse -> (geocode -> weather | places) -> reply, independent stages run concurrently;
+    # follow-ups about the session's city reuse its data
+    session_id, session = _session(body)
+    ctx = await run_session_chat_async(body.message, session, reply_mode=body.reply_mode)
 
     return ChatResponse(
-        reply=reply,
-        city=city,
+        reply=ctx["reply"],
+        city=ctx["intent"]["city"],
+        session_id=session_id,
     )
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(body: ChatRequest):
+    """
+    Streaming version of /chat (Server-Sent Events).
+
+    Events, in order:
+      - meta:  {"city", "weather", "places", "session_id"} as soon as the data is fetched
+      - token: {"text"} for each piece of the reply as it is generated
+      - done:  {"reply"} with the full reply
+      - error: {"detail"} if generation fails midway ("retry_after" too
+               when the LLM is overloaded)
+    """
+    session_id, session = _session(body)
+    ctx = await run_session_chat_async(body.message, session, DATA_STAGES, reply_mode=body.reply_mode)
+
+    async def events():
+        places = ctx.get("places")
+        offset = ctx.get("places_offset", 0)
+        yield _sse("meta", {
+            "city": ctx["intent"]["city"],
+            "weather": ctx.get("weather"),
+            "places": places[offset:offset + 5] if places else None,
+            "session_id": session_id,
+        })
+
+        reply = []
+        try:
+            async for piece in stream_reply_async(ctx):
+                reply.append(piece)
+                yield _sse("token", {"text": piece})
+        except LLMOverloaded as e:
+            yield _sse("error", {"detail": str(e), "retry_after": e.retry_after})
+            return
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+            return
+        yield _sse("done", {"reply": "".join(reply)})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.get("/stats")
+def stats_endpoint():
+    return {
+        "intent": parse_stats(),
+        "llm": llm_stats(),
+        "llm_queue": gate.stats(),
+        "prompts": prompt_stats(),
+        "reply_cache": reply_cache_stats(),
+        "singleflight": singleflight_stats(),
+        "rate_limits": rate_limit_stats(),
+        "refresh": refresh_stats(),
+        "sessions": session_count(),
+        "upstreams": resilience_stats(),
+    }
+
+
+@app.get("/metrics")
+def metrics_endpoint():
+    return PlainTextResponse(render_metrics(), media_type=CONTENT_TYPE)
@@ -0,0 +1,106 @@
+# sessions.py
+"""
+Server-side chat sessions.
+
+A session remembers what the last turns already fetched: the current city,
+its coordinates, the forecast payload and the places list (with how far the
+user has paged through it). A follow-up turn about the same city ("what
+about tomorrow?", "more places") is seeded with that data, so the pipeline
+skips geocoding, the forecast call and the SerpAPI search.
+
+Sessions live in process memory: at most SESSION_MAX of them (least
+recently used are dropped first), each expiring after SESSION_IDLE_TTL
+seconds without a turn. With several server workers, route a session to
+the same worker or it just starts over.
+"""
+import os
+import re
+import secrets
+import time
+
+from cache import MISSING, TTLCache
+from city_names import format_city_name
+from metrics import register_cache
+from weather import seconds_until_model_update
+
+SESSION_MAX = int(os.getenv("SESSION_MAX", 10000))
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", 1800))
+# places shown per turn
+PLACES_PAGE = 5
+
+_MORE_PLACES = re.compile(r"\bmore\s+(places|attractions|spots|sights)\b", re.I)
+
+_sessions = TTLCache(maxsize=SESSION_MAX, ttl=SESSION_IDLE_TTL)
+register_cache("session", _sessions)
+
+
+def get_session(session_id: str | None):
+    """(session_id, session dict); a new session when the id is unknown or expired."""
+    session = _sessions.get(session_id) if session_id else MISSING
+    if session is MISSING:
+        session_id, session = secrets.token_urlsafe(16), {}
+    # every turn restarts the idle timer
+    _sessions.set(session_id, session)
+    return session_id, session
+
+
+def session_count() -> int:
+    return len(_sessions)
+
+
+def wants_more_places(user_input: str) -> bool:
+    """True for follow-ups like "more places" or "show me more attractions"."""
+    return bool(_MORE_PLACES.search(user_input))
+
+
+def session_inputs(session: dict, intent: dict, user_input: str) -> dict:
+    """
+    Pipeline context values that can come from the session for this turn:
+    coords and forecast (while fresh) and places, if the city is unchanged.
+    """
+    city = intent["city"]
+    if not city or not session.get("city") or format_city_name(city) != session["city"]:
+        return {}
+
+    inputs = {}
+    if intent["fetch_weather"] and session.get("coords"):
+        inputs["coords"] = tuple(session["coords"])
+        if session.get("forecast") and time.time() < session["forecast_fresh_until"]:
+            inputs["forecast"] = {"data": session["forecast"]}
+
+    if intent["fetch_places"] and session.get("places") and session.get("places_tag") == intent.get("tag"):
+        inputs["places"] = session["places"]
+        offset = 0
+        if wants_more_places(user_input):
+            offset = session.get("places_offset", 0) + PLACES_PAGE
+            if offset >= len(session["places"]):
+                offset = 0  # start over
+        inputs["places_offset"] = offset
+
+    return inputs
+
+
+def update_session(session: dict, ctx: dict):
+    """Store what a turn resolved and fetched for the next turn."""
+    intent = ctx.get("intent") or {}
+    city = intent.get("city")
+    if not city:
+        return
+
+    city = format_city_name(city)
+    if city != session.get("city"):
+        session.clear()
+        session["city"] = city
+
+    if ctx.get("coords"):
+        session["coords"] = ctx["coords"]
+    forecast = ctx.get("forecast") or {}
+    if "data" in forecast and forecast["data"] is not session.get("forecast"):
+        session["forecast"] = forecast["data"]
+        session["forecast_fresh_until"] = time.time() + seconds_until_model_update()
+
+    places = ctx.get("places")
+    if places:
+        session["places"] = places
+        session["places_tag"] = intent.get("tag")
+        session["places_offset"] = ctx.get("places_offset", 0)
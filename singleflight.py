@@ -0,0 +1,96 @@
+# singleflight.py
+"""
+Single-flight coalescing for upstream calls.
+
+When several callers ask for the same key at the same time, only the first
+one runs the call; the others wait for it and share its result (or its
+exception). Used around the Nominatim, Open-Meteo and SerpAPI fetches so a
+trending city costs one upstream request instead of dozens.
+"""
+import asyncio
+import threading
+
+_groups = {}  # name -> SingleFlight
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """One coalescing group (e.g. "geocode"). Thread and asyncio safe."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> _Call (threads)
+        self._tasks = {}  # key -> asyncio.Task (event loop)
+        _groups[name] = self
+
+    def do(self, key, fn, *args):
+        """Run fn(*args) once for all concurrent callers with the same key."""
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def do_async(self, key, fn, *args):
+        """Async version of do: fn(*args) must return an awaitable."""
+        with self._lock:
+            self.calls += 1
+            task = self._tasks.get(key)
+            if task is None:
+                task = asyncio.ensure_future(fn(*args))
+                self._tasks[key] = task
+                task.add_done_callback(lambda t: self._forget(key, t))
+            else:
+                self.coalesced += 1
+
+        # shield: one cancelled caller must not cancel the call for the others
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        with self._lock:
+            self._tasks.pop(key, None)
+        # mark the error as seen even if every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls) + len(self._tasks),
+            }
+
+
+def singleflight_stats() -> dict:
+    """Stats of every group, by name."""
+    return {name: group.stats() for name, group in _groups.items()}
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# caches, rate-limit buckets and the gazetteer index go to a throwaway directory
+os.environ.setdefault("TRAVELAI_CACHE_DIR", tempfile.mkdtemp(prefix="travelai-tests-"))
+os.environ.setdefault("REFRESH_ENABLED", "0")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
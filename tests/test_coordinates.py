@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+import requests
+
+import coordinates
+from pipeline import city_intent, run_chat
+from resilience import CircuitOpen
+
+
+@pytest.fixture(params=[requests.ConnectionError("nominatim down"), CircuitOpen("nominatim", 30)])
+def nominatim_down(request, monkeypatch):
+    calls = []
+
+    def fetch(place_name):
+        calls.append(place_name)
+        raise request.param
+
+    monkeypatch.setattr(coordinates, "fetch_coordinates", fetch)
+    return calls
+
+
+def test_expired_cache_entry_is_used_while_nominatim_is_down(nominatim_down):
+    coordinates._geocode_cache.set("Old Town Road", [1.5, 2.5], ttl=-1)
+    assert coordinates.get_coordinates("Old Town Road") == (1.5, 2.5)
+    assert nominatim_down == ["Old Town Road"]
+
+
+def test_gazetteer_guess_is_used_while_nominatim_is_down(nominatim_down):
+    # the most populous Salem (Tamil Nadu), though its namesakes keep it off the strict lookup
+    assert coordinates.get_coordinates("Salem") == pytest.approx((11.65, 78.16), abs=0.05)
+    # the guess isn't cached: Nominatim is asked again next time
+    coordinates.get_coordinates("Salem")
+    assert nominatim_down == ["Salem", "Salem"]
+
+
+def test_unknown_city_is_not_found_while_nominatim_is_down(nominatim_down):
+    assert coordinates.get_coordinates("Blorpville") is None
+    intent = city_intent("Blorpville", weather=True)
+    ctx = run_chat("weather in Blorpville", intent=intent, reply_mode="template")
+    assert ctx["reply"] == "I couldn't find coordinates for Blorpville."
+
+
+def test_async_lookup_can_skip_the_hot_counts(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(coordinates, "record_city", recorded.append)
+    assert asyncio.run(coordinates.get_coordinates_async("Paris", record=False)) is not None
+    assert recorded == []
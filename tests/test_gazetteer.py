@@ -0,0 +1,53 @@
+import pytest
+
+import coordinates
+from gazetteer import lookup_coordinates
+from intent import KNOWN_CITIES
+
+NOMINATIM = (1.0, 2.0)  # stands in for Nominatim's answer
+
+
+@pytest.fixture
+def nominatim(monkeypatch):
+    calls = []
+
+    def fetch(place_name):
+        calls.append(place_name)
+        return NOMINATIM
+
+    monkeypatch.setattr(coordinates, "fetch_coordinates", fetch)
+    return calls
+
+
+@pytest.mark.parametrize("name", ["Springfield", "Salem", "Bali", "Victoria"])
+def test_ambiguous_names_go_to_nominatim(name, nominatim):
+    assert lookup_coordinates(name) is None
+    assert coordinates.get_coordinates(name) == NOMINATIM
+    assert nominatim == [name]
+
+
+@pytest.mark.parametrize("name, lat, lon", [
+    ("Paris", 48.85, 2.35),
+    ("London", 51.51, -0.13),
+    ("Bangalore", 12.97, 77.59),
+])
+def test_unambiguous_cities_are_answered_offline(name, lat, lon, nominatim):
+    coords = coordinates.get_coordinates(name)
+    assert coords == pytest.approx((lat, lon), abs=0.05)
+    assert nominatim == []
+
+
+def test_every_known_city_resolves_offline():
+    missing = [city for city in KNOWN_CITIES if lookup_coordinates(city) is None]
+    assert missing == []
+
+
+@pytest.mark.parametrize("name, lat, lon", [
+    ("Goa", 15.49, 73.83),
+    ("Manali", 32.24, 77.19),
+    ("Hyderabad", 17.38, 78.46),
+    ("San Francisco", 37.77, -122.42),
+])
+def test_pinned_cities_skip_their_namesakes(name, lat, lon, nominatim):
+    assert coordinates.get_coordinates(name) == pytest.approx((lat, lon), abs=0.05)
+    assert nominatim == []
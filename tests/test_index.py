@@ -0,0 +1,73 @@
+import http.client
+import threading
+import time
+
+import pytest
+
+import index
+
+
+@pytest.fixture
+def server():
+    srv = index.BoundedHTTPServer(("127.0.0.1", 0), index.handler, workers=2)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def _connect(srv):
+    return http.client.HTTPConnection(*srv.server_address, timeout=5)
+
+
+def test_idle_keep_alive_connections_do_not_starve_new_clients(server, monkeypatch):
+    monkeypatch.setenv("INDEX_ACCESS_LOG", "0")
+    idle = []
+    for _ in range(4):  # twice the request slots
+        conn = _connect(server)
+        conn.request("GET", "/api/cities?prefix=par")
+        conn.getresponse().read()
+        idle.append(conn)  # kept open, idle
+
+    conn = _connect(server)
+    started = time.monotonic()
+    conn.request("GET", "/api/cities?prefix=lon")
+    response = conn.getresponse()
+    response.read()
+    assert response.status == 200
+    assert time.monotonic() - started < 1
+
+    for c in idle + [conn]:
+        c.close()
+
+
+def test_head_has_headers_but_no_body(server, monkeypatch):
+    monkeypatch.setenv("INDEX_ACCESS_LOG", "0")
+    conn = _connect(server)
+    conn.request("HEAD", "/api/cities?prefix=par")
+    response = conn.getresponse()
+    assert response.status == 200
+    assert int(response.getheader("Content-Length")) > 0
+    assert response.read() == b""
+    conn.close()
+
+
+def test_unexpected_errors_get_a_500_response(server, monkeypatch):
+    monkeypatch.setenv("INDEX_ACCESS_LOG", "0")
+
+    def fail(city, api_key, tag):
+        raise ValueError("API key is required")
+
+    monkeypatch.setattr(index, "run_places", fail)
+    conn = _connect(server)
+    conn.request("GET", "/api/places?city=Paris")
+    response = conn.getresponse()
+    assert response.status == 500
+    assert b"Internal server error" in response.read()
+
+    # the keep-alive connection still works
+    conn.request("GET", "/api/cities?prefix=par")
+    response = conn.getresponse()
+    response.read()
+    assert response.status == 200
+    conn.close()
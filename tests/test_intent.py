@@ -0,0 +1,51 @@
+import intent
+
+
+def test_learn_city_rejects_everyday_words():
+    intent.learn_city("There", "Hello There friend")
+    assert "there" not in intent._known
+
+    city, _, _, _ = intent.fast_parse("what is the weather there", last_city="Paris")
+    assert city == "Paris"
+
+
+def test_learn_city_rejects_unknown_places():
+    intent.learn_city("Blorpville", "weather in Blorpville")
+    assert "blorpville" not in intent._known
+
+
+def test_learn_city_learns_real_cities():
+    intent.learn_city("Porto Alegre", "places to visit in Porto Alegre")
+    assert intent._known["porto alegre"] == "Porto Alegre"
+    assert intent._longest_name >= 2
+    assert intent.find_cities("trip to porto alegre") == ["Porto Alegre"]
+
+
+def test_learn_city_is_capped(monkeypatch):
+    monkeypatch.setattr(intent, "INTENT_LEARNED_CITIES_MAX", intent._learned)
+    intent.learn_city("Nagoya", "weather in Nagoya")
+    assert "nagoya" not in intent._known
+
+
+def test_malformed_llm_parse_is_not_memoized(monkeypatch):
+    import app
+
+    message = "hmm, thinking about somewhere warm"
+    monkeypatch.setattr(app.llm, "chat", lambda *args, **kwargs: "Sure! The city is")
+    assert app.parse_input(message, "Paris") == ("Paris", False, False)
+    assert intent.cached_intent(message, "Paris") is None
+
+    monkeypatch.setattr(app.llm, "chat", lambda *args, **kwargs: '{"city": null, "want_weather": true}')
+    assert app.parse_input(message, "Paris") == (None, True, False)
+    assert intent.cached_intent(message, "Paris") == (None, True, False)
+
+
+def test_memoized_intents_expire(monkeypatch):
+    import cache
+
+    intent.remember_intent("weather in rome", None, ("Rome", True, False))
+    assert intent.cached_intent("weather in rome", None) == ("Rome", True, False)
+
+    later = cache.time.time() + intent.INTENT_CACHE_TTL + 1
+    monkeypatch.setattr(cache.time, "time", lambda: later)
+    assert intent.cached_intent("weather in rome", None) is None
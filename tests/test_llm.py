@@ -0,0 +1,76 @@
+import threading
+import time
+
+import pytest
+
+from llm import AdmissionGate, LLMOverloaded
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def _hold(gate, release, entered=None):
+    def run():
+        with gate.slot():
+            if entered is not None:
+                entered.append(threading.current_thread().name)
+            release.wait(5)
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_full_queue_is_rejected_with_retry_after():
+    gate = AdmissionGate(capacity=1, max_queue=1, max_wait=5)
+    release = threading.Event()
+    holder = _hold(gate, release)
+    _wait_for(lambda: gate._active == 1)
+    waiter = _hold(gate, release)
+    _wait_for(lambda: len(gate._waiters) == 1)
+
+    with pytest.raises(LLMOverloaded) as e:
+        with gate.slot():
+            pass
+    assert e.value.retry_after >= 1
+    assert gate._rejected == 1
+
+    release.set()
+    holder.join()
+    waiter.join()
+    assert gate._active == 0 and gate._admitted == 2
+
+
+def test_wait_for_a_slot_times_out():
+    gate = AdmissionGate(capacity=1, max_queue=4, max_wait=0.05)
+    release = threading.Event()
+    holder = _hold(gate, release)
+    _wait_for(lambda: gate._active == 1)
+
+    with pytest.raises(LLMOverloaded) as e:
+        with gate.slot():
+            pass
+    assert e.value.retry_after >= 1
+    assert gate._timed_out == 1 and not gate._waiters
+
+    release.set()
+    holder.join()
+
+
+def test_freed_slots_go_to_waiters_in_order():
+    gate = AdmissionGate(capacity=1, max_queue=4, max_wait=5)
+    release = threading.Event()
+    entered = []
+    threads = [_hold(gate, release, entered)]
+    _wait_for(lambda: gate._active == 1)
+    for n in range(3):
+        threads.append(_hold(gate, release, entered))
+        _wait_for(lambda: len(gate._waiters) == n + 1)
+
+    release.set()
+    for t in threads:
+        t.join()
+    assert entered == [t.name for t in threads]
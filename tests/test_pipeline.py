@@ -0,0 +1,48 @@
+import pytest
+
+import pipeline
+
+
+@pytest.fixture
+def upstreams(monkeypatch):
+    """Stub geocoding ("Bad*" names fail, "Nowhere" is not found) and forecasts."""
+    looked_up = []
+
+    def geocode(city):
+        looked_up.append(city)
+        if city.startswith("Bad"):
+            raise RuntimeError("geocoder broke")
+        return None if city == "Nowhere" else (10.0 + len(looked_up), 20.0)
+
+    monkeypatch.setattr(pipeline, "get_coordinates", geocode)
+    monkeypatch.setattr(pipeline, "get_weather_many", lambda coords, mode: [f"sunny at {c}" for c in coords])
+    return looked_up
+
+
+def test_one_failed_city_does_not_fail_the_batch(upstreams):
+    results = pipeline.run_weather_many(["Ootaa", "Badtown", "Nowhere"])
+
+    assert results[0]["weather"].startswith("sunny") and results[0]["error"] is None
+    assert results[1]["coords"] is None and results[1]["error"]
+    assert results[2]["coords"] is None and results[2]["error"] is None
+
+
+def test_nominatim_lookups_per_request_are_capped(upstreams, monkeypatch):
+    monkeypatch.setattr(pipeline, "MAX_GEOCODE_LOOKUPS", 2)
+    # Paris is answered offline, so it doesn't count towards the cap
+    cities = ["Paris", "Xanadu One", "Xanadu Two", "Xanadu Three"]
+    results = pipeline.run_weather_many(cities)
+
+    assert sorted(upstreams) == ["Paris", "Xanadu One", "Xanadu Two"]
+    assert [r["error"] is None for r in results] == [True, True, True, False]
+
+
+@pytest.mark.parametrize("by, limit, filters", [
+    ("hottest", 10, {}),
+    ("best", 0, {}),
+    ("best", 10, {"max_wind": 5.0}),
+])
+def test_bad_rank_arguments_fail_before_any_lookup(upstreams, by, limit, filters):
+    with pytest.raises(ValueError):
+        pipeline.rank_cities(["Xanadu"], "2026-10-20", by, limit, **filters)
+    assert upstreams == []
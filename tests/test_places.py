@@ -0,0 +1,54 @@
+import pytest
+import requests
+
+import places
+from pipeline import run_chat
+
+SECRET = "sk-test-secret"
+
+
+class _FailingSession:
+    """Stands in for http_session(): every SerpAPI call gets a 401 whose message has the full URL."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def get(self, url, params=None, timeout=None):
+        self.calls += 1
+        response = requests.Response()
+        response.status_code = 401
+        response.url = requests.Request("GET", url, params=params).prepare().url
+        response.reason = "Unauthorized"
+        return response
+
+
+@pytest.fixture
+def serpapi_down(monkeypatch):
+    session = _FailingSession()
+    monkeypatch.setattr(places, "http_session", lambda: session)
+    monkeypatch.setattr(places, "serpapi_limiter", None)
+    return session
+
+
+def test_failed_search_returns_no_places_and_caches_nothing(serpapi_down):
+    assert places.get_top_50_attractions("Atlantis", SECRET, "museum") == []
+    assert places.get_top_50_attractions("Atlantis", SECRET, "museum") == []
+    assert serpapi_down.calls == 2
+
+
+def test_failed_page_is_empty(serpapi_down):
+    page = places.get_places_page("Atlantis", SECRET, "park", 0, 5)
+    assert page == {"places": [], "offset": 0, "limit": 5, "next_offset": None}
+
+
+def test_search_error_hides_the_api_key(serpapi_down):
+    with pytest.raises(places.PlacesError) as e:
+        places.search_places_page("Atlantis", SECRET, "zoo")
+    assert SECRET not in str(e.value)
+    assert "401" in str(e.value)
+
+
+def test_chat_reply_never_contains_the_api_key(serpapi_down):
+    ctx = run_chat("places to visit in Paris", serpapi_key=SECRET, reply_mode="template")
+    assert SECRET not in ctx["reply"]
+    assert ctx["places"] == []
@@ -0,0 +1,67 @@
+import threading
+import time
+
+import pytest
+
+import ratelimit
+from ratelimit import RateLimited, RateLimiter, background_priority
+
+
+def test_bucket_paces_callers_at_the_rate(tmp_path):
+    limiter = RateLimiter("test-pace", rate=20, burst=1, path=str(tmp_path / "bucket"))
+
+    started = time.monotonic()
+    for _ in range(6):
+        limiter.acquire()
+
+    # the first token is free, the next five come 50 ms apart
+    assert time.monotonic() - started >= 0.24
+    assert limiter.delayed == 5
+
+
+def test_bucket_is_shared_through_the_lock_file(tmp_path):
+    # two limiters on one file stand in for two worker processes
+    path = str(tmp_path / "bucket")
+    a = RateLimiter("test-shared-a", rate=20, burst=1, path=path)
+    b = RateLimiter("test-shared-b", rate=20, burst=1, path=path)
+
+    started = time.monotonic()
+    for limiter in (a, b, a, b):
+        limiter.acquire()
+
+    assert time.monotonic() - started >= 0.14
+    assert a.delayed + b.delayed == 3
+
+
+def test_wait_longer_than_the_max_is_rejected(tmp_path, monkeypatch):
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_MAX_WAIT", 0.1)
+    limiter = RateLimiter("test-reject", rate=1, burst=1, path=str(tmp_path / "bucket"))
+
+    limiter.acquire()
+    with pytest.raises(RateLimited):
+        limiter.acquire()
+    assert limiter.rejected == 1
+
+
+def test_background_calls_yield_to_interactive_ones(tmp_path):
+    limiter = RateLimiter("test-priority", rate=10, burst=1, path=str(tmp_path / "bucket"))
+    limiter.acquire()  # empty the bucket
+    finished = []
+
+    def interactive():
+        limiter.acquire()
+        finished.append("interactive")
+
+    def background():
+        with background_priority():
+            limiter.acquire()
+        finished.append("background")
+
+    threads = [threading.Thread(target=background), threading.Thread(target=interactive)]
+    threads[0].start()
+    time.sleep(0.02)  # the background caller is already waiting for the next token
+    threads[1].start()
+    for t in threads:
+        t.join()
+
+    assert finished == ["interactive", "background"]
@@ -0,0 +1,16 @@
+import refresh
+
+
+def test_warming_does_not_count_as_demand(monkeypatch):
+    hot_cities, hot_places = refresh.HotKeys(), refresh.HotKeys()
+    monkeypatch.setattr(refresh, "hot_cities", hot_cities)
+    monkeypatch.setattr(refresh, "hot_places", hot_places)
+    import pipeline
+    monkeypatch.setattr(pipeline, "get_forecast", lambda lat, lon: None)
+    monkeypatch.setattr(pipeline, "_name_cell", lambda city, coords: None)
+
+    pipeline.get_coordinates("Lyon")  # a user request
+    for _ in range(3):
+        refresh.warm(pipeline.warm_city, lambda city, tag: None, ["Paris"])
+
+    assert hot_cities.top(10) == ["Lyon"]
@@ -0,0 +1,37 @@
+from replies import render_reply
+
+RANGE = {
+    "kind": "range",
+    "days": [
+        {"date": "2026-10-19", "min": 14.0, "max": 22.0, "rain": 10},
+        {"date": "2026-10-20", "min": 15.0, "max": 23.0, "rain": 7},
+    ],
+}
+CURRENT = {"kind": "current", "temperature": 24.0, "wind": 5.0, "rain": 35}
+
+
+def test_range_forecast_with_places_starts_places_on_a_new_line():
+    reply = render_reply("goa weather next week and places", "Goa", True, True, RANGE, ["Baga Beach"], variant=1)
+    lines = reply.split("\n")
+    assert lines[-3].endswith("7% chance of rain")
+    assert lines[-2] == "And here are some places you can visit:"
+    assert lines[-1] == "- Baga Beach"
+
+
+def test_current_weather_with_places_stays_one_sentence():
+    reply = render_reply("goa weather and places", "Goa", True, True, CURRENT, ["Baga Beach"], variant=0)
+    assert reply.split("\n")[0] == (
+        "In Goa it's currently 24.0°C with a chance of 35% to rain. And these are the places you can go:"
+    )
+
+
+def test_places_errors_are_not_listed_as_places():
+    reply = render_reply("places in goa", "Goa", False, True, None, ["Error fetching data: 401 for url"])
+    assert reply == "I couldn't find places to visit in Goa."
+
+
+def test_weather_with_no_places_says_so():
+    reply = render_reply("goa weather and places", "Goa", True, True, CURRENT, [], variant=0)
+    assert reply == (
+        "In Goa it's currently 24.0°C with a chance of 35% to rain. I couldn't find places to visit in Goa."
+    )
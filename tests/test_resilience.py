@@ -0,0 +1,104 @@
+import threading
+import time
+
+import pytest
+
+import ratelimit
+import resilience
+from ratelimit import RateLimiter
+
+
+def _hammer(name, limiter, calls=12, deadline=None):
+    """`calls` concurrent guarded calls whose upstream always succeeds; returns the errors."""
+    errors = []
+
+    def call():
+        if deadline is not None:
+            resilience.start_deadline(deadline)
+        try:
+            resilience.guarded_call(name, lambda timeout: "ok", 5, limiter)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(calls)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return errors
+
+
+def test_rate_limit_rejections_leave_the_breaker_closed(tmp_path, monkeypatch):
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_MAX_WAIT", 0.1)
+    limiter = RateLimiter("test-rejected", 1, 1, path=str(tmp_path / "bucket"))
+
+    errors = _hammer("test-rejected", limiter)
+
+    assert len(errors) >= resilience.BREAKER_FAILURES
+    assert all(isinstance(e, ratelimit.RateLimited) for e in errors)
+    assert resilience.upstream("test-rejected").breaker.state == resilience.CLOSED
+    assert resilience.guarded_call("test-rejected", lambda timeout: "ok", 5) == "ok"
+
+
+def test_deadline_rejections_leave_the_breaker_closed(tmp_path):
+    limiter = RateLimiter("test-deadline", 1, 1, path=str(tmp_path / "bucket"))
+
+    errors = _hammer("test-deadline", limiter, deadline=0.5)
+
+    assert len(errors) >= resilience.BREAKER_FAILURES
+    assert all(isinstance(e, resilience.DeadlineExceeded) for e in errors)
+    assert resilience.upstream("test-deadline").breaker.state == resilience.CLOSED
+
+
+def test_upstream_failures_open_the_breaker():
+    def fail(timeout):
+        raise ConnectionError("down")
+
+    for _ in range(resilience.BREAKER_FAILURES):
+        with pytest.raises(ConnectionError):
+            resilience.guarded_call("test-down", fail, 5)
+
+    with pytest.raises(resilience.CircuitOpen):
+        resilience.guarded_call("test-down", lambda timeout: "ok", 5)
+
+
+def _hedging_upstream(name):
+    up = resilience.upstream(name)
+    up.hedge = True
+    for _ in range(resilience.HEDGE_MIN_SAMPLES):
+        up.observe(0.001)  # p95 below HEDGE_MIN_DELAY: hedge after 50 ms
+    return up
+
+
+def test_first_attempt_runs_in_the_callers_thread():
+    up = _hedging_upstream("test-hedge-thread")
+    up._hedge_tokens = 5
+    threads = []
+
+    def attempt(timeout):
+        threads.append(threading.current_thread())
+        if len(threads) == 1:
+            time.sleep(0.2)
+            raise ConnectionError("stuck")
+        return "hedged"
+
+    assert resilience.guarded_call("test-hedge-thread", attempt, 5) == "hedged"
+    assert threads[0] is threading.current_thread()
+    assert threads[1] is not threading.current_thread()
+    assert up.hedges == 1 and up.hedge_wins == 1
+
+
+def test_hedges_stay_within_the_budget(monkeypatch):
+    up = _hedging_upstream("test-hedge-budget")
+    monkeypatch.setattr(up, "p95", lambda: 0.001)  # every call is slow enough to hedge
+
+    def slow(timeout):
+        time.sleep(0.07)
+        return "ok"
+
+    calls = 40
+    for _ in range(calls):
+        assert resilience.guarded_call("test-hedge-budget", slow, 5) == "ok"
+
+    assert 1 <= up.hedges <= calls * resilience.HEDGE_BUDGET
+    assert up.hedges + up.hedges_skipped == calls
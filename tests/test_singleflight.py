@@ -0,0 +1,73 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_concurrent_callers_share_one_call_and_its_exception():
+    group = SingleFlight("test-shared-error")
+    release = threading.Event()
+    calls = []
+    errors = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        raise ConnectionError("upstream down")
+
+    def call():
+        try:
+            group.do("goa", fetch)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(8)]
+    for t in threads:
+        t.start()
+    _wait_for(lambda: group.calls == 8)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert len(errors) == 8
+    assert all(e is errors[0] and isinstance(e, ConnectionError) for e in errors)
+    assert group.stats() == {"calls": 8, "coalesced": 7, "in_flight": 0}
+
+
+def test_next_call_after_a_failure_runs_again():
+    group = SingleFlight("test-retry")
+
+    def fail():
+        raise ValueError("bad")
+
+    with pytest.raises(ValueError):
+        group.do("k", fail)
+    assert group.do("k", lambda: "ok") == "ok"
+
+
+def test_async_callers_share_one_call():
+    group = SingleFlight("test-async")
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"lat": 1.0}
+
+    async def main():
+        return await asyncio.gather(*(group.do_async("goa", fetch) for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert all(r is results[0] for r in results)
@@ -16,8 +16,35 @@
 #     return f"Current temp: {current['temperature']}°C, Wind: {current['windspeed']} km/h"
 # -------------------------------------------------------------------------------------------
 
-import requests
-from datetime import datetime, timedelta
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from cache import MISSING, TTLCache
+from forecast_store import store as forecast_store
+from http_clients import async_client, http_session
+from metrics import register_cache
+from refresh import refresh_in_background
+from resilience import guarded_call, guarded_call_async
+from singleflight import SingleFlight
+
+OPEN_METEO_URL = os.getenv("OPEN_METEO_URL", "https://api.open-meteo.com/v1/forecast")
+# longest a single Open-Meteo request may take (less when the request deadline is closer)
+OPEN_METEO_TIMEOUT = float(os.getenv("OPEN_METEO_TIMEOUT", 10))
+
+# forecasts are cached per grid cell (degrees); 0.1 is roughly 11 km
+FORECAST_GRID = float(os.getenv("FORECAST_GRID", 0.1))
+# Open-Meteo refreshes its models about once an hour
+FORECAST_UPDATE_INTERVAL = int(os.getenv("FORECAST_UPDATE_INTERVAL", 3600))
+# stale forecasts are served for this long after a model update while they refresh
+FORECAST_STALE_TTL = int(os.getenv("FORECAST_STALE_TTL", 3600))
+# most grid cells fetched in one multi-location request
+FORECAST_BATCH_SIZE = int(os.getenv("FORECAST_BATCH_SIZE", 50))
+
+_forecast_cache = TTLCache(maxsize=int(os.getenv("FORECAST_CACHE_SIZE", 4096)))
+_forecast_flight = SingleFlight("forecast")
+register_cache("forecast", _forecast_cache)
+
 
 def get_weather(lat, lon, mode=None):
     """
@@ -29,8 +56,144 @@ def get_weather(lat, lon, mode=None):
       - "next7"     -> next 7 days forecast
       - "YYYY-MM-DD" (string) -> specific date forecast
     """
-    url = "https://api.open-meteo.com/v1/forecast"
-    params = {
+    try:
+        data = get_forecast(lat, lon)
+    except Exception as e:
+        return f"Weather service error: {e}"
+
+    return format_weather(data, mode)
+
+
+async def get_weather_async(lat, lon, mode=None):
+    """Async version of get_weather (same cache)."""
+    try:
+        data = await get_forecast_async(lat, lon)
+    except Exception as e:
+        return f"Weather service error: {e}"
+
+    return format_weather(data, mode)
+
+
+def get_weather_many(coords_list, mode=None):
+    """
+    Batched get_weather: one weather string per (lat, lon) in coords_list.
+
+    Missing forecasts are fetched with a single multi-location Open-Meteo
+    request instead of one request per place.
+    """
+    try:
+        payloads = get_forecasts(coords_list)
+    except Exception as e:
+        return [f"Weather service error: {e}" for _ in coords_list]
+
+    return [format_weather(data, mode) for data in payloads]
+
+
+def grid_cell(lat, lon):
+    """Round coordinates to the forecast grid cell they fall in."""
+    return (
+        round(round(float(lat) / FORECAST_GRID) * FORECAST_GRID, 4),
+        round(round(float(lon) / FORECAST_GRID) * FORECAST_GRID, 4),
+    )
+
+
+def local_date(data) -> str:
+    """Today's date (YYYY-MM-DD) in the timezone of an Open-Meteo payload."""
+    offset = timedelta(seconds=data.get("utc_offset_seconds", 0))
+    return (datetime.now(timezone.utc) + offset).strftime("%Y-%m-%d")
+
+
+def seconds_until_model_update() -> float:
+    """Seconds until the next Open-Meteo model update (at least a minute)."""
+    return max(60, FORECAST_UPDATE_INTERVAL - time.time() % FORECAST_UPDATE_INTERVAL)
+
+
+def get_forecast(lat, lon):
+    """
+    Return the raw Open-Meteo payload (current weather + 7-day daily forecast)
+    for the grid cell around (lat, lon).
+
+    One payload answers every mode of get_weather, so it is cached per grid
+    cell for the local forecast date until the next model update. After
+    that the old payload is still served (up to FORECAST_STALE_TTL) while
+    a background refresh fetches the new one.
+    Raises on upstream errors (errors are not cached).
+    """
+    cell = grid_cell(lat, lon)
+
+    data = _cached_forecast(cell)
+    if data is None:
+        data = _forecast_flight.do(cell, fetch_forecast, *cell)
+        _store_forecast(cell, data)
+    return data
+
+
+async def get_forecast_async(lat, lon):
+    """Async version of get_forecast (same cache)."""
+    cell = grid_cell(lat, lon)
+
+    data = _cached_forecast(cell)
+    if data is None:
+        data = await _forecast_flight.do_async(cell, fetch_forecast_async, *cell)
+        _store_forecast(cell, data)
+    return data
+
+
+def get_forecasts(coords_list):
+    """
+    Batched get_forecast: one payload per (lat, lon) in coords_list.
+
+    Cached grid cells are served from the cache; the rest are fetched
+    together (FORECAST_BATCH_SIZE cells per request) and cached one by one,
+    so later single-city lookups hit the cache too.
+    """
+    cells = [grid_cell(lat, lon) for lat, lon in coords_list]
+
+    found = {}
+    for cell in cells:
+        data = _cached_forecast(cell)
+        if data is not None:
+            found[cell] = data
+
+    missing = list(dict.fromkeys(cell for cell in cells if cell not in found))
+    for start in range(0, len(missing), FORECAST_BATCH_SIZE):
+        batch = missing[start:start + FORECAST_BATCH_SIZE]
+        for cell, data in zip(batch, fetch_forecasts(batch)):
+            _store_forecast(cell, data)
+            found[cell] = data
+
+    return [found[cell] for cell in cells]
+
+
+def _cached_forecast(cell):
+    entry = _forecast_cache.get(cell)
+    if entry is MISSING or entry["date"] != local_date(entry["data"]):
+        return None
+    if time.time() >= entry.get("fresh_until", float("inf")):
+        # stale: answer now, refresh for the next caller
+        refresh_in_background(("forecast", cell), refresh_forecast, cell)
+    return entry["data"]
+
+
+def _store_forecast(cell, data):
+    fresh_for = seconds_until_model_update()
+    _forecast_cache.set(
+        cell,
+        {"date": local_date(data), "data": data, "fresh_until": time.time() + fresh_for},
+        ttl=fresh_for + FORECAST_STALE_TTL,
+    )
+    # columnar copy for multi-city rankings
+    forecast_store.update(cell, data)
+
+
+def refresh_forecast(cell):
+    """Refetch and cache the forecast for a grid cell (background refresh)."""
+    data = _forecast_flight.do(cell, fetch_forecast, *cell)
+    _store_forecast(cell, data)
+
+
+def _forecast_params(lat, lon):
+    return {
         "latitude": lat,
         "longitude": lon,
         "current_weather": True,
@@ -39,13 +202,55 @@ def get_weather(lat, lon, mode=None):
         "timezone": "auto",
     }
 
-    try:
-        response = requests.get(url, params=params, timeout=10)
+
+def fetch_forecast(lat, lon):
+    """Fetch the forecast payload from Open-Meteo (no cache)."""
+    return _fetch_json(_forecast_params(lat, lon))
+
+
+async def fetch_forecast_async(lat, lon):
+    """Async version of fetch_forecast."""
+    async def attempt(timeout):
+        response = await async_client(OPEN_METEO_URL).get(
+            OPEN_METEO_URL, params=_forecast_params(lat, lon), timeout=timeout
+        )
         response.raise_for_status()
-        data = response.json()
-    except Exception as e:
-        return f"Weather service error: {e}"
+        return response.json()
+
+    return await guarded_call_async("open_meteo", attempt, OPEN_METEO_TIMEOUT)
+
+
+def _fetch_json(params):
+    def attempt(timeout):
+        response = http_session().get(OPEN_METEO_URL, params=params, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+
+    return guarded_call("open_meteo", attempt, OPEN_METEO_TIMEOUT)
+
+
+def fetch_forecasts(coords_list):
+    """
+    Fetch forecast payloads for many places in one Open-Meteo request
+    (comma-separated latitude/longitude lists). No cache.
+    """
+    if len(coords_list) == 1:
+        return [fetch_forecast(*coords_list[0])]
+
+    params = _forecast_params(
+        ",".join(str(lat) for lat, _ in coords_list),
+        ",".join(str(lon) for _, lon in coords_list),
+    )
+    data = _fetch_json(params)
 
+    # a multi-location request answers with one payload per location, in order
+    if not isinstance(data, list) or len(data) != len(coords_list):
+        raise ValueError("unexpected multi-location forecast response")
+    return data
+
+
+def format_weather(data, mode=None):
+    """Format one mode (see get_weather) from an Open-Meteo payload."""
     # ---------- CURRENT WEATHER ----------
     if mode is None:
         if "current_weather" in data:
@@ -107,3 +312,53 @@ def get_weather(lat, lon, mode=None):
         )
 
     return "Invalid input. Use: None, 'tomorrow', 'next7', or 'YYYY-MM-DD'."
+
+
+def weather_facts(data, mode=None):
+    """
+    Structured version of format_weather for the reply templates.
+
+    Returns None if the data is missing, else a dict with "kind":
+      - "current": temperature, wind, rain (today's rain chance or None)
+      - "day":     date, max, min, rain (and label "tomorrow" for tomorrow)
+      - "range":   days -> list of {date, max, min, rain}
+    """
+    daily = data.get("daily") or {}
+    dates = daily.get("time", [])
+    max_temp = daily.get("temperature_2m_max", [])
+    min_temp = daily.get("temperature_2m_min", [])
+    rain_prob = daily.get("precipitation_probability_mean", [])
+    complete = dates and len(dates) == len(max_temp) == len(min_temp) == len(rain_prob)
+
+    def day(i):
+        return {"date": dates[i], "max": max_temp[i], "min": min_temp[i], "rain": rain_prob[i]}
+
+    if mode is None:
+        current = data.get("current_weather")
+        if not current:
+            return None
+        today = local_date(data)
+        rain = rain_prob[dates.index(today)] if complete and today in dates else None
+        return {
+            "kind": "current",
+            "temperature": current["temperature"],
+            "wind": current["windspeed"],
+            "rain": rain,
+        }
+
+    if not complete:
+        return None
+
+    if isinstance(mode, str) and mode.lower() == "tomorrow":
+        tomorrow = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+        if tomorrow not in dates:
+            return None
+        return {"kind": "day", "label": "tomorrow", **day(dates.index(tomorrow))}
+
+    if isinstance(mode, str) and mode.lower() == "next7":
+        return {"kind": "range", "days": [day(i) for i in range(len(dates))]}
+
+    if mode in dates:
+        return {"kind": "day", "label": None, **day(dates.index(mode))}
+
+    return None